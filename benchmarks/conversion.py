@@ -0,0 +1,257 @@
+"""Benchmark of the load and save of every converter/format pair.
+
+Usage (from the repository root):
+    python -m benchmarks.conversion --sizes 1000 10000 --output results.json
+    python -m benchmarks.conversion --sizes 1000 10000 --compare results.json
+"""
+
+import argparse
+import importlib.metadata
+import json
+import platform
+import subprocess
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from bookmarks_converter.converters import CONVERTERS
+from bookmarks_converter.formats import FORMATS
+from bookmarks_converter.guid import guids
+from bookmarks_converter.models import Folder, SpecialFolder, Url
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# (urls and folders per folder, subfolders per folder, maximum depth)
+SHAPES = {
+    "wide": (None, 0, 1),
+    "balanced": (20, 4, 32),
+    "deep": (5, 1, 64),
+}
+DATE = 1719774198000000
+
+
+def build_tree(size: int, width: int | None, subfolders: int, depth: int) -> Folder:
+    """Build a synthetic Bookmark tree of `size` bookmarks (urls and folders), located in the
+    toolbar and other special folders, which are exported by all the converters.
+
+    size: int
+        number of bookmarks in the tree, not counting the special folders.
+    width: int | None
+        number of children of each folder, None puts all the bookmarks in the special folders.
+    subfolders: int
+        number of folders amongst the children of each folder.
+    depth: int
+        maximum depth of the folders below the special folders.
+    """
+    ids = iter(range(1, size + 10))
+    root = _folder(next(ids), 0, "root", SpecialFolder.ROOT)
+    for index, special_folder in enumerate(
+        (SpecialFolder.MENU, SpecialFolder.TOOLBAR, SpecialFolder.OTHER, SpecialFolder.MOBILE)
+    ):
+        root.children.append(_folder(next(ids), index, special_folder.value, special_folder))
+    containers = [(root.children[1], 1), (root.children[2], 1)]
+    width = width or -(-size // len(containers))
+
+    queue = deque()
+    count = 0
+    while count < size:
+        if not queue:
+            queue.extend(containers)
+        folder, level = queue.popleft()
+        for index in range(len(folder.children), len(folder.children) + width):
+            if count >= size:
+                break
+            id_ = next(ids)
+            if index % width < subfolders and level < depth:
+                child = _folder(id_, index, f"Folder {id_}")
+                queue.append((child, level + 1))
+            else:
+                child = Url(
+                    id=id_,
+                    guid=guids.uuid(),
+                    index=index,
+                    title=f"Bookmark {id_}",
+                    date_added=DATE,
+                    date_modified=DATE,
+                    url=f"https://www.example.com/{id_}",
+                )
+            folder.children.append(child)
+            count += 1
+    return root
+
+
+def _folder(
+    id_: int, index: int, title: str, special_folder: SpecialFolder | None = None
+) -> Folder:
+    return Folder(
+        id=id_,
+        guid=guids.uuid(),
+        index=index,
+        title=title,
+        date_added=DATE,
+        date_modified=DATE,
+        special_folder=special_folder,
+    )
+
+
+def _best_time(function, repeat: int) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _result(
+    name: str, format_: str, shape: str, size: int, stage: str, seconds: float, bytes_: int
+) -> dict:
+    return {
+        "converter": name,
+        "format": format_,
+        "shape": shape,
+        "size": size,
+        "stage": stage,
+        "seconds": seconds,
+        "bytes": bytes_,
+        "nodes_per_second": size / seconds if seconds else None,
+        "mb_per_second": bytes_ / 1024 / 1024 / seconds if seconds else None,
+    }
+
+
+def run(
+    sizes=SIZES, shapes=tuple(SHAPES), converters=tuple(CONVERTERS), repeat: int = 1
+) -> list[dict]:
+    """Time the save and load of each converter/format pair for each size and shape."""
+    results = []
+    with TemporaryDirectory() as tmpdir:
+        for shape in shapes:
+            for size in sizes:
+                tree = build_tree(size, *SHAPES[shape])
+                for name in converters:
+                    converter = CONVERTERS[name]()
+                    for format_ in converter.formats:
+                        filepath = Path(tmpdir).joinpath(f"{name}-{shape}-{size}.{format_}")
+                        bookmarks_format = FORMATS[format_]
+
+                        def save():
+                            filepath.unlink(missing_ok=True)
+                            bookmarks_format.save(converter, tree, filepath)
+
+                        seconds, _ = _best_time(save, repeat)
+                        bytes_ = filepath.stat().st_size
+                        results.append(_result(name, format_, shape, size, "save", seconds, bytes_))
+
+                        seconds, _ = _best_time(
+                            lambda: bookmarks_format.load(converter, filepath), repeat
+                        )
+                        results.append(_result(name, format_, shape, size, "load", seconds, bytes_))
+                        filepath.unlink()
+                        _log(results[-2:])
+    return results
+
+
+def _log(results: list[dict]):
+    for result in results:
+        label = f"{result['converter']}/{result['format']}"
+        print(
+            f"{label:<16}{result['shape']:>9}{result['size']:>9} {result['stage']:<5}"
+            f"{result['seconds']:>10.4f}s"
+            f"{result['nodes_per_second']:>12.0f} nodes/s{result['mb_per_second']:>8.2f} MB/s",
+            file=sys.stderr,
+        )
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata() -> dict:
+    """Describe the environment the benchmark ran in, to tell results apart."""
+    return {
+        "commit": _commit(),
+        "version": importlib.metadata.version("bookmarks-converter"),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def _key(result: dict) -> tuple:
+    return (
+        result["converter"],
+        result["format"],
+        result["shape"],
+        result["size"],
+        result["stage"],
+    )
+
+
+def compare(baseline: dict, current: dict) -> list[tuple[tuple, float, float, float]]:
+    """Compare two benchmark reports, returns (key, baseline seconds, current seconds, ratio)
+    for each measurement present in both reports."""
+    baseline_results = {_key(result): result["seconds"] for result in baseline["results"]}
+    comparison = []
+    for result in current["results"]:
+        key = _key(result)
+        if key in baseline_results:
+            before, after = baseline_results[key], result["seconds"]
+            comparison.append((key, before, after, after / before if before else float("inf")))
+    return comparison
+
+
+def _print_comparison(comparison):
+    for key, before, after, ratio in comparison:
+        converter, format_, shape, size, stage = key
+        label = f"{converter}/{format_}"
+        print(
+            f"{label:<16}{shape:>9}{size:>9} {stage:<5}"
+            f"{before:>10.4f}s{after:>10.4f}s{ratio:>8.2f}x",
+            file=sys.stderr,
+        )
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the bookmarks conversions.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--shapes", nargs="+", choices=tuple(SHAPES), default=tuple(SHAPES))
+    parser.add_argument(
+        "--converters", nargs="+", choices=tuple(CONVERTERS), default=tuple(CONVERTERS)
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="keep the best of N runs")
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    parser.add_argument("--compare", type=Path, help="JSON report to compare the results with")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv if argv is not None else sys.argv[1:])
+    report = {
+        "metadata": metadata(),
+        "results": run(args.sizes, args.shapes, args.converters, args.repeat),
+    }
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with args.compare.open("r", encoding="utf-8") as file:
+            _print_comparison(compare(json.load(file), report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
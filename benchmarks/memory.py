@@ -0,0 +1,101 @@
+"""Benchmark of the memory used by each stage of the load and save of every converter/format pair.
+
+The input files are generated with `bookmarks_converter.generator`, then loaded and saved back
+to the same converter/format pair with a `MemoryRecorder` observing the stages.
+
+Usage (from the repository root):
+    python -m benchmarks.memory --sizes 1000 10000 --output memory.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.conversion import metadata
+from bookmarks_converter.converters import CONVERTERS
+from bookmarks_converter.formats import FORMATS
+from bookmarks_converter.generator import GeneratorOptions, generate
+from bookmarks_converter.instrumentation import MemoryRecorder
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def measure(converter, format_, filepath: Path, output_path: Path) -> MemoryRecorder:
+    """Load the file then save it to output_path, recording the memory used by each stage."""
+    bookmarks_format = FORMATS[format_]
+    with MemoryRecorder() as recorder:
+        tree = bookmarks_format.load(converter, filepath)
+        bookmarks_format.save(converter, tree, output_path)
+    return recorder
+
+
+def run(sizes=SIZES, converters=tuple(CONVERTERS), icon_size: int = 0) -> list[dict]:
+    """Measure the memory used by the stages of each converter/format pair for each size."""
+    results = []
+    with TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            options = GeneratorOptions(size=size, icon_size=icon_size)
+            for name in converters:
+                converter = CONVERTERS[name]()
+                for format_ in converter.formats:
+                    filepath = Path(tmpdir).joinpath(f"{name}-{size}.{format_}")
+                    output_path = Path(tmpdir).joinpath(f"{name}-{size}-output.{format_}")
+                    generate(converter, format_, filepath, options)
+
+                    recorder = measure(converter, format_, filepath, output_path)
+                    for stage_memory in recorder.as_dict():
+                        result = {
+                            "converter": name,
+                            "format": str(format_),
+                            "size": size,
+                            "bytes": filepath.stat().st_size,
+                            **stage_memory,
+                        }
+                        results.append(result)
+                        _log(result)
+                    filepath.unlink()
+                    output_path.unlink()
+    return results
+
+
+def _log(result: dict):
+    label = f"{result['converter']}/{result['format']}"
+    rss_peak = result["rss_peak"] / 1024 / 1024 if result["rss_peak"] is not None else 0
+    print(
+        f"{label:<16}{result['size']:>9} {result['stage']:<10}"
+        f"{result['peak'] / 1024 / 1024:>10.2f} MiB peak"
+        f"{result['retained'] / 1024 / 1024:>10.2f} MiB retained"
+        f"{rss_peak:>10.2f} MiB rss peak",
+        file=sys.stderr,
+    )
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the memory used by the conversions.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--converters", nargs="+", choices=tuple(CONVERTERS), default=tuple(CONVERTERS)
+    )
+    parser.add_argument("--icon-size", type=int, default=0, help="icon payload size in bytes")
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv if argv is not None else sys.argv[1:])
+    results = run(args.sizes, args.converters, args.icon_size)
+    report = {"metadata": metadata(), "results": results}
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Benchmark of the startup of the cli, which batch scripts pay once per converted file.
+
+Each scenario runs the cli in fresh interpreters: `bookmarks-converter --version`, and the
+conversion of a small bookmarks file. A run with `python -X importtime` breaks the import time
+down by package, to show which dependencies (sqlalchemy, bs4, importlib.metadata, ...) dominate
+the startup.
+
+The budgets are relative to a baseline interpreter which only imports sqlalchemy and bs4, the
+startup the cli can't go below: the best wall time of each scenario is divided by the best wall
+time of the baseline, so the same budgets hold on slower or faster machines. They are checked
+with --check, and by tests/test_startup.py.
+
+Usage (from the repository root):
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --check --compare startup.json
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.conversion import metadata
+from bookmarks_converter.converters import Chrome
+from bookmarks_converter.formats import Format
+from bookmarks_converter.generator import GeneratorOptions, generate
+
+REPEAT = 5
+# number of bookmarks of the file converted by the "convert" scenario.
+CONVERT_SIZE = 100
+BASELINE = "baseline"
+# the dependencies imported by every run of the cli.
+BASELINE_CODE = "import bs4, sqlalchemy.orm"
+# budgets of the scenarios, as their best wall time divided by the best wall time of the
+# baseline, checked with --check.
+BUDGETS = {
+    "version": 1.75,
+    "convert": 2.0,
+}
+# number of packages reported in the import time breakdown.
+TOP_PACKAGES = 10
+
+
+def scenarios(tmpdir: Path) -> dict[str, list[str]]:
+    """The interpreter arguments of each scenario, the baseline first."""
+    input_path = tmpdir.joinpath("bookmarks.json")
+    generate(Chrome(), Format.JSON, input_path, GeneratorOptions(size=CONVERT_SIZE))
+    cli = ["-m", "bookmarks_converter"]
+    return {
+        BASELINE: ["-c", BASELINE_CODE],
+        "version": [*cli, "--version"],
+        "convert": [
+            *cli,
+            "-i",
+            str(input_path),
+            "-I",
+            "chrome/json",
+            "-o",
+            str(tmpdir.joinpath("bookmarks.html")),
+            "-O",
+            "firefox/html",
+        ],
+    }
+
+
+def _run(argv: list[str], importtime: bool = False) -> tuple[float, str]:
+    """Run a new interpreter, returns its wall time and its stderr."""
+    command = [sys.executable, *(["-X", "importtime"] if importtime else []), *argv]
+    start = time.perf_counter()
+    process = subprocess.run(command, capture_output=True, check=True, text=True)
+    return time.perf_counter() - start, process.stderr
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """Parse the output of `python -X importtime`, returns (module, self time, cumulative time)
+    for each imported module, the times are in microseconds."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, module = line[len("import time:") :].split("|")
+        imports.append((module.strip(), int(self_time), int(cumulative)))
+    return imports
+
+
+def _package(module: str) -> str:
+    parts = module.split(".")
+    # importlib is split in its submodules, importlib.metadata alone is costly to import.
+    return ".".join(parts[:2]) if parts[0] == "importlib" else parts[0]
+
+
+def packages(imports: list[tuple[str, int, int]]) -> dict[str, float]:
+    """Sum the self import time of the modules of each package, in seconds, slowest first."""
+    times = {}
+    for module, self_time, _ in imports:
+        package = _package(module)
+        times[package] = times.get(package, 0) + self_time / 1000_000
+    return dict(sorted(times.items(), key=lambda item: item[1], reverse=True))
+
+
+def best_time(argv: list[str], repeat: int = REPEAT) -> float:
+    """The best wall time of the runs of the scenario, in seconds."""
+    return min(_run(argv)[0] for _ in range(repeat))
+
+
+def measure(name: str, argv: list[str], repeat: int = REPEAT) -> dict:
+    """Measure the best wall time of the scenario, and the import time of its fastest run."""
+    seconds = best_time(argv, repeat)
+    imports = min(
+        (parse_importtime(_run(argv, importtime=True)[1]) for _ in range(repeat)),
+        key=lambda imports: sum(self_time for _, self_time, _ in imports),
+    )
+    return {
+        "scenario": name,
+        "seconds": seconds,
+        "budget": BUDGETS.get(name),
+        "import_seconds": sum(self_time for _, self_time, _ in imports) / 1000_000,
+        "modules": len(imports),
+        "packages": dict(list(packages(imports).items())[:TOP_PACKAGES]),
+    }
+
+
+def run(repeat: int = REPEAT) -> list[dict]:
+    results = []
+    with TemporaryDirectory() as tmpdir:
+        for name, argv in scenarios(Path(tmpdir)).items():
+            result = measure(name, argv, repeat)
+            result["ratio"] = result["seconds"] / results[0]["seconds"] if results else 1
+            results.append(result)
+            _log(result)
+    return results
+
+
+def over_budget(name: str, ratio: float) -> str | None:
+    """The message of a scenario over its budget, None if it is within it (or has none)."""
+    budget = BUDGETS.get(name)
+    if budget is None or ratio <= budget:
+        return None
+    return f"{name}: {ratio:.2f}x the baseline is over the {budget}x budget"
+
+
+def check(results: list[dict]) -> list[str]:
+    """Returns a message for each scenario over its budget."""
+    messages = (over_budget(result["scenario"], result["ratio"]) for result in results)
+    return [message for message in messages if message]
+
+
+def _log(result: dict):
+    budget = f"budget {result['budget']}x" if result["budget"] is not None else "no budget"
+    print(
+        f"{result['scenario']:<10}{result['seconds']:>8.3f}s{result['ratio']:>6.2f}x"
+        f" ({budget}){result['import_seconds']:>8.3f}s importing {result['modules']} modules",
+        file=sys.stderr,
+    )
+    for package, seconds in result["packages"].items():
+        print(f"    {package:<30}{seconds:>8.3f}s", file=sys.stderr)
+
+
+def _print_comparison(baseline: dict, current: dict):
+    baseline_results = {result["scenario"]: result for result in baseline["results"]}
+    for result in current["results"]:
+        before = baseline_results.get(result["scenario"])
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        print(
+            f"{result['scenario']:<10}{before['seconds']:>8.3f}s{result['seconds']:>8.3f}s"
+            f"{ratio:>8.2f}x",
+            file=sys.stderr,
+        )
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the startup of the cli.")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="keep the best of N runs")
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    parser.add_argument("--compare", type=Path, help="JSON report to compare the results with")
+    parser.add_argument(
+        "--check", action="store_true", help="exit with an error if a budget is exceeded"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv if argv is not None else sys.argv[1:])
+    report = {"metadata": metadata(), "results": run(args.repeat)}
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with args.compare.open("r", encoding="utf-8") as file:
+            _print_comparison(json.load(file), report)
+
+    if args.check:
+        errors = check(report["results"])
+        for error in errors:
+            print(error, file=sys.stderr)
+        if errors:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
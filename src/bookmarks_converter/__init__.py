@@ -1,3 +1,11 @@
+import time
+
+# the time taken to import the package and its dependencies is reported by the timings.
+_import_started = (time.perf_counter(), time.process_time())
+
 from bookmarks_converter.converters.bookmarkie import Bookmarkie
 from bookmarks_converter.converters.chrome import Chrome
 from bookmarks_converter.converters.firefox import Firefox
+from bookmarks_converter.instrumentation import set_import_time
+
+set_import_time(time.perf_counter() - _import_started[0], time.process_time() - _import_started[1])
@@ -0,0 +1,232 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+
+from bookmarks_converter.guid import guids
+from bookmarks_converter.models import Bookmark, Folder, SpecialFolder, Url
+
+CACHE_FILE_SUFFIX = ".bookmarks"
+CACHE_DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# compression level used for the cache entries, the lowest level is used to keep the cache
+# writes fast while still shrinking the (mostly textual) entries considerably.
+CACHE_COMPRESSION_LEVEL = 1
+
+RECORD_FOLDER = "f"
+RECORD_URL = "u"
+
+
+@cache
+def _library_version() -> str:
+    try:
+        return importlib.metadata.version("bookmarks-converter")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    # entries found unreadable (truncated or corrupted), dropped and counted as misses.
+    errors: int = 0
+
+
+class ParseCache:
+    """On-disk cache of parsed Bookmark trees.
+
+    The entries are keyed by the hash of the input file content, the converter, the format and the
+    library version, so a changed input file or an upgrade of the library never reuses a stale
+    tree. Each entry is a flat, compressed JSON encoding of the tree, which avoids re-reading the
+    input file with BeautifulSoup / the JSON decoder / SQLAlchemy on repeated conversions.
+
+    When the total size of the entries exceeds `max_size`, the least recently used entries
+    (using the modification time of the entry files, refreshed on every hit) are evicted.
+
+    directory: Path
+        the folder the cache entries are stored in, created if it doesn't exist.
+    max_size: int
+        maximum size in bytes of all the cache entries.
+    """
+
+    def __init__(self, directory: Path, max_size: int = CACHE_DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.stats = CacheStats()
+
+    def key(self, converter, extension: str, path: Path) -> str:
+        """Compute the cache key of an input file read with the given converter and format."""
+        digest = hashlib.sha256()
+        with path.open("rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        # trees parsed in deterministic mode have different guids from the random ones.
+        parts = (
+            converter.__class__.__name__.lower(),
+            str(extension),
+            _library_version(),
+            "deterministic" if guids.deterministic else "random",
+        )
+        digest.update("\0".join(parts).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory.joinpath(f"{key}{CACHE_FILE_SUFFIX}")
+
+    def get(self, key: str) -> Bookmark | None:
+        """Return the cached tree for the key, or None if the key isn't cached.
+        An entry which can't be decoded (ex. truncated by a crash or a full disk) is removed
+        and treated as a miss, so the input file is parsed again."""
+        entry = self._entry_path(key)
+        try:
+            data = entry.read_bytes()
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+
+        try:
+            tree = decode_tree(zlib.decompress(data))
+        except (zlib.error, ValueError, TypeError, IndexError):
+            tree = None
+        if tree is None:
+            entry.unlink(missing_ok=True)
+            self.stats.errors += 1
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        # mark the entry as recently used.
+        entry.touch()
+        return tree
+
+    def put(self, key: str, tree: Bookmark):
+        """Store the tree under the key, then evict the old entries if the cache is full."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self._entry_path(key)
+        # write to a temporary file first, so concurrent readers never see a partial entry.
+        temp = entry.with_suffix(f".{os.getpid()}.tmp")
+        temp.write_bytes(zlib.compress(encode_tree(tree), CACHE_COMPRESSION_LEVEL))
+        temp.replace(entry)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in self.directory.glob(f"*{CACHE_FILE_SUFFIX}"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+        total_size = sum(size for _, size, _ in entries)
+        entries.sort(key=lambda item: item[0])
+        for _, size, entry in entries:
+            if total_size <= self.max_size:
+                break
+            entry.unlink(missing_ok=True)
+            total_size -= size
+            self.stats.evictions += 1
+
+    def clear(self):
+        """Remove all the cache entries."""
+        for entry in self.directory.glob(f"*{CACHE_FILE_SUFFIX}"):
+            entry.unlink(missing_ok=True)
+
+
+def encode_tree(tree: Bookmark) -> bytes:
+    """Encode a Bookmark tree as a flat list of records in pre-order.
+    Folder records end with their number of children, which is enough to rebuild the tree
+    without any recursion."""
+    records = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Folder):
+            special_folder = node.special_folder.value if node.special_folder else None
+            records.append(
+                (
+                    RECORD_FOLDER,
+                    node.id,
+                    node.guid,
+                    node.index,
+                    node.title,
+                    node.date_added,
+                    node.date_modified,
+                    special_folder,
+                    len(node.children),
+                )
+            )
+            stack.extend(reversed(node.children))
+        else:
+            records.append(
+                (
+                    RECORD_URL,
+                    node.id,
+                    node.guid,
+                    node.index,
+                    node.title,
+                    node.date_added,
+                    node.date_modified,
+                    node.url,
+                    node.icon,
+                    node.icon_uri,
+                    node.tags,
+                )
+            )
+    return json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_tree(data: bytes) -> Bookmark:
+    """Decode a Bookmark tree encoded by `encode_tree`."""
+    root = None
+    # stack of (folder, number of children still to be added)
+    stack = []
+    for record in json.loads(data):
+        if record[0] == RECORD_FOLDER:
+            _, id_, guid, index, title, date_added, date_modified, special_folder, size = record
+            node = Folder(
+                id=id_,
+                guid=guid,
+                index=index,
+                title=title,
+                date_added=date_added,
+                date_modified=date_modified,
+                special_folder=SpecialFolder(special_folder) if special_folder else None,
+            )
+        else:
+            _, id_, guid, index, title, date_added, date_modified, url, icon, icon_uri, tags = (
+                record
+            )
+            node = Url(
+                id=id_,
+                guid=guid,
+                index=index,
+                title=title,
+                date_added=date_added,
+                date_modified=date_modified,
+                url=url,
+                icon=icon,
+                icon_uri=icon_uri,
+                tags=tags,
+            )
+            size = 0
+
+        if stack:
+            parent, remaining = stack[-1]
+            parent.children.append(node)
+            if remaining == 1:
+                stack.pop()
+            else:
+                stack[-1] = (parent, remaining - 1)
+        else:
+            root = node
+
+        if size:
+            stack.append((node, size))
+    return root
@@ -2,13 +2,42 @@ import argparse
 import importlib.metadata
 import json
 import sys
+from contextlib import ExitStack, nullcontext
+from dataclasses import fields
 from pathlib import Path
 
 from sqlalchemy.exc import DatabaseError, OperationalError
 
+from bookmarks_converter.cache import ParseCache
 from bookmarks_converter.converters import CONVERTER_FORMATS, CONVERTER_NAMES, CONVERTERS
 from bookmarks_converter.converters.converter import Converter
-from bookmarks_converter.formats import FORMATS, BaseFormat, Format, _new_file_name
+from bookmarks_converter.engines import EngineCache
+from bookmarks_converter.favicons import FaviconCache, add_favicons
+from bookmarks_converter.formats import (
+    FORMATS,
+    BaseFormat,
+    DBFormat,
+    Format,
+    _new_file_name,
+    save_many,
+)
+from bookmarks_converter.generator import GeneratorOptions, generate
+from bookmarks_converter.guid import deterministic_guids
+from bookmarks_converter.instrumentation import STAGE_IMPORT, STAGES, TimingRecorder
+from bookmarks_converter.models import Bookmark
+from bookmarks_converter.profiling import StageProfiler
+from bookmarks_converter.progress import (
+    ConversionCancelled,
+    Deadline,
+    ProgressBar,
+    ProgressReporter,
+)
+from bookmarks_converter.search import SEARCH_DEFAULT_LIMIT, search
+from bookmarks_converter.tracing import TraceRecorder
+
+GENERATE_COMMAND = "generate"
+SEARCH_COMMAND = "search"
+TIMINGS_FORMATS = ("text", "json")
 
 
 def _get_version():
@@ -16,6 +45,24 @@ def _get_version():
     return importlib.metadata.version("bookmarks-converter")
 
 
+class _VersionAction(argparse.Action):
+    """Print the version and exit. Unlike argparse's version action, the version is only looked
+    up (in the installed package metadata) when the option is used, not on every start."""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS):
+        super().__init__(
+            option_strings=option_strings,
+            dest=dest,
+            default=default,
+            nargs=0,
+            help="show program's version number and exit",
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser._print_message(f"{parser.prog} {_get_version()}\n", sys.stdout)
+        parser.exit()
+
+
 def _input_file(filepath: str) -> Path:
     """Check that file exists at the given path."""
     filepath = Path(filepath)
@@ -25,6 +72,17 @@ def _input_file(filepath: str) -> Path:
     return filepath
 
 
+def _seconds(value: str) -> float:
+    """Check that the value is a positive number of seconds."""
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number of seconds: '{value}'")
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(f"the number of seconds must be positive: '{value}'")
+    return seconds
+
+
 def _output_file(filepath: str) -> Path:
     filepath = Path(filepath)
 
@@ -42,6 +100,13 @@ And the format being one of the available formats: {CONVERTER_FORMATS}
 Example Usage:
     bookmarks-converter -i ./input_bookmarks.db --input-format 'bookmarkie/db' --output-format 'chrome/html'
     bookmarks-converter -i ./some_bookmarks.html -I 'chrome/html' -o ./output_bookmarks.json -O 'firefox/json'
+    bookmarks-converter -i ./some_bookmarks.html -I 'chrome/html' -O 'firefox/json' -O 'bookmarkie/db'
+
+Generate a synthetic bookmarks file for load testing:
+    bookmarks-converter generate -o ./generated.json -O 'chrome/json' --size 100000
+
+Search the urls of a DB saved with --search-index:
+    bookmarks-converter search -i ./bookmarks.db 'python OR rust'
     """
 
     formatter = lambda prog: argparse.RawTextHelpFormatter(prog, width=100)
@@ -51,13 +116,7 @@ Example Usage:
         formatter_class=formatter,
     )
 
-    version = _get_version()
-    parser.add_argument(
-        "-V",
-        "--version",
-        action="version",
-        version=f"%(prog)s {version}",
-    )
+    parser.add_argument("-V", "--version", action=_VersionAction)
 
     parser.add_argument(
         "-i", "--input", type=_input_file, help="Input bookmarks file", required=True
@@ -69,19 +128,199 @@ Example Usage:
         required=True,
     )
     parser.add_argument(
-        "-o", "--output", type=_output_file, help="Output bookmarks file", required=False
+        "-o",
+        "--output",
+        type=_output_file,
+        action="append",
+        help="Output bookmarks file, can be repeated once per output format",
+        required=False,
+    )
+    parser.add_argument(
+        "-O",
+        "--output-format",
+        action="append",
+        help="The bookmark format of the output bookmarks file,\n"
+        "can be repeated to convert the input file to multiple formats",
+        required=True,
+    )
+    parser.add_argument(
+        "--favicons",
+        type=_input_file,
+        help="Add the icons of the urls from this Chrome 'Favicons' database,\n"
+        "for the chrome/json input files which have no icons",
+    )
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="Derive the generated guids from the bookmarks content,\n"
+        "so converting the same input file always produces identical output",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="Cache the parsed input bookmarks (and the icons read with --favicons) in\n"
+        "this folder, to skip parsing the same input file on the following conversions",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Only replace the output file if the converted bookmarks changed",
+    )
+    parser.add_argument(
+        "--timings",
+        nargs="?",
+        const="text",
+        choices=TIMINGS_FORMATS,
+        help="Print the wall and cpu time of each conversion stage, the number of bookmarks\n"
+        "and the bytes read and written to stderr, as text (default) or json",
+    )
+    parser.add_argument(
+        "--profile",
+        type=_output_file,
+        help="Profile the conversion, and write the profile to this file as pstats,\n"
+        "and next to it with the '.collapsed' suffix as collapsed stacks (for flamegraphs)",
+    )
+    parser.add_argument(
+        "--profile-stage",
+        action="append",
+        choices=[name for name in STAGES if name != STAGE_IMPORT],
+        help="Only profile this conversion stage, can be repeated",
+    )
+    parser.add_argument(
+        "--trace",
+        type=_output_file,
+        help="Write the spans and stages of the conversion to this file in the Chrome trace\n"
+        "event format, which can be opened in Perfetto or chrome://tracing",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Show the progress of the conversion on stderr",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=_seconds,
+        metavar="SECONDS",
+        help="Cancel the conversion if it takes longer than this number of seconds",
+    )
+    parser.add_argument(
+        "--search-index",
+        action="store_true",
+        help="Add a full-text search index to the 'db' output files,\n"
+        f"to search them with the '{SEARCH_COMMAND}' subcommand",
+    )
+    parser.add_argument(
+        "--icon-table",
+        action="store_true",
+        help="Store each distinct icon once in the 'db' output files, as raw bytes,\n"
+        "instead of repeating its base64 data on every url",
+    )
+
+    args = parser.parse_args(argv)
+    return parser, args
+
+
+def _parse_generate_args(argv):
+    formatter = lambda prog: argparse.RawTextHelpFormatter(prog, width=100)
+    parser = argparse.ArgumentParser(
+        prog=f"bookmarks-converter {GENERATE_COMMAND}",
+        description="Generate a synthetic bookmarks file, to load test the conversions.\n"
+        "The same options and seed always generate the same file.",
+        formatter_class=formatter,
+    )
+    parser.add_argument(
+        "-o", "--output", type=_output_file, help="Generated bookmarks file", required=True
     )
     parser.add_argument(
         "-O",
         "--output-format",
-        help="The bookmark format of the output bookmarks file",
+        help="The bookmark format of the generated bookmarks file, ex. 'chrome/json'",
         required=True,
     )
+    defaults = {field.name: field.default for field in fields(GeneratorOptions)}
+    options_help = {
+        "size": "Number of bookmarks (urls and folders) to generate",
+        "seed": "Seed of the random generator",
+        "max_depth": "Maximum depth of the folders",
+        "folder_ratio": "Probability of a bookmark being a folder",
+        "folder_size": "Average number of bookmarks in a folder",
+        "icon_size": "Size in bytes of the icon payload, 0 for no icons",
+        "icon_ratio": "Probability of a url having an icon",
+        "max_tags": "Maximum number of tags of a url",
+        "unicode_ratio": "Probability of a title containing non ascii characters",
+        "duplicate_ratio": "Probability of a url being a duplicate",
+    }
+    for name, help_text in options_help.items():
+        default = defaults[name]
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=type(default),
+            default=default,
+            help=f"{help_text} (default: {default})",
+        )
+
+    args = parser.parse_args(argv)
+    return parser, args
+
+
+def _parse_search_args(argv):
+    formatter = lambda prog: argparse.RawTextHelpFormatter(prog, width=100)
+    parser = argparse.ArgumentParser(
+        prog=f"bookmarks-converter {SEARCH_COMMAND}",
+        description="Search the urls of a 'bookmarkie/db' file saved with a search index,\n"
+        "best matches first.",
+        formatter_class=formatter,
+    )
+    parser.add_argument(
+        "-i", "--input", type=_input_file, help="Bookmarks DB file to search", required=True
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=SEARCH_DEFAULT_LIMIT,
+        help=f"Maximum number of results (default: {SEARCH_DEFAULT_LIMIT})",
+    )
+    parser.add_argument(
+        "query",
+        help="Words to search in the titles, urls and tags, in the SQLite FTS5 query syntax,\n"
+        "ex. 'python', '\"release notes\"', 'py*', 'title:python' or 'python NOT snake'",
+    )
 
     args = parser.parse_args(argv)
     return parser, args
 
 
+def _search(argv) -> int:
+    parser, args = _parse_search_args(argv)
+    try:
+        results = search(args.input, args.query, args.limit)
+    except (DatabaseError, OperationalError):
+        parser.error(f"The provided file '{args.input}' is not a valid sqlite3 database file.")
+    except ValueError as e:
+        parser.error(str(e))
+
+    message = "".join(f"{result.url}\t{result.title}\n" for result in results)
+    sys.stdout.buffer.write(bytes(message, "utf-8"))
+    return 0
+
+
+def _generate(argv) -> int:
+    parser, args = _parse_generate_args(argv)
+    try:
+        converter, format_ = _parse_bookmark_format(args.output_format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    options = GeneratorOptions(
+        **{field.name: getattr(args, field.name) for field in fields(GeneratorOptions)}
+    )
+    generate(converter, format_.extension, args.output, options)
+
+    message = f"Generation successful!\nThe generated file can be found at '{args.output}'\n"
+    sys.stdout.buffer.write(bytes(message, "utf-8"))
+    return 0
+
+
 def _parse_bookmark_format(bookmark_type: str) -> tuple[Converter, BaseFormat]:
     try:
         converter, format_ = bookmark_type.split("/", 1)
@@ -102,36 +341,103 @@ def _parse_bookmark_format(bookmark_type: str) -> tuple[Converter, BaseFormat]:
     return converter, format_
 
 
+def _add_favicons(parser, bookmarks: Bookmark, filepath: Path, cache_dir: Path | None):
+    # the icons are cached next to the parsed bookmarks.
+    cache = FaviconCache(directory=cache_dir) if cache_dir else None
+    try:
+        add_favicons(bookmarks, filepath, cache)
+    except (DatabaseError, OperationalError):
+        parser.error(f"The provided file '{filepath}' is not a valid Chrome Favicons database.")
+
+
 def main(argv=None):
     argv = argv if argv is not None else sys.argv[1:]
+    if argv and argv[0] == GENERATE_COMMAND:
+        return _generate(argv[1:])
+    if argv and argv[0] == SEARCH_COMMAND:
+        return _search(argv[1:])
 
     parser, args = _parse_args(argv)
     try:
         input_converter, input_format = _parse_bookmark_format(args.input_format)
-        output_converter, output_format = _parse_bookmark_format(args.output_format)
+        output_formats = [_parse_bookmark_format(format_) for format_ in args.output_format]
     except ValueError as e:
         parser.error(str(e))
 
     input_file = Path(args.input)
-    output_file = args.output
-    if output_file is None:
-        output_file = _new_file_name(input_file.parent, output_format.extension)
+    output_files = args.output or []
+    if len(output_files) > len(output_formats):
+        parser.error("More output files than output formats were provided.")
+
+    outputs = []
+    for i, (output_converter, output_format) in enumerate(output_formats):
+        if i < len(output_files):
+            output_file = output_files[i]
+        else:
+            # add the converter name to the generated names, to tell the outputs apart.
+            converter_name = None
+            if len(output_formats) > 1:
+                converter_name = output_converter.__class__.__name__.lower()
+            output_file = _new_file_name(input_file.parent, output_format.extension, converter_name)
+        if isinstance(output_format, DBFormat) and (args.search_index or args.icon_table):
+            output_format = DBFormat(
+                output_format.extension,
+                search_index=args.search_index,
+                icon_table=args.icon_table,
+            )
+        outputs.append((output_converter, output_format, output_file))
+
+    output_paths = [output_file.resolve() for _, _, output_file in outputs]
+    if len(set(output_paths)) != len(output_paths):
+        parser.error("The same output file is used for multiple output formats.")
 
+    guid_mode = deterministic_guids() if args.deterministic else nullcontext()
+    cache = ParseCache(args.cache_dir) if args.cache_dir else None
+    timings = TimingRecorder(include_import=True) if args.timings else None
+    profiler = StageProfiler(args.profile_stage) if args.profile else None
+    trace = TraceRecorder() if args.trace else None
+    progress_bar = ProgressBar() if args.progress else None
+    progress = ProgressReporter(progress_bar) if progress_bar else None
+    deadline = Deadline(args.timeout) if args.timeout else None
     try:
-        bookmarks = input_format.load(input_converter, input_file)
-        output_format.save(output_converter, bookmarks, output_file)
+        # the engines of the DB files are shared by the import and the exports.
+        with guid_mode, EngineCache(), ExitStack() as observers:
+            for observer in (timings, profiler, trace, progress, deadline):
+                if observer:
+                    observers.enter_context(observer)
+            if progress_bar:
+                # end the progress bar line before any other output.
+                observers.callback(progress_bar.finish)
+            bookmarks = input_format.load(input_converter, input_file, cache)
+            if args.favicons:
+                _add_favicons(parser, bookmarks, args.favicons, args.cache_dir)
+            written = save_many(bookmarks, outputs, args.skip_unchanged)
+    except ConversionCancelled as e:
+        parser.error(str(e))
     except (DatabaseError, OperationalError):
         parser.error(f"The provided file '{input_file}' is not a valid sqlite3 database file.")
     except (AttributeError, json.JSONDecodeError, KeyError, TypeError, ValueError):
         parser.error(f"The provided file '{input_file}' is not a valid bookmarks file.")
     except Exception:
         parser.error(f"RuntimeError: An unexpected error has occurred.")
+    message = ["Conversion successful!\n"]
+    for (_, _, output_file), file_written in zip(outputs, written):
+        if file_written:
+            message.append(f"The converted file can be found at '{output_file}'\n")
+        else:
+            message.append(f"The converted file at '{output_file}' is unchanged\n")
+    if profiler:
+        stats_path, collapsed_path = profiler.dump(args.profile)
+        message.append(f"The profile can be found at '{stats_path}' and '{collapsed_path}'\n")
+    if trace:
+        trace.dump(args.trace)
+        message.append(f"The trace can be found at '{args.trace}'\n")
+    sys.stdout.buffer.write(bytes("".join(message), "utf-8"))
 
-    sys.stdout.buffer.write(
-        bytes(
-            f"Conversion successful!\nThe converted file can be found at '{output_file}'\n",
-            "utf-8",
-        )
-    )
+    if timings:
+        if args.timings == "json":
+            sys.stderr.write(json.dumps(timings.as_dict(), indent=2) + "\n")
+        else:
+            sys.stderr.write(timings.report())
 
     return 0
@@ -3,14 +3,29 @@ import time
 from enum import Enum
 from html import escape
 from pathlib import Path
-from uuid import UUID, uuid4
+from types import SimpleNamespace
+from typing import Optional
 
 from bs4 import BeautifulSoup, Tag
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select
+from sqlalchemy.orm import Session
 
 from bookmarks_converter.converters.converter import Converter
+from bookmarks_converter.engines import open_engine
 from bookmarks_converter.formats import Format
+from bookmarks_converter.guid import guids
+from bookmarks_converter.icons import load_icons, resolve_icons
+from bookmarks_converter.instrumentation import (
+    COUNTER_BYTES_IN,
+    STAGE_BUILD,
+    STAGE_PARSE,
+    count,
+    current_progress,
+    observing,
+    stage,
+    traced,
+)
+from bookmarks_converter.lazy import LAZY_DEFAULT_MAX_FOLDERS, FolderLoader, LazyFolder
 from bookmarks_converter.models import (
     TYPE_FOLDER,
     TYPE_URL,
@@ -23,7 +38,8 @@ from bookmarks_converter.models import (
     SpecialFolder,
     Url,
 )
-from bookmarks_converter.util import format_html, indent_html
+from bookmarks_converter.tags import load_tags, resolve_tags
+from bookmarks_converter.util import format_html, indent_html, read_file
 
 BOOKMARKIE_BOOKMARKS_TOOLBAR_FOLDER_HTML_FLAG = "PERSONAL_TOOLBAR_FOLDER"
 BOOKMARKIE_BOOKMARKS_OTHER_FOLDER_HTML_FLAG = "UNFILED_BOOKMARKS_FOLDER"
@@ -67,6 +83,7 @@ class FolderRoot(Enum):
 class Bookmarkie(Converter):
     formats = (Format.DB, Format.HTML, Format.JSON)
 
+    @traced
     def as_db(self, tree: Bookmark) -> DBBookmark:
         """Convert Bookmarks tree to DBBookmark."""
         return self._convert_to_db(tree)
@@ -75,8 +92,10 @@ class Bookmarkie(Converter):
         bookmarks = self._folder_as_dbfolder(tree, 0)
         stack = [(bookmarks, tree)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
+            progress.advance(len(node.children))
             for child in node.children:
                 if isinstance(child, Folder):
                     item = self._folder_as_dbfolder(child, folder.id)
@@ -117,38 +136,153 @@ class Bookmarkie(Converter):
             icon=url.icon,
             icon_uri=url.icon_uri,
             tags=",".join(url.tags),
+            tag_names=list(url.tags),
         )
 
-    def from_db(self, filepath: Path) -> Bookmark:
-        """Import the sqlite3 DB bookmarks file as a Bookmark tree."""
-        database_path = f"sqlite:///{str(filepath)}"
-        engine = create_engine(database_path)
-        Session = sessionmaker(bind=engine)
-        session = Session()
-        bookmarks = session.scalars(
-            select(DBFolder).filter_by(special_folder=SpecialFolder.ROOT.value)
-        ).first()
-        return self._convert_db_to_bookmarks(bookmarks)
-
-    def _convert_db_to_bookmarks(self, tree: [DBBookmark]) -> Bookmark:
-        """Converts a DBBookmark tree into a Bookmark tree."""
+    @traced
+    def from_db(
+        self, filepath: Path, lazy: bool = False, max_folders: int = LAZY_DEFAULT_MAX_FOLDERS
+    ) -> Bookmark:
+        """Import the sqlite3 DB bookmarks file as a Bookmark tree.
+        If lazy is set, the root is a LazyFolder, the children of the folders are only loaded
+        from the DB on first access, and the children of at most `max_folders` folders are
+        kept loaded (see lazy.FolderLoader). The lazy tree keeps no connection open, its
+        queries reuse the engine of the current EngineCache if any (see engines.py)."""
+        if lazy:
+            return self._lazy_from_db(filepath, max_folders)
+        # some of the descendants of the root folder are only loaded while the tree is built.
+        with open_engine(filepath) as engine, Session(engine) as session:
+            with stage(STAGE_PARSE):
+                bookmarks = session.scalars(
+                    select(DBFolder).filter_by(special_folder=SpecialFolder.ROOT.value)
+                ).first()
+                icons = load_icons(session.connection())
+                tags = load_tags(session.connection())
+                if observing():
+                    count(COUNTER_BYTES_IN, filepath.stat().st_size)
+            with stage(STAGE_BUILD):
+                return self._convert_db_to_bookmarks(bookmarks, icons, tags)
+
+    def _lazy_from_db(self, filepath: Path, max_folders: int) -> Bookmark:
+        loader = FolderLoader(filepath, self._row_as_lazy_bookmark, max_folders)
+        with stage(STAGE_PARSE):
+            table = DBBookmark.__table__
+            bookmarks = loader.load(table.c.special_folder == SpecialFolder.ROOT.value)
+            if observing():
+                count(COUNTER_BYTES_IN, filepath.stat().st_size)
+        return bookmarks
+
+    def _row_as_lazy_bookmark(self, row: SimpleNamespace, loader: FolderLoader) -> Bookmark:
+        if row.type == TYPE_FOLDER:
+            return self._dbfolder_as_folder(row, loader)
+        return self._dburl_as_url(row)
+
+    @traced
+    def from_db_subtree(
+        self,
+        filepath: Path,
+        folder_id: Optional[int] = None,
+        guid: Optional[str] = None,
+        special_folder: Optional[SpecialFolder] = None,
+    ) -> Folder:
+        """Import a single folder of the sqlite3 DB bookmarks file, with all its descendants.
+        The folder is selected by exactly one of its id, guid or special folder.
+        Only the rows of the subtree are read, with a recursive query on the parent ids, so the
+        import costs O(subtree) instead of O(database)."""
+        if special_folder is not None:
+            special_folder = SpecialFolder(special_folder).value
+        selectors = [
+            (column, value)
+            for column, value in (
+                ("id", folder_id),
+                ("guid", guid),
+                ("special_folder", special_folder),
+            )
+            if value is not None
+        ]
+        if len(selectors) != 1:
+            raise ValueError("Exactly one of folder_id, guid or special_folder is required.")
+        ((column, value),) = selectors
+
+        table = DBBookmark.__table__
+
+        with open_engine(filepath) as engine, stage(STAGE_PARSE), engine.connect() as connection:
+            root_id = connection.scalar(
+                select(table.c.id).where(table.c[column] == value, table.c.type == TYPE_FOLDER)
+            )
+            if root_id is None:
+                raise ValueError(f"No folder with {column}={value!r} in the DB.")
+            # ids of the subtree, UNION (rather than UNION ALL) stops on parent_id cycles.
+            subtree = select(table.c.id).where(table.c.id == root_id).cte(recursive=True)
+            subtree = subtree.union(
+                select(table.c.id).join(subtree, table.c.parent_id == subtree.c.id)
+            )
+            rows = connection.execute(
+                select(table)
+                .join(subtree, table.c.id == subtree.c.id)
+                .order_by(table.c.parent_id, table.c.index)
+            ).mappings()
+            nodes = [SimpleNamespace(**row) for row in rows]
+            resolve_icons(connection, nodes)
+            resolve_tags(connection, nodes)
+        with stage(STAGE_BUILD):
+            return self._convert_rows_to_bookmarks(nodes, root_id)
+
+    def _convert_rows_to_bookmarks(self, nodes: list[SimpleNamespace], root_id: int) -> Folder:
+        """Assemble the rows of a subtree, sorted by parent id and index, into a Bookmark tree."""
+        children = {}
+        root = None
+        for node in nodes:
+            if node.id == root_id:
+                root = node
+            else:
+                children.setdefault(node.parent_id, []).append(node)
+
+        bookmarks = self._dbfolder_as_folder(root)
+        stack = [bookmarks]
+
+        progress = current_progress()
+        while stack:
+            folder = stack.pop()
+            rows = children.get(folder.id, ())
+            progress.advance(len(rows))
+            for node in rows:
+                if node.type == TYPE_FOLDER:
+                    item = self._dbfolder_as_folder(node)
+                    stack.append(item)
+                else:
+                    item = self._dburl_as_url(node)
+                folder.children.append(item)
+        return bookmarks
+
+    def _convert_db_to_bookmarks(
+        self,
+        tree: [DBBookmark],
+        icons: Optional[dict[str, str]] = None,
+        tags: Optional[dict[int, list[str]]] = None,
+    ) -> Bookmark:
+        """Converts a DBBookmark tree into a Bookmark tree.
+        The icon keys of the urls are replaced by the data URIs of the icons (see icons.py),
+        and their tags are read from the tag tables if the DB has them (see tags.py)."""
         bookmarks = self._dbfolder_as_folder(tree)
         stack = [(bookmarks, tree)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
+            progress.advance(len(node.children))
             for child in node.children:
                 if isinstance(child, DBFolder):
                     item = self._dbfolder_as_folder(child)
                     if child.children:
                         stack.append((item, child))
                 else:
-                    item = self._dburl_as_url(child)
+                    item = self._dburl_as_url(child, icons, tags)
                 folder.children.append(item)
         return bookmarks
 
     @staticmethod
-    def _dbfolder_as_folder(folder: [DBFolder]) -> Bookmark:
+    def _dbfolder_as_folder(folder: [DBFolder], loader: Optional[FolderLoader] = None) -> Bookmark:
         kwargs = {
             "id": folder.id,
             "guid": folder.guid,
@@ -160,13 +294,26 @@ class Bookmarkie(Converter):
         if folder.special_folder:
             kwargs["special_folder"] = FolderRoot[folder.special_folder].value
 
+        if loader is not None:
+            return LazyFolder(loader, **kwargs)
         return Folder(**kwargs)
 
     @staticmethod
-    def _dburl_as_url(url: DBUrl) -> Bookmark:
-        tags = []
-        if url.tags:
-            tags = url.tags.split(",")
+    def _dburl_as_url(
+        url: DBUrl,
+        icons: Optional[dict[str, str]] = None,
+        tags: Optional[dict[int, list[str]]] = None,
+    ) -> Bookmark:
+        if tags is not None:
+            tags = tags.get(url.id, [])
+        elif isinstance(url.tags, list):
+            # the tags of the rows are already resolved (see tags.resolve_tags).
+            tags = url.tags
+        else:
+            tags = url.tags.split(",") if url.tags else []
+        icon = url.icon
+        if icons and icon in icons:
+            icon = icons[icon]
 
         return Url(
             id=url.id,
@@ -176,58 +323,45 @@ class Bookmarkie(Converter):
             date_added=url.date_added,
             date_modified=url.date_modified,
             url=url.url,
-            icon=url.icon,
+            icon=icon,
             icon_uri=url.icon_uri,
             tags=tags,
         )
 
+    @traced
     def as_html(self, tree: Bookmark) -> str:
         """Converts bookmark object tree to HTML."""
         footer = "</DL>\n"
 
-        self._stack = tree.children[::-1]
+        stack = tree.children[::-1]
         body = []
 
-        while self._stack:
-            stack_item = self._stack.pop()
-            folder = self._iterate_folder_html(stack_item)
-            if not folder:
+        progress = current_progress()
+        while stack:
+            stack_item = stack.pop()
+            if isinstance(stack_item, str):
+                body.append(stack_item)
                 continue
+            progress.advance(len(stack_item.children))
+            body.append(self._iterate_folder_html(stack_item, stack))
 
-            self._create_placeholder(body, folder, stack_item)
-
-        self._stack = None
         return indent_html("".join([BOOKMARKIE_HTML_HEADER, *body, footer]))
 
-    def _iterate_folder_html(self, node: Folder) -> str:
-        """Iterate through each item in the hierarchy tree and convert it to
-        HTML. If a folder has children, it is added to the stack and a
-        placeholder is left in its place, so it can be inserted back to its
-        position after processing."""
+    def _iterate_folder_html(self, node: Folder, stack: list[Folder | str]) -> str:
+        """Convert the folder to HTML, and push its content on the stack.
+        The children are pushed in reverse order (the urls already converted to HTML, the
+        folders as is) followed by the end of the folder, so popping the stack converts the
+        bookmarks in the order of the HTML document, without splicing the nested folders in."""
         if node.special_folder == SpecialFolder.MENU:
-            folder = []
+            folder_html = ""
             list_end = ""
         else:
-            folder = [self._folder_as_html(node), "<DL><p>\n"]
+            folder_html = self._folder_as_html(node) + "<DL><p>\n"
             list_end = "</DL><p>\n"
-        for child in node.children:
-            if isinstance(child, Folder):
-                item = f"<folder{child.id}>"
-                self._stack.append(child)
-            else:
-                item = self._url_as_html(child)
-            folder.append(item)
-        folder.append(list_end)
-        result = "".join(folder)
-        return result
-
-    @staticmethod
-    def _create_placeholder(body, folder, stack_item):
-        placeholder = f"<folder{stack_item.id}>"
-        if body and (placeholder in body[-1]):
-            body[-1] = body[-1].replace(placeholder, folder)
-        else:
-            body.append(folder)
+        stack.append(list_end)
+        for child in reversed(node.children):
+            stack.append(child if isinstance(child, Folder) else self._url_as_html(child))
+        return folder_html
 
     @staticmethod
     def _folder_as_html(folder: Bookmark | Folder) -> str:
@@ -266,17 +400,24 @@ class Bookmarkie(Converter):
         url_html += f">{escape(url.title)}</A>\n"
         return url_html
 
+    @traced
     def from_html(self, filepath: Path) -> Bookmark:
         """Imports the HTML Bookmarks file as a Bookmark tree."""
-        soup = BeautifulSoup(
-            markup=format_html(filepath),
-            features="html.parser",
-            element_classes={Tag: HTMLBookmark},
-        )
+        # reset the counter before parsing, so the ids (and the deterministic guids derived
+        # from them) only depend on the content of the file.
         HTMLBookmark.reset_id_counter()
-        tree = soup.find("h3")
-        tree = self._restructure_root(tree)
-        tree = self._convert_html_to_bookmarks(tree)
+        markup = format_html(filepath)
+        with stage(STAGE_PARSE):
+            soup = BeautifulSoup(
+                markup=markup,
+                features="html.parser",
+                element_classes={Tag: HTMLBookmark},
+            )
+            del markup
+        with stage(STAGE_BUILD):
+            tree = soup.find("h3")
+            tree = self._restructure_root(tree)
+            tree = self._convert_html_to_bookmarks(tree)
         return tree
 
     @staticmethod
@@ -302,9 +443,10 @@ class Bookmarkie(Converter):
             },
         )
         new_tree.children.append(tree)
+        # partition the children in a single pass, popping from the front of the list
+        # would make the restructuring quadratic in the number of top-level bookmarks.
         children = []
-        while tree.children:
-            child = tree.children.pop(0)
+        for child in tree.children:
             if (
                 BOOKMARKIE_BOOKMARKS_TOOLBAR_FOLDER_HTML_FLAG.lower() in child.attrs
                 or BOOKMARKIE_BOOKMARKS_OTHER_FOLDER_HTML_FLAG.lower() in child.attrs
@@ -314,7 +456,7 @@ class Bookmarkie(Converter):
             else:
                 children.append(child)
 
-        tree.children.extend(children)
+        tree.children[:] = children
         return new_tree
 
     def _convert_html_to_bookmarks(self, tree: HTMLBookmark) -> Bookmark:
@@ -325,6 +467,7 @@ class Bookmarkie(Converter):
 
         stack = [(root, tree.children)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
             children = folder.children
@@ -339,6 +482,7 @@ class Bookmarkie(Converter):
                 else:
                     item = child._as_url(index=i)
                 children.append(item)
+            progress.advance(len(children))
         return root
 
     @staticmethod
@@ -364,13 +508,16 @@ class Bookmarkie(Converter):
         ):
             return SpecialFolder.MOBILE
 
+    @traced
     def as_json(self, tree: Bookmark) -> dict:
         """Convert the imported bookmarks to JSON."""
         bookmarks = self._folder_as_json(tree)
         stack = [(bookmarks, tree)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
+            progress.advance(len(node.children))
             children = folder.get("children")
             for child in node.children:
                 if isinstance(child, Folder):
@@ -386,7 +533,7 @@ class Bookmarkie(Converter):
     def _folder_as_json(self, folder: Folder) -> dict:
         folder_json = {
             "id": folder.id,
-            "guid": self._ensure_guid(folder.guid),
+            "guid": self._ensure_guid(folder.guid, folder.id, folder.title, folder.date_added),
             "index": folder.index,
             "title": folder.title,
             "date_added": folder.date_added,
@@ -406,7 +553,7 @@ class Bookmarkie(Converter):
     def _url_as_json(self, url: Url) -> dict:
         return {
             "id": url.id,
-            "guid": self._ensure_guid(url.guid),
+            "guid": self._ensure_guid(url.guid, url.id, url.url, url.date_added),
             "index": url.index,
             "title": url.title,
             "date_added": url.date_added,
@@ -419,33 +566,37 @@ class Bookmarkie(Converter):
         }
 
     @staticmethod
-    def _ensure_guid(guid: str) -> str:
-        """Ensure that we have a proper guid of type uuid4"""
-        try:
-            UUID(guid, version=4)
-        except ValueError:
-            guid = str(uuid4())
-        return guid
+    def _ensure_guid(guid: str, *content) -> str:
+        """Ensure that we have a proper guid of type uuid4, the content is used to derive the
+        replacement guid in deterministic mode."""
+        return guids.ensure_uuid(guid, *content)
 
+    @traced
     def from_json(self, filepath: Path) -> Bookmark:
         """Imports the JSON Bookmarks file as a Bookmark tree."""
-        with filepath.open("r", encoding="utf-8") as file:
-            # use the object_hook to load the json tree as a Bookmark tree.
-            tree = json.load(file, object_hook=self._json_to_object)
+        content = read_file(filepath)
+        # the Bookmark tree is built while parsing, by the object_hook.
+        with stage(STAGE_PARSE):
+            tree = json.loads(content, object_hook=self._json_to_object)
+            del content
         return tree
 
     @staticmethod
     def _json_to_object(jdict: dict) -> Bookmark:
         """Helper function used as object_hook for json load."""
+        current_progress().advance()
 
+        guid = jdict.pop("guid", None)
         kwargs = {
             "id": int(jdict.pop("id")),
             "index": int(jdict.pop("index")),
             "title": jdict.pop("title", None),
             "date_added": int(jdict.pop("date_added", 0)),
             "date_modified": int(jdict.pop("date_modified", 0)),
-            "guid": jdict.pop("guid", str(uuid4())),
         }
+        if guid is None:
+            guid = guids.uuid(kwargs["id"], kwargs["title"], kwargs["date_added"])
+        kwargs["guid"] = guid
 
         type_ = jdict.pop("type")
         if type_ == TYPE_FOLDER:
@@ -3,12 +3,20 @@ import time
 from enum import Enum
 from html import escape
 from pathlib import Path
-from uuid import uuid4
 
 from bs4 import BeautifulSoup, Tag
 
 from bookmarks_converter.converters.converter import Converter
+from bookmarks_converter.favicons import add_favicons
 from bookmarks_converter.formats import Format
+from bookmarks_converter.guid import guids
+from bookmarks_converter.instrumentation import (
+    STAGE_BUILD,
+    STAGE_PARSE,
+    current_progress,
+    stage,
+    traced,
+)
 from bookmarks_converter.models import (
     TYPE_FOLDER,
     TYPE_URL,
@@ -18,7 +26,7 @@ from bookmarks_converter.models import (
     SpecialFolder,
     Url,
 )
-from bookmarks_converter.util import format_html, indent_html
+from bookmarks_converter.util import format_html, indent_html, read_file
 
 # chrome json bookmarks have timestamps as microseconds since January 1, 1601, rather than seconds
 # since January 1, 1970. The constant below is the offset in milliseconds between the two dates.
@@ -51,59 +59,44 @@ class FolderRoot(Enum):
 class Chrome(Converter):
     formats = (Format.HTML, Format.JSON)
 
+    @traced
     def as_html(self, tree: Bookmark) -> str:
         """Converts bookmark object tree to HTML."""
         footer = "</DL><p>\n"
 
-        # Chrome doesn't export Menu bookmarks in the HTML export.
-        for i, child in enumerate(tree.children):
-            if child.special_folder == SpecialFolder.MENU:
-                tree.children.pop(i)
-
-        self._stack = tree.children[::-1]
+        # Chrome doesn't export Menu bookmarks in the HTML export, they are filtered out of the
+        # stack instead of the tree, so the tree can still be exported to other formats.
+        stack = [
+            child for child in reversed(tree.children) if child.special_folder != SpecialFolder.MENU
+        ]
         body = []
 
-        while self._stack:
-            stack_item = self._stack.pop()
-            folder = self._iterate_folder_html(stack_item)
-            if not folder:
+        progress = current_progress()
+        while stack:
+            stack_item = stack.pop()
+            if isinstance(stack_item, str):
+                body.append(stack_item)
                 continue
+            progress.advance(len(stack_item.children))
+            body.append(self._iterate_folder_html(stack_item, stack))
 
-            self._create_placeholder(body, folder, stack_item)
-
-        self._stack = None
         return indent_html("".join([CHROME_HTML_HEADER, *body, footer]))
 
-    def _iterate_folder_html(self, node: Folder) -> str:
-        """Iterate through each item in the hierarchy tree and convert it to
-        HTML. If a folder has children, it is added to the stack and a
-        placeholder is left in its place, so it can be inserted back to its
-        position after processing."""
+    def _iterate_folder_html(self, node: Folder, stack: list[Folder | str]) -> str:
+        """Convert the folder to HTML, and push its content on the stack.
+        The children are pushed in reverse order (the urls already converted to HTML, the
+        folders as is) followed by the end of the folder, so popping the stack converts the
+        bookmarks in the order of the HTML document, without splicing the nested folders in."""
         if node.special_folder in (SpecialFolder.OTHER, SpecialFolder.MOBILE):
-            folder = []
+            folder_html = ""
             list_end = ""
         else:
-            folder = [self._folder_as_html(node), "<DL><p>\n"]
+            folder_html = self._folder_as_html(node) + "<DL><p>\n"
             list_end = "</DL><p>\n"
-
-        for child in node.children:
-            if isinstance(child, Folder):
-                item = f"<folder{child.id}>"
-                self._stack.append(child)
-            else:
-                item = self._url_as_html(child)
-            folder.append(item)
-        folder.append(list_end)
-        result = "".join(folder)
-        return result
-
-    @staticmethod
-    def _create_placeholder(body, folder, stack_item):
-        placeholder = f"<folder{stack_item.id}>"
-        if body and (placeholder in body[-1]):
-            body[-1] = body[-1].replace(placeholder, folder)
-        else:
-            body.append(folder)
+        stack.append(list_end)
+        for child in reversed(node.children):
+            stack.append(child if isinstance(child, Folder) else self._url_as_html(child))
+        return folder_html
 
     @staticmethod
     def _folder_as_html(folder: Bookmark | Folder) -> str:
@@ -127,17 +120,24 @@ class Chrome(Converter):
         url_html += f">{escape(url.title)}</A>\n"
         return url_html
 
+    @traced
     def from_html(self, filepath: Path) -> Bookmark:
         """Imports the HTML Bookmarks file as a Bookmark tree."""
-        soup = BeautifulSoup(
-            markup=format_html(filepath),
-            features="html.parser",
-            element_classes={Tag: HTMLBookmark},
-        )
+        # reset the counter before parsing, so the ids (and the deterministic guids derived
+        # from them) only depend on the content of the file.
         HTMLBookmark.reset_id_counter()
-        tree = soup.find("h3")
-        tree = self._restructure_root(tree)
-        tree = self._convert_html_to_bookmarks(tree)
+        markup = format_html(filepath)
+        with stage(STAGE_PARSE):
+            soup = BeautifulSoup(
+                markup=markup,
+                features="html.parser",
+                element_classes={Tag: HTMLBookmark},
+            )
+            del markup
+        with stage(STAGE_BUILD):
+            tree = soup.find("h3")
+            tree = self._restructure_root(tree)
+            tree = self._convert_html_to_bookmarks(tree)
         return tree
 
     @staticmethod
@@ -178,6 +178,7 @@ class Chrome(Converter):
 
         stack = [(root, tree.children)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
             children = folder.children
@@ -192,6 +193,7 @@ class Chrome(Converter):
                 else:
                     item = child._as_url(index=i)
                 children.append(item)
+            progress.advance(len(children))
         return root
 
     @staticmethod
@@ -205,6 +207,7 @@ class Chrome(Converter):
         if node.title == CHROME_BOOKMARK_OTHER_FOLDER_TITLE:
             return SpecialFolder.OTHER
 
+    @traced
     def as_json(self, tree: Bookmark) -> dict:
         """Convert a Bookmarks tree to JSON.
         Chrome supports three folders in the root of the bookmarks, those are:
@@ -221,24 +224,34 @@ class Chrome(Converter):
             if child.special_folder == SpecialFolder.MENU:
                 continue
             elif child.special_folder == SpecialFolder.TOOLBAR:
-                child.title = CHROME_BOOKMARK_BAR_FOLDER_TITLE
-                roots["bookmark_bar"] = self._iterate_folder_json(child)
+                roots["bookmark_bar"] = self._iterate_folder_json(
+                    child, CHROME_BOOKMARK_BAR_FOLDER_TITLE
+                )
             elif child.special_folder == SpecialFolder.OTHER:
-                child.title = CHROME_BOOKMARK_OTHER_FOLDER_TITLE
-                roots["other"] = self._iterate_folder_json(child)
+                roots["other"] = self._iterate_folder_json(
+                    child, CHROME_BOOKMARK_OTHER_FOLDER_TITLE
+                )
             elif child.special_folder == SpecialFolder.MOBILE:
-                child.title = CHROME_BOOKMARK_MOBILE_FOLDER_TITLE
-                roots["synced"] = self._iterate_folder_json(child)
+                roots["synced"] = self._iterate_folder_json(
+                    child, CHROME_BOOKMARK_MOBILE_FOLDER_TITLE
+                )
 
         result = {"roots": roots, "version": 1}
 
         return result
 
-    def _iterate_folder_json(self, folder: Folder) -> dict:
+    def _iterate_folder_json(self, folder: Folder, title: str | None = None) -> dict:
+        """Convert the folder and its content to JSON.
+        The title overrides the title of the folder in the output, without modifying the folder
+        itself."""
         bookmarks = self._folder_as_json(folder)
+        if title is not None:
+            bookmarks["name"] = title
         stack = [(bookmarks, folder)]
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
+            progress.advance(len(node.children))
             children = folder.get("children")
             for child in node.children:
                 if isinstance(child, Folder):
@@ -275,17 +288,27 @@ class Chrome(Converter):
             "url": url.url,
         }
 
-    def from_json(self, filepath: Path) -> Bookmark:
-        """Imports the JSON Bookmarks file as a Bookmark tree."""
-        with filepath.open(mode="r", encoding="utf-8") as file:
-            # use the object_hook to load the json tree as a Bookmark tree.
-            tree = json.load(file, object_hook=self._json_to_object)
-        self._add_index(tree)
+    @traced
+    def from_json(self, filepath: Path, favicons: Path | None = None) -> Bookmark:
+        """Imports the JSON Bookmarks file as a Bookmark tree.
+
+        The JSON Bookmarks file has no icons. If the path of the Favicons database of the Chrome
+        profile is given, the icons of the urls are read from it, see `add_favicons`."""
+        content = read_file(filepath)
+        # the Bookmark tree is built while parsing, by the object_hook.
+        with stage(STAGE_PARSE):
+            tree = json.loads(content, object_hook=self._json_to_object)
+            del content
+        with stage(STAGE_BUILD):
+            self._add_index(tree)
+            if favicons is not None:
+                add_favicons(tree, favicons)
         return tree
 
     @staticmethod
     def _json_to_object(jdict: dict):
         """Helper function used as object_hook for json load."""
+        current_progress().advance()
 
         # re-organize the root of the chrome bookmarks.
         if "bookmark_bar" in jdict or "other" in jdict or "synced" in jdict:
@@ -296,7 +319,7 @@ class Chrome(Converter):
                 special_folder=SpecialFolder.ROOT,
                 date_added=0,
                 children=list(jdict.values()),
-                guid=str(uuid4()),
+                guid=guids.uuid(SpecialFolder.ROOT.value),
                 date_modified=int(jdict.get("date_modified", 0)),
             )
 
@@ -310,14 +333,17 @@ class Chrome(Converter):
             return
 
         title = jdict.pop("name", None)
+        guid = jdict.pop("guid", None)
         kwargs = {
             "id": int(jdict.pop("id")),
             "index": jdict.pop("index", None),
             "title": title,
             "date_added": from_chrome_timestamp(int(jdict.pop("date_added", 0))),
             "date_modified": from_chrome_timestamp(int(jdict.pop("date_modified", 0))),
-            "guid": jdict.pop("guid", str(uuid4())),
         }
+        if guid is None:
+            guid = guids.uuid(kwargs["id"], kwargs["title"], kwargs["date_added"])
+        kwargs["guid"] = guid
 
         type_ = jdict.pop("type")
         if type_ == TYPE_FOLDER:
@@ -343,8 +369,10 @@ class Chrome(Converter):
     def _add_index(tree: Bookmark):
         """Add index to each Bookmark element from a json parsed file"""
         stack = [tree]
+        progress = current_progress()
         while stack:
             node = stack.pop()
+            progress.advance(len(node.children))
             for i, child in enumerate(node.children, 0):
                 child.index = i
                 if isinstance(child, Folder):
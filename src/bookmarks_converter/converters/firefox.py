@@ -1,16 +1,28 @@
 import json
-import random
-import string
 import time
 from enum import Enum
 from html import escape
 from pathlib import Path
-from uuid import uuid4
+from typing import Sequence
 
 from bs4 import BeautifulSoup, Tag
+from sqlalchemy import Row, text
+from sqlalchemy.exc import OperationalError
 
 from bookmarks_converter.converters.converter import Converter
+from bookmarks_converter.engines import MODE_IMMUTABLE, MODE_READ_ONLY, open_engine
 from bookmarks_converter.formats import Format
+from bookmarks_converter.guid import MOZILLA_GUID_LENGTH, guids
+from bookmarks_converter.instrumentation import (
+    COUNTER_BYTES_IN,
+    STAGE_BUILD,
+    STAGE_PARSE,
+    count,
+    current_progress,
+    observing,
+    stage,
+    traced,
+)
 from bookmarks_converter.models import (
     TYPE_FOLDER,
     Bookmark,
@@ -19,9 +31,15 @@ from bookmarks_converter.models import (
     SpecialFolder,
     Url,
 )
-from bookmarks_converter.util import format_html, indent_html
+from bookmarks_converter.places import (
+    PLACES_ROOT_ID,
+    PLACES_TAGS_FOLDER_GUID,
+    PLACES_TYPE_BOOKMARK,
+    PLACES_TYPE_FOLDER,
+    PlacesRows,
+)
+from bookmarks_converter.util import format_html, indent_html, read_file
 
-MOZILLA_GUID_LENGTH = 12
 MOZILLA_PLACE_CONST = "text/x-moz-place"
 MOZILLA_CONTAINER_CONST = "text/x-moz-place-container"
 MOZILLA_SEPARATOR_CONST = "text/x-moz-place-separator"
@@ -41,6 +59,24 @@ MOZILLA_OTHER_FOLDER_JSON_GUID = "unfiled_____"
 MOZILLA_MOBILE_FOLDER_JSON_TITLE = "mobile"
 MOZILLA_MOBILE_FOLDER_JSON_GUID = "mobile______"
 
+MOZILLA_SPECIAL_FOLDER_GUIDS = {
+    MOZILLA_ROOT_FOLDER_JSON_GUID: SpecialFolder.ROOT,
+    MOZILLA_MENU_FOLDER_JSON_GUID: SpecialFolder.MENU,
+    MOZILLA_TOOLBAR_FOLDER_JSON_GUID: SpecialFolder.TOOLBAR,
+    MOZILLA_OTHER_FOLDER_JSON_GUID: SpecialFolder.OTHER,
+    MOZILLA_MOBILE_FOLDER_JSON_GUID: SpecialFolder.MOBILE,
+}
+
+# all the bookmarks with the url of their place, in a single query. The rows are sorted by
+# position, so the children of each folder are appended in order while the tree is assembled.
+_PLACES_QUERY = """
+SELECT b.id, b.type, b.fk, b.parent, b.position, b.title, b.dateAdded, b.lastModified, b.guid,
+       p.url
+FROM moz_bookmarks AS b
+LEFT JOIN moz_places AS p ON p.id = b.fk
+ORDER BY b.parent, b.position
+"""
+
 MOZILLA_HTML_HEADER = """<!DOCTYPE NETSCAPE-Bookmark-file-1>
 <!-- This is an automatically generated file.
      It will be read and overwritten.
@@ -64,60 +100,48 @@ class FolderRoot(Enum):
 
 
 class Firefox(Converter):
-    formats = (Format.HTML, Format.JSON)
+    formats = (Format.HTML, Format.JSON, Format.PLACES)
 
+    @traced
     def as_html(self, tree: Bookmark) -> str:
         """Converts bookmark object tree to HTML."""
         footer = "</DL>\n"
 
-        # Firefox doesn't export mobile bookmarks in the HTML export.
-        for i, child in enumerate(tree.children):
-            if child.special_folder == SpecialFolder.MOBILE:
-                tree.children.pop(i)
-
-        self._stack = tree.children[::-1]
+        # Firefox doesn't export mobile bookmarks in the HTML export, they are filtered out of the
+        # stack instead of the tree, so the tree can still be exported to other formats.
+        stack = [
+            child
+            for child in reversed(tree.children)
+            if child.special_folder != SpecialFolder.MOBILE
+        ]
         body = []
 
-        while self._stack:
-            stack_item = self._stack.pop()
-            folder = self._iterate_folder_html(stack_item)
-            if not folder:
+        progress = current_progress()
+        while stack:
+            stack_item = stack.pop()
+            if isinstance(stack_item, str):
+                body.append(stack_item)
                 continue
+            progress.advance(len(stack_item.children))
+            body.append(self._iterate_folder_html(stack_item, stack))
 
-            self._create_placeholder(body, folder, stack_item)
-
-        self._stack = None
         return indent_html("".join([MOZILLA_HTML_HEADER, *body, footer]))
 
-    def _iterate_folder_html(self, node: Folder) -> str:
-        """Iterate through each item in the hierarchy tree and convert it to
-        HTML. If a folder has children, it is added to the stack and a
-        placeholder is left in its place, so it can be inserted back to its
-        position after processing."""
+    def _iterate_folder_html(self, node: Folder, stack: list[Folder | str]) -> str:
+        """Convert the folder to HTML, and push its content on the stack.
+        The children are pushed in reverse order (the urls already converted to HTML, the
+        folders as is) followed by the end of the folder, so popping the stack converts the
+        bookmarks in the order of the HTML document, without splicing the nested folders in."""
         if node.special_folder == SpecialFolder.MENU:
-            folder = []
+            folder_html = ""
             list_end = ""
         else:
-            folder = [self._folder_as_html(node), "<DL><p>\n"]
+            folder_html = self._folder_as_html(node) + "<DL><p>\n"
             list_end = "</DL><p>\n"
-        for child in node.children:
-            if isinstance(child, Folder):
-                item = f"<folder{child.id}>"
-                self._stack.append(child)
-            else:
-                item = self._url_as_html(child)
-            folder.append(item)
-        folder.append(list_end)
-        result = "".join(folder)
-        return result
-
-    @staticmethod
-    def _create_placeholder(body, folder, stack_item):
-        placeholder = f"<folder{stack_item.id}>"
-        if body and (placeholder in body[-1]):
-            body[-1] = body[-1].replace(placeholder, folder)
-        else:
-            body.append(folder)
+        stack.append(list_end)
+        for child in reversed(node.children):
+            stack.append(child if isinstance(child, Folder) else self._url_as_html(child))
+        return folder_html
 
     @staticmethod
     def _folder_as_html(folder: Bookmark | Folder) -> str:
@@ -153,17 +177,24 @@ class Firefox(Converter):
         url_html += f">{escape(url.title)}</A>\n"
         return url_html
 
+    @traced
     def from_html(self, filepath: Path) -> Bookmark:
         """Imports the HTML Bookmarks file as a Bookmark tree."""
-        soup = BeautifulSoup(
-            markup=format_html(filepath),
-            features="html.parser",
-            element_classes={Tag: HTMLBookmark},
-        )
+        # reset the counter before parsing, so the ids (and the deterministic guids derived
+        # from them) only depend on the content of the file.
         HTMLBookmark.reset_id_counter()
-        tree = soup.find("h3")
-        tree = self._restructure_root(tree)
-        tree = self._convert_html_to_bookmarks(tree)
+        markup = format_html(filepath)
+        with stage(STAGE_PARSE):
+            soup = BeautifulSoup(
+                markup=markup,
+                features="html.parser",
+                element_classes={Tag: HTMLBookmark},
+            )
+            del markup
+        with stage(STAGE_BUILD):
+            tree = soup.find("h3")
+            tree = self._restructure_root(tree)
+            tree = self._convert_html_to_bookmarks(tree)
         return tree
 
     @staticmethod
@@ -189,9 +220,10 @@ class Firefox(Converter):
             },
         )
         new_tree.children.append(tree)
+        # partition the children in a single pass, popping from the front of the list
+        # would make the restructuring quadratic in the number of top-level bookmarks.
         children = []
-        while tree.children:
-            child = tree.children.pop(0)
+        for child in tree.children:
             if (
                 MOZILLA_TOOLBAR_FOLDER_HTML_FLAG.lower() in child.attrs
                 or MOZILLA_OTHER_FOLDER_HTML_FLAG.lower() in child.attrs
@@ -200,7 +232,7 @@ class Firefox(Converter):
             else:
                 children.append(child)
 
-        tree.children.extend(children)
+        tree.children[:] = children
         return new_tree
 
     def _convert_html_to_bookmarks(self, tree: HTMLBookmark) -> Bookmark:
@@ -211,6 +243,7 @@ class Firefox(Converter):
 
         stack = [(root, tree.children)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
             children = folder.children
@@ -225,6 +258,7 @@ class Firefox(Converter):
                 else:
                     item = child._as_url(index=i)
                 children.append(item)
+            progress.advance(len(children))
         return root
 
     @staticmethod
@@ -244,13 +278,16 @@ class Firefox(Converter):
         ):
             return SpecialFolder.OTHER
 
+    @traced
     def as_json(self, tree: Bookmark) -> dict:
         """Convert a Bookmarks tree to JSON."""
         bookmarks = self._folder_as_json(tree)
         stack = [(bookmarks, tree)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
+            progress.advance(len(node.children))
             children = folder.get("children")
             for child in node.children:
                 if isinstance(child, Folder):
@@ -265,7 +302,9 @@ class Firefox(Converter):
 
     def _folder_as_json(self, folder: Bookmark | Folder) -> dict:
         folder_json = {
-            "guid": self._ensure_mozilla_guid(folder.guid),
+            "guid": self._ensure_mozilla_guid(
+                folder.guid, folder.id, folder.title, folder.date_added
+            ),
             "title": folder.title,
             "index": folder.index,
             "dateAdded": folder.date_added,
@@ -301,7 +340,7 @@ class Firefox(Converter):
 
     def _url_as_json(self, url: Bookmark | Url) -> dict:
         url_json = {
-            "guid": self._ensure_mozilla_guid(url.guid),
+            "guid": self._ensure_mozilla_guid(url.guid, url.id, url.url, url.date_added),
             "title": url.title,
             "index": url.index,
             "dateAdded": url.date_added,
@@ -319,25 +358,24 @@ class Firefox(Converter):
         return url_json
 
     @staticmethod
-    def _ensure_mozilla_guid(guid: str) -> str:
-        """Ensure that the guid follows the mozilla firefox guid spec.
+    def _ensure_mozilla_guid(guid: str, *content) -> str:
+        """Ensure that the guid follows the mozilla firefox guid spec, the content is used to
+        derive the replacement guid in deterministic mode.
         The code for the guid generation in the firefox source code can be found in:
         - /services/sync/modules/util.sys.mjs `makeGUID()`
         - https://searchfox.org/mozilla-central/source/services/sync/modules/util.sys.mjs#204
         """
-        if len(guid) == MOZILLA_GUID_LENGTH:
-            return guid
-
-        return "".join(
-            random.choice(string.ascii_letters + string.digits + "-_")
-            for _ in range(MOZILLA_GUID_LENGTH)
-        )
+        return guids.ensure_mozilla_guid(guid, *content)
 
+    @traced
     def from_json(self, filepath: Path) -> Bookmark:
         """Imports the JSON Bookmarks file as a Bookmark tree."""
-        with filepath.open("r", encoding="utf-8") as file:
-            # use the object_hook to load the json tree as a Bookmark tree.
-            tree = self._json_to_object(json.load(file))
+        content = read_file(filepath)
+        with stage(STAGE_PARSE):
+            tree = json.loads(content)
+            del content
+        with stage(STAGE_BUILD):
+            tree = self._json_to_object(tree)
         return tree
 
     def _json_to_object(self, jdict: dict) -> Bookmark:
@@ -345,6 +383,7 @@ class Firefox(Converter):
         bookmarks = self._json_as_folder(jdict)
         stack = [(bookmarks, jdict)]
 
+        progress = current_progress()
         while stack:
             folder, node = stack.pop()
             children = folder.children
@@ -359,20 +398,24 @@ class Firefox(Converter):
                     continue
 
                 children.append(item)
+            progress.advance(len(children))
 
         return bookmarks
 
     @staticmethod
     def _json_as_folder(jdict: dict) -> Folder:
+        guid = jdict.pop("guid", None)
         kwargs = {
             "id": int(jdict.pop("id")),
             "index": jdict.pop("index"),
             "title": jdict.pop("title", None),
             "date_added": int(jdict.pop("dateAdded", 0)),
             "date_modified": int(jdict.pop("lastModified", 0)),
-            "guid": jdict.pop("guid", str(uuid4())),
             "children": [],
         }
+        if guid is None:
+            guid = guids.uuid(kwargs["id"], kwargs["title"], kwargs["date_added"])
+        kwargs["guid"] = guid
         special_folder = jdict.pop("root", "")
         if special_folder:
             kwargs["special_folder"] = FolderRoot[special_folder].value
@@ -381,17 +424,147 @@ class Firefox(Converter):
 
     @staticmethod
     def _json_as_url(jdict: dict) -> Url:
+        guid = jdict.pop("guid", None)
         kwargs = {
             "id": int(jdict.pop("id")),
             "index": jdict.pop("index"),
             "title": jdict.pop("title", None),
             "date_added": int(jdict.pop("dateAdded", 0)),
             "date_modified": int(jdict.pop("lastModified", 0)),
-            "guid": jdict.pop("guid", str(uuid4())),
             "url": jdict.pop("uri"),
             "icon": jdict.pop("icon", ""),
             "icon_uri": jdict.pop("iconuri", ""),
             "tags": jdict.pop("tags", []),
         }
+        if guid is None:
+            guid = guids.uuid(kwargs["id"], kwargs["url"], kwargs["date_added"])
+        kwargs["guid"] = guid
 
         return Url(**kwargs)
+
+    @traced
+    def as_places(self, tree: Bookmark) -> PlacesRows:
+        """Convert a Bookmarks tree to the rows of the tables of a Firefox places.sqlite."""
+        rows = PlacesRows()
+        # the root of the tree is the places root, any other folder is added to the unfiled folder.
+        root_id = self._folder_as_places(rows, tree, PLACES_ROOT_ID)
+        # the bookmarks are added in pre-order, like firefox numbers the bookmarks it creates.
+        stack = [(child, root_id) for child in reversed(tree.children)]
+
+        progress = current_progress()
+        progress.advance(len(tree.children))
+        while stack:
+            node, parent_id = stack.pop()
+            if isinstance(node, Folder):
+                folder_id = self._folder_as_places(rows, node, parent_id)
+                stack.extend((child, folder_id) for child in reversed(node.children))
+                progress.advance(len(node.children))
+            else:
+                self._url_as_places(rows, node, parent_id)
+
+        return rows
+
+    def _folder_as_places(self, rows: PlacesRows, folder: Folder, parent_id: int) -> int:
+        guid = self._ensure_mozilla_guid(folder.guid, folder.id, folder.title, folder.date_added)
+        return rows.add_folder(folder, guid, parent_id)
+
+    def _url_as_places(self, rows: PlacesRows, url: Url, parent_id: int) -> int:
+        guid = self._ensure_mozilla_guid(url.guid, url.id, url.url, url.date_added)
+        return rows.add_url(url, guid, parent_id)
+
+    @traced
+    def from_places(self, filepath: Path) -> Bookmark:
+        """Imports the bookmarks of a Firefox profile database (places.sqlite) as a Bookmark
+        tree. The database is only read, so the places.sqlite of a running Firefox can be
+        imported. The tags of the urls are read from the tags folder, which isn't part of the
+        tree, and the icons (stored in favicons.sqlite) are not imported."""
+        with stage(STAGE_PARSE):
+            rows = self._read_places(filepath)
+            if observing():
+                count(COUNTER_BYTES_IN, filepath.stat().st_size)
+        with stage(STAGE_BUILD):
+            tree = self._places_to_object(rows)
+        return tree
+
+    def _read_places(self, filepath: Path) -> Sequence[Row]:
+        """Read all the bookmarks of places.sqlite. A running Firefox holds an exclusive lock on
+        the database, which is then opened as immutable, without locking it (the changes not
+        yet checkpointed from the write-ahead log are not read)."""
+        for mode in (MODE_READ_ONLY, MODE_IMMUTABLE):
+            try:
+                with open_engine(filepath, mode) as engine, engine.connect() as connection:
+                    return connection.execute(text(_PLACES_QUERY)).all()
+            except OperationalError as e:
+                if mode == MODE_IMMUTABLE or "locked" not in str(e.orig):
+                    raise
+
+    def _places_to_object(self, rows: Sequence[Row]) -> Bookmark:
+        """Assemble the Bookmark tree from the rows of the bookmarks, in linear time."""
+        folder_rows = {row.id: row for row in rows if row.type == PLACES_TYPE_FOLDER}
+        tags_folder_id = next(
+            (row.id for row in folder_rows.values() if row.guid == PLACES_TAGS_FOLDER_GUID),
+            None,
+        )
+
+        root = None
+        folders = {}
+        children = {}
+        tags = {}
+        urls = []
+        for row in rows:
+            if tags_folder_id is not None:
+                if tags_folder_id in (row.id, row.parent):
+                    continue
+                # the tags are folders of the tags folder, with a bookmark of each tagged place.
+                tag_folder = folder_rows.get(row.parent)
+                if tag_folder is not None and tag_folder.parent == tags_folder_id:
+                    tags.setdefault(row.fk, []).append(tag_folder.title)
+                    continue
+
+            if row.type == PLACES_TYPE_FOLDER:
+                item = self._places_as_folder(row)
+                folders[row.id] = item
+                if item.special_folder == SpecialFolder.ROOT:
+                    root = item
+                    continue
+            elif row.type == PLACES_TYPE_BOOKMARK:
+                item = self._places_as_url(row)
+                urls.append((item, row.fk))
+            else:
+                continue
+            children.setdefault(row.parent, []).append(item)
+
+        if root is None:
+            raise ValueError("The places database has no root folder.")
+        for url, place_id in urls:
+            url.tags = list(tags.get(place_id, ()))
+
+        progress = current_progress()
+        for folder_id, folder in folders.items():
+            folder.children = children.get(folder_id, [])
+            progress.advance(len(folder.children))
+        return root
+
+    @staticmethod
+    def _places_as_folder(row: Row) -> Folder:
+        return Folder(
+            id=row.id,
+            guid=row.guid,
+            index=row.position,
+            title=row.title or "",
+            date_added=row.dateAdded or 0,
+            date_modified=row.lastModified or 0,
+            special_folder=MOZILLA_SPECIAL_FOLDER_GUIDS.get(row.guid),
+        )
+
+    @staticmethod
+    def _places_as_url(row: Row) -> Url:
+        return Url(
+            id=row.id,
+            guid=row.guid,
+            index=row.position,
+            title=row.title or "",
+            date_added=row.dateAdded or 0,
+            date_modified=row.lastModified or 0,
+            url=row.url,
+        )
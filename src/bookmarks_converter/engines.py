@@ -0,0 +1,163 @@
+"""SQLAlchemy engines of the sqlite3 DB files, reused across the conversions of a batch.
+
+All the DB files are opened with `open_engine`. Outside of an `EngineCache`, each call creates a
+new engine and disposes it when the block exits, so no connection outlives the import or export
+that opened it. Inside a `with EngineCache():` block, the engines are created once per path and
+mode and reused by all the conversions of the block, which keeps their connections and compiled
+statements. At most `max_engines` engines are kept, the least recently used ones are disposed,
+so batch jobs over thousands of DB files keep a bounded number of open files. All the engines
+are disposed when the block exits.
+
+A file replaced or deleted and re-created by another process (or by `save_db`) is detected from
+its inode, and the connections to the previous file are closed before the engine is reused.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy import Engine, create_engine
+
+from bookmarks_converter.cache import CacheStats
+
+ENGINE_CACHE_DEFAULT_MAX_ENGINES = 32
+
+# the DB is opened for reading and writing, and created if it doesn't exist.
+MODE_READ_WRITE = "rw"
+# the DB is only read, opening it read-only also keeps a reader from creating a missing DB.
+MODE_READ_ONLY = "ro"
+# the DB is read without any lock, for the databases locked by a running browser (the changes
+# not yet checkpointed from the write-ahead log are not read).
+MODE_IMMUTABLE = "immutable"
+
+_URI_PARAMETERS = {
+    MODE_READ_ONLY: "mode=ro",
+    MODE_IMMUTABLE: "mode=ro&immutable=1",
+}
+
+# the caches of the enclosing `with EngineCache()` blocks, innermost last. A context variable,
+# so a thread only uses the caches it entered, or the ones of the context it was given (the
+# writer threads of formats.save_many share the engines of the caller).
+_caches: ContextVar[tuple["EngineCache", ...]] = ContextVar("engine_caches", default=())
+
+
+def database_url(filepath: Path, mode: str = MODE_READ_WRITE) -> str:
+    """The SQLAlchemy url of the sqlite3 DB file, opened in the mode."""
+    path = Path(filepath).resolve()
+    if mode == MODE_READ_WRITE:
+        return f"sqlite:///{path}"
+    return f"sqlite:///{path.as_uri()}?{_URI_PARAMETERS[mode]}&uri=true"
+
+
+def _file_identity(path: Path) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+class EngineCache:
+    """Engines of the sqlite3 DB files, keyed by path and mode.
+
+    Used as a context manager, the cache is the one used by `open_engine` in the block (and in
+    the threads running a copy of its context) until the block exits, then all its engines are
+    disposed.
+
+    max_engines: int
+        maximum number of engines kept, each engine keeps its connections to its DB open.
+    """
+
+    def __init__(self, max_engines: int = ENGINE_CACHE_DEFAULT_MAX_ENGINES):
+        if max_engines < 1:
+            raise ValueError("max_engines must be at least 1.")
+        self.max_engines = max_engines
+        self.stats = CacheStats()
+        # (path, mode) -> [engine, identity of the file the connections were opened on]
+        self._engines: OrderedDict[tuple[str, str], list] = OrderedDict()
+        self._lock = threading.Lock()
+        self._tokens: list[Token] = []
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+    def __enter__(self):
+        self._tokens.append(_caches.set(_caches.get() + (self,)))
+        return self
+
+    def __exit__(self, *exc_info):
+        _caches.reset(self._tokens.pop())
+        self.close()
+
+    def engine(self, filepath: Path, mode: str = MODE_READ_WRITE) -> Engine:
+        """The engine of the DB file in the mode, created on first use."""
+        path = Path(filepath).resolve()
+        key = (str(path), mode)
+        identity = _file_identity(path)
+        with self._lock:
+            entry = self._engines.get(key)
+            if entry is not None:
+                self._engines.move_to_end(key)
+                self.stats.hits += 1
+                if entry[1] != identity:
+                    # the file was replaced, the pooled connections still read the previous one.
+                    entry[0].dispose()
+                    entry[1] = identity
+                return entry[0]
+
+            self.stats.misses += 1
+            engine = create_engine(database_url(path, mode))
+            self._engines[key] = [engine, identity]
+            while len(self._engines) > self.max_engines:
+                _, (evicted, _) = self._engines.popitem(last=False)
+                evicted.dispose()
+                self.stats.evictions += 1
+            return engine
+
+    def release(self, filepath: Path):
+        """Dispose and forget the engines of the DB file, in all the modes. Called before the
+        file is replaced or deleted."""
+        path = str(Path(filepath).resolve())
+        with self._lock:
+            for key in [key for key in self._engines if key[0] == path]:
+                engine, _ = self._engines.pop(key)
+                engine.dispose()
+
+    def close(self):
+        """Dispose all the engines, closing their connections."""
+        with self._lock:
+            engines = [engine for engine, _ in self._engines.values()]
+            self._engines.clear()
+        for engine in engines:
+            engine.dispose()
+
+
+def current_engines() -> EngineCache | None:
+    """The cache of the innermost `with EngineCache()` block, or None outside of any block."""
+    caches = _caches.get()
+    return caches[-1] if caches else None
+
+
+@contextmanager
+def open_engine(filepath: Path, mode: str = MODE_READ_WRITE) -> Iterator[Engine]:
+    """Open an engine of the sqlite3 DB file in the mode. The engine of the current EngineCache
+    is reused, otherwise a new engine is created and disposed when the block exits."""
+    cache = current_engines()
+    if cache is not None:
+        yield cache.engine(filepath, mode)
+        return
+    engine = create_engine(database_url(filepath, mode))
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def release_engines(filepath: Path):
+    """Dispose the engines of the DB file in the open EngineCaches, if any."""
+    for cache in _caches.get():
+        cache.release(filepath)
@@ -0,0 +1,268 @@
+"""Icons of the urls of Chrome bookmarks, from the Favicons database of the Chrome profile.
+
+The JSON Bookmarks file of Chrome has no icons, they are stored in the `Favicons` SQLite database
+next to it: `icon_mapping` maps the page urls to their icons, `favicons` holds the url of each
+icon, and `favicon_bitmaps` its bitmaps in one or more sizes. `add_favicons` looks up the icons
+of all the urls of a tree with a single joined query, passing the urls as one JSON array, and
+attaches the smallest bitmap of each url as a data URI.
+
+The database is opened read-only, and as immutable if Chrome is running and holds its lock.
+Encoding the bitmaps is most of the work, so the encoded icons are kept in a `FaviconCache`,
+keyed by the database and the bitmap, and only the bitmaps that are new or were updated since
+the previous export are read again. Given a directory, the cache keeps the icons of each database
+in a file, so they are reused by the following processes too (ex. the `--cache-dir` of the cli).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import OperationalError
+
+from bookmarks_converter.cache import CacheStats
+from bookmarks_converter.engines import MODE_IMMUTABLE, MODE_READ_ONLY, open_engine
+from bookmarks_converter.icons import data_uri
+from bookmarks_converter.models import Bookmark, Folder, Url
+
+FAVICON_CACHE_DEFAULT_MAX_SIZE = 100_000
+FAVICON_CACHE_FILE_SUFFIX = ".favicons"
+# the icon_type of the favicons, the other types are the touch icons and the web manifest icons.
+FAVICON_TYPE_FAVICON = 1
+FAVICON_DEFAULT_MIME_TYPE = "image/png"
+
+_MIME_TYPES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"\x00\x00\x01\x00", "image/x-icon"),
+)
+
+# the bitmaps of the icons of the page urls, the favicons first and the smallest first.
+_FAVICONS_QUERY = text(
+    """
+    SELECT icon_mapping.page_url, favicons.url AS icon_url, favicon_bitmaps.id,
+        favicon_bitmaps.last_updated
+    FROM icon_mapping
+    JOIN favicons ON favicons.id = icon_mapping.icon_id
+    JOIN favicon_bitmaps ON favicon_bitmaps.icon_id = favicons.id
+    WHERE icon_mapping.page_url IN (SELECT value FROM json_each(:urls))
+        AND length(favicon_bitmaps.image_data) > 0
+    ORDER BY icon_mapping.page_url, favicons.icon_type != :favicon_type,
+        favicon_bitmaps.width, favicon_bitmaps.id
+    """
+)
+_BITMAPS_QUERY = text(
+    "SELECT id, image_data FROM favicon_bitmaps WHERE id IN (SELECT value FROM json_each(:ids))"
+)
+
+
+def _mime_type(data: bytes) -> str:
+    for signature, mime_type in _MIME_TYPES:
+        if data.startswith(signature):
+            return mime_type
+    return FAVICON_DEFAULT_MIME_TYPE
+
+
+class FaviconCache:
+    """Cache of the icons read from Favicons databases, as data URIs.
+
+    The entries are keyed by the path of the database and the id of the bitmap, and hold the
+    last_updated time of the bitmap, so an icon that changed since it was cached is read again.
+    When the cache holds more than `max_size` icons, the least recently used ones are evicted.
+
+    The icons are kept in memory, and if a directory is given, the icons of each database are
+    also stored in a file of the directory: `load` reads them before the database is first
+    looked up, and `save` writes them back once new icons were added. The cache can be shared
+    by threads.
+
+    max_size: int
+        maximum number of icons in the cache.
+    directory: Path | None
+        the folder the icons are stored in, created if it doesn't exist.
+    """
+
+    def __init__(
+        self, max_size: int = FAVICON_CACHE_DEFAULT_MAX_SIZE, directory: Path | None = None
+    ):
+        self.max_size = max_size
+        self.directory = Path(directory) if directory is not None else None
+        self.stats = CacheStats()
+        self._icons = OrderedDict()
+        # the databases whose file was read, and the ones with icons not written to their file.
+        self._loaded = set()
+        self._changed = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._icons)
+
+    def get(self, database: str, bitmap_id: int, last_updated: int) -> str | None:
+        key = (database, bitmap_id)
+        with self._lock:
+            entry = self._icons.get(key)
+            if entry is None or entry[0] != last_updated:
+                self.stats.misses += 1
+                return None
+            self._icons.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def put(self, database: str, bitmap_id: int, last_updated: int, icon: str):
+        with self._lock:
+            self._put(database, bitmap_id, last_updated, icon)
+            self._changed.add(database)
+
+    def _put(self, database: str, bitmap_id: int, last_updated: int, icon: str):
+        key = (database, bitmap_id)
+        self._icons[key] = (last_updated, icon)
+        self._icons.move_to_end(key)
+        while len(self._icons) > self.max_size:
+            self._icons.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _entry_path(self, database: str) -> Path:
+        digest = hashlib.sha256(database.encode("utf-8")).hexdigest()
+        return self.directory.joinpath(f"{digest}{FAVICON_CACHE_FILE_SUFFIX}")
+
+    def load(self, database: str):
+        """Read the stored icons of the database, once. A file which can't be decoded is
+        removed, its icons are read from the database again."""
+        with self._lock:
+            if self.directory is None or database in self._loaded:
+                return
+            self._loaded.add(database)
+            entry = self._entry_path(database)
+            try:
+                icons = json.loads(entry.read_bytes())
+                # the icons cached since the file was written are newer.
+                icons = [
+                    (int(bitmap_id), last_updated, icon)
+                    for bitmap_id, (last_updated, icon) in icons.items()
+                    if (database, int(bitmap_id)) not in self._icons
+                ]
+            except FileNotFoundError:
+                return
+            except (AttributeError, ValueError, TypeError):
+                entry.unlink(missing_ok=True)
+                self.stats.errors += 1
+                return
+            for bitmap_id, last_updated, icon in icons:
+                self._put(database, bitmap_id, last_updated, icon)
+
+    def save(self, database: str):
+        """Write the icons of the database to its file, if icons were added since it was read."""
+        with self._lock:
+            if self.directory is None or database not in self._changed:
+                return
+            self._changed.discard(database)
+            icons = {
+                bitmap_id: entry
+                for (entry_database, bitmap_id), entry in self._icons.items()
+                if entry_database == database
+            }
+            self.directory.mkdir(parents=True, exist_ok=True)
+            entry = self._entry_path(database)
+            # write to a temporary file first, so concurrent readers never see a partial file.
+            temp = entry.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            temp.write_text(json.dumps(icons, separators=(",", ":")), encoding="utf-8")
+            temp.replace(entry)
+
+    def clear(self):
+        """Remove all the icons, and their files."""
+        with self._lock:
+            self._icons.clear()
+            self._loaded.clear()
+            self._changed.clear()
+            if self.directory is not None:
+                for entry in self.directory.glob(f"*{FAVICON_CACHE_FILE_SUFFIX}"):
+                    entry.unlink(missing_ok=True)
+
+
+# shared by the conversions of the process, so the repeated exports of a profile reuse the icons.
+favicon_cache = FaviconCache()
+
+
+def _urls(tree: Bookmark) -> list[Url]:
+    urls = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Folder):
+            stack.extend(node.children)
+        elif isinstance(node, Url) and not node.icon:
+            urls.append(node)
+    return urls
+
+
+def _load_icons(
+    connection: Connection, database: str, page_urls: list[str], cache: FaviconCache
+) -> dict[str, tuple[str, str]]:
+    """Load the icons of the page urls, as (data URI, icon url) by page url."""
+    rows = connection.execute(
+        _FAVICONS_QUERY,
+        {"urls": json.dumps(page_urls), "favicon_type": FAVICON_TYPE_FAVICON},
+    )
+    bitmaps = {}
+    for page_url, icon_url, bitmap_id, last_updated in rows:
+        # the first bitmap of each page is the best one.
+        bitmaps.setdefault(page_url, (icon_url, bitmap_id, last_updated))
+
+    encoded = {}
+    missing = {}
+    for _, bitmap_id, last_updated in bitmaps.values():
+        if bitmap_id in encoded or bitmap_id in missing:
+            continue
+        icon = cache.get(database, bitmap_id, last_updated)
+        if icon is None:
+            missing[bitmap_id] = last_updated
+        else:
+            encoded[bitmap_id] = icon
+    if missing:
+        rows = connection.execute(_BITMAPS_QUERY, {"ids": json.dumps(list(missing))})
+        for bitmap_id, data in rows:
+            icon = data_uri(_mime_type(data), data)
+            cache.put(database, bitmap_id, missing[bitmap_id], icon)
+            encoded[bitmap_id] = icon
+    return {
+        page_url: (encoded[bitmap_id], icon_url)
+        for page_url, (icon_url, bitmap_id, _) in bitmaps.items()
+    }
+
+
+def add_favicons(tree: Bookmark, filepath: Path, cache: FaviconCache | None = None) -> int:
+    """Set the icon of the urls of the tree without one, from the Chrome Favicons database.
+    The icon_uri of the urls is set to the url of their icon if they have none.
+    Returns the number of urls with a new icon."""
+    if cache is None:
+        cache = favicon_cache
+    urls = _urls(tree)
+    if not urls:
+        return 0
+    page_urls = sorted({url.url for url in urls if url.url})
+    database = str(Path(filepath).resolve())
+    cache.load(database)
+    # a running Chrome holds an exclusive lock on the database, which is then read as immutable.
+    for mode in (MODE_READ_ONLY, MODE_IMMUTABLE):
+        try:
+            with open_engine(filepath, mode) as engine, engine.connect() as connection:
+                icons = _load_icons(connection, database, page_urls, cache)
+            break
+        except OperationalError as error:
+            if mode == MODE_IMMUTABLE or "locked" not in str(error.orig):
+                raise
+    cache.save(database)
+
+    added = 0
+    for url in urls:
+        icon = icons.get(url.url)
+        if icon is None:
+            continue
+        url.icon = icon[0]
+        if not url.icon_uri:
+            url.icon_uri = icon[1]
+        added += 1
+    return added
@@ -1,20 +1,54 @@
+import contextvars
+import hashlib
 import json
+import os
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from enum import StrEnum
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
 
+from bookmarks_converter.cache import ParseCache
 from bookmarks_converter.converters.converter import Converter
-from bookmarks_converter.models import Base, Bookmark, DBBookmark
+from bookmarks_converter.engines import open_engine, release_engines
+from bookmarks_converter.icons import extract_icons
+from bookmarks_converter.instrumentation import (
+    COUNTER_BYTES_IN,
+    COUNTER_BYTES_OUT,
+    COUNTER_NODES,
+    STAGE_SERIALIZE,
+    STAGE_WRITE,
+    count,
+    observing,
+    stage,
+    traced,
+)
+from bookmarks_converter.models import (
+    Base,
+    Bookmark,
+    DBBookmark,
+    DBBookmarkTag,
+    DBIcon,
+    DBTag,
+    Folder,
+)
+from bookmarks_converter.places import PlacesRows, create_places_tables, write_places
+from bookmarks_converter.search import create_search_index
+from bookmarks_converter.tags import extract_tags
+
+DIGEST_SUFFIX = ".sha256"
 
 
 class Format(StrEnum):
     DB = "db"
     HTML = "html"
     JSON = "json"
+    PLACES = "places"
 
     def __repr__(self) -> str:
         return f"'{self.value}'"
@@ -27,80 +61,354 @@ class BaseFormat:
     def __init__(self, extension: Format):
         self.extension = extension
 
-    def load(self, converter: Converter, path: Path) -> Bookmark:
+    def load(self, converter: Converter, path: Path, cache: ParseCache | None = None) -> Bookmark:
+        """Load the bookmarks file as a Bookmark tree.
+        If a cache is provided, the tree is reused from the cache when the same file has
+        already been loaded with the same converter and format."""
+        if cache is None:
+            tree = self._load(converter, path)
+        else:
+            key = cache.key(converter, self.extension, path)
+            tree = cache.get(key)
+            if tree is None:
+                tree = self._load(converter, path)
+                cache.put(key, tree)
+            elif observing():
+                # the file was read to compute its key, rather than by the read stage.
+                count(COUNTER_BYTES_IN, path.stat().st_size)
+
+        if observing():
+            count(COUNTER_NODES, _count_nodes(tree))
+        return tree
+
+    def _load(self, converter: Converter, path: Path) -> Bookmark:
         raise NotImplementedError
 
-    def save(self, converter: Converter, bookmarks: Bookmark, path: Path):
+    def save(
+        self, converter: Converter, bookmarks: Bookmark, path: Path, skip_unchanged: bool = False
+    ) -> bool:
+        """Save the Bookmark tree to the bookmarks file.
+        If skip_unchanged is set, the file is only replaced when its content changed.
+        Returns whether the file was written."""
+        written = self._save(converter, bookmarks, path, skip_unchanged)
+        if written and observing():
+            count(COUNTER_BYTES_OUT, path.stat().st_size)
+        return written
+
+    def _save(
+        self, converter: Converter, bookmarks: Bookmark, path: Path, skip_unchanged: bool
+    ) -> bool:
         raise NotImplementedError
 
 
 class DBFormat(BaseFormat):
-    def load(self, converter: Converter, path: Path) -> Bookmark:
+    def __init__(self, extension: Format, search_index: bool = False, icon_table: bool = False):
+        super().__init__(extension)
+        # add a full-text search index to the saved DBs (see search.py).
+        self.search_index = search_index
+        # store the icons once per distinct icon in the saved DBs (see icons.py).
+        self.icon_table = icon_table
+
+    def _load(self, converter: Converter, path: Path) -> Bookmark:
         return converter.from_db(path)
 
-    def save(self, converter: Converter, bookmarks: Bookmark, path: Path):
-        result = converter.as_db(bookmarks)
-        save_db(result, path)
+    def _save(
+        self, converter: Converter, bookmarks: Bookmark, path: Path, skip_unchanged: bool
+    ) -> bool:
+        with stage(STAGE_SERIALIZE):
+            result = converter.as_db(bookmarks)
+        with stage(STAGE_WRITE):
+            return save_db(result, path, skip_unchanged, self.search_index, self.icon_table)
 
 
 class HTMLFormat(BaseFormat):
-    def load(self, converter: Converter, path: Path) -> Bookmark:
+    def _load(self, converter: Converter, path: Path) -> Bookmark:
         return converter.from_html(path)
 
-    def save(self, converter: Converter, bookmarks: Bookmark, path: Path):
-        result = converter.as_html(bookmarks)
-        save_html(result, path)
+    def _save(
+        self, converter: Converter, bookmarks: Bookmark, path: Path, skip_unchanged: bool
+    ) -> bool:
+        with stage(STAGE_SERIALIZE):
+            result = converter.as_html(bookmarks)
+        with stage(STAGE_WRITE):
+            return save_html(result, path, skip_unchanged)
 
 
 class JSONFormat(BaseFormat):
-    def load(self, converter: Converter, path: Path) -> Bookmark:
+    def _load(self, converter: Converter, path: Path) -> Bookmark:
         return converter.from_json(path)
 
-    def save(self, converter: Converter, bookmarks: Bookmark, path: Path):
-        result = converter.as_json(bookmarks)
-        save_json(result, path)
+    def _save(
+        self, converter: Converter, bookmarks: Bookmark, path: Path, skip_unchanged: bool
+    ) -> bool:
+        with stage(STAGE_SERIALIZE):
+            result = converter.as_json(bookmarks)
+        with stage(STAGE_WRITE):
+            return save_json(result, path, skip_unchanged)
+
+
+class PlacesFormat(BaseFormat):
+    def _load(self, converter: Converter, path: Path) -> Bookmark:
+        return converter.from_places(path)
+
+    def _save(
+        self, converter: Converter, bookmarks: Bookmark, path: Path, skip_unchanged: bool
+    ) -> bool:
+        with stage(STAGE_SERIALIZE):
+            result = converter.as_places(bookmarks)
+        with stage(STAGE_WRITE):
+            return save_places(result, path, skip_unchanged)
 
 
 FORMATS = {
     Format.DB: DBFormat(Format.DB),
     Format.HTML: HTMLFormat(Format.HTML),
     Format.JSON: JSONFormat(Format.JSON),
+    Format.PLACES: PlacesFormat(Format.PLACES),
 }
 
 
-def _new_file_name(path: Path, extension: Format) -> Path:
+def _new_file_name(path: Path, extension: Format, converter_name: str | None = None) -> Path:
     now = datetime.now().strftime("%Y%m%d-%H%M%S")
+    if converter_name:
+        return path.joinpath(f"bookmarks-{now}-{converter_name}.{extension}")
     return path.joinpath(f"bookmarks-{now}.{extension}")
 
 
+def save_many(
+    bookmarks: Bookmark,
+    outputs: Iterable[tuple[Converter, BaseFormat, Path]],
+    skip_unchanged: bool = False,
+    max_workers: int | None = None,
+) -> list[bool]:
+    """Save a single Bookmark tree to several outputs, with the writers running concurrently
+    on threads. The `as_*` methods of the converters don't modify the tree, so it is shared by
+    all the writers without being copied.
+    Returns whether each of the output files was written."""
+    outputs = list(outputs)
+    # no need for threads with a single output.
+    if len(outputs) == 1:
+        ((converter, format_, path),) = outputs
+        return [format_.save(converter, bookmarks, path, skip_unchanged)]
+
+    # the writers run in a copy of the caller's context, which holds its guid mode, its
+    # EngineCache and its stage observers.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                format_.save,
+                converter,
+                bookmarks,
+                path,
+                skip_unchanged,
+            )
+            for converter, format_, path in outputs
+        ]
+        return [future.result() for future in futures]
+
+
+def _count_nodes(tree: Bookmark) -> int:
+    """Count the bookmarks (urls and folders) of the tree, including its root."""
+    nodes = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        if isinstance(node, Folder):
+            stack.extend(node.children)
+    return nodes
+
+
 def _ensure_path_exists(path: Path):
     path.parent.mkdir(parents=True, exist_ok=True)
 
 
-def save_db(bookmarks: DBBookmark, filepath: Path):
+def _digest_path(filepath: Path) -> Path:
+    """Path of the sidecar file holding the digest of the content of filepath."""
+    return filepath.with_name(f"{filepath.name}{DIGEST_SUFFIX}")
+
+
+def _file_digest(filepath: Path) -> str | None:
+    """Return the sha256 digest of the file, read from its sidecar digest file when the size and
+    the modification time of the file are the ones recorded with the digest. Returns None if the
+    file doesn't exist."""
+    try:
+        file_stat = filepath.stat()
+    except FileNotFoundError:
+        return None
+
+    # the modification time alone isn't enough: it is coarse on some filesystems (ex. FAT, or
+    # network mounts), and a file edited within the same tick keeps it.
+    try:
+        digest, size, mtime = _digest_path(filepath).read_text(encoding="utf-8").split()
+        if (int(size), int(mtime)) == (file_stat.st_size, file_stat.st_mtime_ns):
+            return digest
+    except (FileNotFoundError, ValueError):
+        pass
+
+    with filepath.open("rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def _replace_if_changed(temp_path: Path, filepath: Path, digest: str) -> bool:
+    """Atomically replace filepath with temp_path, unless they have the same content.
+    The digest is stored in a sidecar file with the size and the modification time of the file,
+    so the next comparison doesn't need to read the (possibly large) existing file again."""
+    # the connections to the temporary file and to the replaced file are closed first.
+    release_engines(temp_path)
+    if digest == _file_digest(filepath):
+        temp_path.unlink()
+        return False
+    release_engines(filepath)
+
+    # temporary files are only readable by their owner, give it the permissions the file
+    # would have had if it was written directly.
+    try:
+        mode = stat.S_IMODE(filepath.stat().st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    temp_path.chmod(mode)
+    temp_path.replace(filepath)
+    file_stat = filepath.stat()
+    _digest_path(filepath).write_text(
+        f"{digest} {file_stat.st_size} {file_stat.st_mtime_ns}\n", encoding="utf-8"
+    )
+    return True
+
+
+def _write_if_changed(chunks: Iterable[str], filepath: Path) -> bool:
+    """Write the chunks to a temporary file next to filepath while hashing them, then replace
+    filepath with it only if the content changed.
+    The newlines are translated to the newlines of the platform, like the text files written by
+    save_html and save_json, so the same bytes are written with and without skip_unchanged."""
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp", delete=False
+    ) as file:
+        for chunk in chunks:
+            if os.linesep != "\n":
+                chunk = chunk.replace("\n", os.linesep)
+            data = chunk.encode("utf-8")
+            digest.update(data)
+            file.write(data)
+    return _replace_if_changed(Path(file.name), filepath, digest.hexdigest())
+
+
+def _create_db(
+    bookmarks: DBBookmark, filepath: Path, search_index: bool = False, icon_table: bool = False
+):
+    tables = [DBBookmark.__table__, DBTag.__table__, DBBookmarkTag.__table__]
+    icons = []
+    if icon_table:
+        tables.append(DBIcon.__table__)
+        icons = extract_icons(bookmarks)
+    with open_engine(filepath) as engine:
+        with Session(engine) as session:
+            Base.metadata.create_all(engine, tables=tables)
+            session.commit()
+            session.add(bookmarks)
+            # the ids of the urls are needed by the rows of the tag tables.
+            session.flush()
+            tags, bookmark_tags = extract_tags(bookmarks)
+            for model, rows in ((DBTag, tags), (DBBookmarkTag, bookmark_tags), (DBIcon, icons)):
+                if rows:
+                    session.execute(insert(model), rows)
+            session.commit()
+        if search_index:
+            with engine.begin() as connection:
+                create_search_index(connection)
+
+
+@traced
+def save_db(
+    bookmarks: DBBookmark,
+    filepath: Path,
+    skip_unchanged: bool = False,
+    search_index: bool = False,
+    icon_table: bool = False,
+) -> bool:
     """Function to export the bookmarks as SQLite3 DB.
     This function does not save bookmarks to an already existing database, but rather creates
-    a new database."""
+    a new database.
+    If skip_unchanged is set, the database is created in a temporary file which only replaces
+    the existing file if their content differs.
+    If search_index is set, a full-text search index of the bookmarks is added to the database
+    (see search.search).
+    If icon_table is set, each distinct icon is stored once in the icon table, as raw bytes
+    (see icons.py).
+    Returns whether the file was written."""
+    _ensure_path_exists(filepath)
+    if not skip_unchanged:
+        _create_db(bookmarks, filepath, search_index, icon_table)
+        return True
+
+    with tempfile.NamedTemporaryFile(
+        dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp", delete=False
+    ) as file:
+        temp_path = Path(file.name)
+    _create_db(bookmarks, temp_path, search_index, icon_table)
+    with temp_path.open("rb") as file:
+        digest = hashlib.file_digest(file, "sha256").hexdigest()
+    return _replace_if_changed(temp_path, filepath, digest)
+
+
+def _create_places(rows: PlacesRows, filepath: Path):
+    with open_engine(filepath) as engine, engine.begin() as connection:
+        create_places_tables(connection)
+        write_places(connection, rows)
+
+
+@traced
+def save_places(rows: PlacesRows, filepath: Path, skip_unchanged: bool = False) -> bool:
+    """Export the bookmarks as a Firefox places.sqlite database, in a single transaction.
+    Like save_db, a new database is created rather than adding the bookmarks to an existing one.
+    If skip_unchanged is set, the database is created in a temporary file which only replaces
+    the existing file if their content differs.
+    Returns whether the file was written."""
     _ensure_path_exists(filepath)
-    database_path = "sqlite:///" + str(filepath)
-    engine = create_engine(database_path)
-    Session = sessionmaker(bind=engine)
-    with Session() as session:
-        Base.metadata.create_all(engine)
-        session.commit()
-        session.add(bookmarks)
-        session.commit()
-
-
-def save_html(bookmarks: str, filepath: Optional[Path] = None):
-    """Export the bookmarks as HTML."""
+    if not skip_unchanged:
+        _create_places(rows, filepath)
+        return True
+
+    with tempfile.NamedTemporaryFile(
+        dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp", delete=False
+    ) as file:
+        temp_path = Path(file.name)
+    _create_places(rows, temp_path)
+    with temp_path.open("rb") as file:
+        digest = hashlib.file_digest(file, "sha256").hexdigest()
+    return _replace_if_changed(temp_path, filepath, digest)
+
+
+@traced
+def save_html(
+    bookmarks: str, filepath: Optional[Path] = None, skip_unchanged: bool = False
+) -> bool:
+    """Export the bookmarks as HTML.
+    If skip_unchanged is set, the file is only (atomically) replaced if its content changed.
+    Returns whether the file was written."""
     _ensure_path_exists(filepath)
+    if skip_unchanged:
+        return _write_if_changed((bookmarks,), filepath)
+
     with filepath.open("w", encoding="utf-8") as file:
         file.write(bookmarks)
+    return True
 
 
-def save_json(bookmarks: dict, filepath: Path):
-    """Function to export the bookmarks as JSON."""
+@traced
+def save_json(bookmarks: dict, filepath: Path, skip_unchanged: bool = False) -> bool:
+    """Function to export the bookmarks as JSON.
+    If skip_unchanged is set, the file is only (atomically) replaced if its content changed.
+    Returns whether the file was written."""
     _ensure_path_exists(filepath)
+    if skip_unchanged:
+        encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+        return _write_if_changed(encoder.iterencode(bookmarks), filepath)
+
     with filepath.open("w", encoding="utf-8") as file:
         json.dump(bookmarks, file, ensure_ascii=False, indent=2)
+    return True
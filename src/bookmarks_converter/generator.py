@@ -0,0 +1,491 @@
+"""Generator of synthetic bookmarks files, used to load test the converters.
+
+The bookmarks are generated as a stream of events, which the writers convert to the output format
+one bookmark at a time, so files of any size can be generated with a constant memory usage.
+"""
+
+import base64
+import json
+import random
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, TextIO
+
+from bookmarks_converter.converters import Bookmarkie, Chrome, Firefox
+from bookmarks_converter.converters.bookmarkie import BOOKMARKIE_HTML_HEADER
+from bookmarks_converter.converters.chrome import (
+    CHROME_BOOKMARK_BAR_FOLDER_TITLE,
+    CHROME_BOOKMARK_MOBILE_FOLDER_TITLE,
+    CHROME_BOOKMARK_OTHER_FOLDER_TITLE,
+    CHROME_HTML_HEADER,
+)
+from bookmarks_converter.converters.converter import Converter
+from bookmarks_converter.converters.firefox import MOZILLA_HTML_HEADER
+from bookmarks_converter.engines import open_engine, release_engines
+from bookmarks_converter.formats import Format
+from bookmarks_converter.guid import deterministic_guids
+from bookmarks_converter.models import (
+    Base,
+    DBBookmark,
+    DBBookmarkTag,
+    DBTag,
+    Folder,
+    SpecialFolder,
+    Url,
+)
+from bookmarks_converter.places import (
+    PLACES_ROOT_ID,
+    PlacesRows,
+    create_places_tables,
+    write_places,
+)
+from bookmarks_converter.util import HTML_INDENT
+
+EVENT_OPEN = "open"
+EVENT_CLOSE = "close"
+EVENT_URL = "url"
+
+DB_BATCH_SIZE = 10_000
+FILE_BUFFER_SIZE = 1024 * 1024
+# number of recently generated urls the duplicates are picked from.
+DUPLICATE_POOL_SIZE = 1000
+TAG_VOCABULARY_SIZE = 200
+# range of the generated dates, in microseconds (2010-01-01 to 2024-01-01).
+DATE_RANGE = (1262304000000000, 1704067200000000)
+
+ASCII_WORDS = (
+    "news", "docs", "python", "recipes", "travel", "music", "video", "blog", "forum", "shop",
+    "weather", "maps", "research", "tutorial", "reference", "sports", "finance", "games",
+)  # fmt: skip
+UNICODE_WORDS = (
+    "日本語", "ニュース", "中文", "新闻", "한국어", "Ελληνικά", "русский", "Ünïcödé", "café",
+    "العربية", "עברית", "हिन्दी", "🔖", "📚", "🎵", "✈️",
+)  # fmt: skip
+
+
+@dataclass
+class GeneratorOptions:
+    """Options controlling the content of the generated bookmarks.
+
+    size: int
+        number of bookmarks (urls and folders) to generate.
+    seed: int
+        seed of the random generator, the same options always generate the same bookmarks.
+    max_depth: int
+        maximum depth of the folders, below the special folders.
+    folder_ratio: float
+        probability of a new bookmark being a folder rather than a url.
+    folder_size: int
+        average number of bookmarks in a folder.
+    icon_size: int
+        size in bytes of the icon payload of the urls, 0 for no icons.
+    icon_ratio: float
+        probability of a url having an icon (if icon_size is set).
+    max_tags: int
+        maximum number of tags of a url, each url has between 0 and max_tags tags.
+    unicode_ratio: float
+        probability of a title containing non ascii characters.
+    duplicate_ratio: float
+        probability of a url being a duplicate of a previously generated url.
+    """
+
+    size: int = 1000
+    seed: int = 0
+    max_depth: int = 6
+    folder_ratio: float = 0.1
+    folder_size: int = 20
+    icon_size: int = 0
+    icon_ratio: float = 0.5
+    max_tags: int = 0
+    unicode_ratio: float = 0.1
+    duplicate_ratio: float = 0.05
+
+
+class BookmarksGenerator:
+    """Generates a stream of bookmark events in pre-order:
+
+    - (EVENT_OPEN, Folder): a folder starts, the following events are its children.
+    - (EVENT_CLOSE, Folder): the folder ends.
+    - (EVENT_URL, Url): a url inside the current folder.
+
+    The root folder isn't part of the stream, the bookmarks are evenly split amongst the
+    special folders given to `events`. The folders don't hold their children, so only the
+    currently open folders are kept in memory.
+    """
+
+    def __init__(self, options: GeneratorOptions):
+        self.options = options
+        self._random = random.Random(options.seed)
+        self._ids = iter(range(2, 2**63))
+        self._recent_urls = deque(maxlen=DUPLICATE_POOL_SIZE)
+        self._tags = [f"tag{i}" for i in range(TAG_VOCABULARY_SIZE)]
+
+    def root(self) -> Folder:
+        return Folder(
+            id=1,
+            guid=self._guid(),
+            index=0,
+            title=SpecialFolder.ROOT.value,
+            date_added=DATE_RANGE[0],
+            date_modified=DATE_RANGE[0],
+            special_folder=SpecialFolder.ROOT,
+        )
+
+    def events(self, special_folders: tuple[SpecialFolder, ...]) -> Iterator[tuple[str, object]]:
+        options = self.options
+        close_probability = 1 / max(options.folder_size, 1)
+        share, remainder = divmod(options.size, len(special_folders))
+
+        for index, special_folder in enumerate(special_folders):
+            remaining = share + (1 if index < remainder else 0)
+            special = self._folder(index, special_folder.value, special_folder)
+            yield EVENT_OPEN, special
+            stack = [special]
+            counts = [0]
+
+            while remaining:
+                if len(stack) > 1 and self._random.random() < close_probability:
+                    yield EVENT_CLOSE, stack.pop()
+                    counts.pop()
+                    continue
+
+                if len(stack) <= options.max_depth and self._random.random() < options.folder_ratio:
+                    folder = self._folder(counts[-1], self._title())
+                    counts[-1] += 1
+                    yield EVENT_OPEN, folder
+                    stack.append(folder)
+                    counts.append(0)
+                else:
+                    yield EVENT_URL, self._url(counts[-1])
+                    counts[-1] += 1
+                remaining -= 1
+
+            while stack:
+                yield EVENT_CLOSE, stack.pop()
+
+    def _guid(self) -> str:
+        return str(uuid.UUID(int=self._random.getrandbits(128), version=4))
+
+    def _date(self) -> int:
+        # the html format stores the dates in seconds.
+        return self._random.randrange(*DATE_RANGE) // 1000_000 * 1000_000
+
+    def _title(self) -> str:
+        words = ASCII_WORDS
+        if self._random.random() < self.options.unicode_ratio:
+            words = UNICODE_WORDS
+        return " ".join(self._random.choices(words, k=self._random.randint(1, 4)))
+
+    def _folder(
+        self, index: int, title: str, special_folder: SpecialFolder | None = None
+    ) -> Folder:
+        date = self._date()
+        return Folder(
+            id=next(self._ids),
+            guid=self._guid(),
+            index=index,
+            title=title,
+            date_added=date,
+            date_modified=date,
+            special_folder=special_folder,
+        )
+
+    def _url(self, index: int) -> Url:
+        options = self.options
+        id_ = next(self._ids)
+        if self._recent_urls and self._random.random() < options.duplicate_ratio:
+            url = self._random.choice(self._recent_urls)
+        else:
+            url = f"https://www.example{id_ % 997}.com/{id_}"
+            self._recent_urls.append(url)
+
+        icon = ""
+        if options.icon_size and self._random.random() < options.icon_ratio:
+            payload = base64.b64encode(self._random.randbytes(options.icon_size)).decode("ascii")
+            icon = f"data:image/png;base64,{payload}"
+
+        tags = []
+        if options.max_tags:
+            tags = self._random.sample(self._tags, self._random.randint(0, options.max_tags))
+
+        date = self._date()
+        return Url(
+            id=id_,
+            guid=self._guid(),
+            index=index,
+            title=self._title(),
+            date_added=date,
+            date_modified=date,
+            url=url,
+            icon=icon,
+            tags=tags,
+        )
+
+
+class _IndentedWriter:
+    """Writes HTML lines with the same indentation as `util.indent_html`, without having to
+    hold the whole document in memory."""
+
+    def __init__(self, file: TextIO):
+        self._file = file
+        self._depth = 0
+
+    def write(self, html: str):
+        for line in html.splitlines():
+            if line.startswith("</DL>"):
+                self._depth -= 1
+            self._file.write(f"{self._depth * HTML_INDENT}{line}\n")
+            if line.startswith("<DL><p>"):
+                self._depth += 1
+
+
+# (special folders, special folders written without a folder element, header, footer)
+HTML_LAYOUTS = {
+    Bookmarkie: (
+        (SpecialFolder.MENU, SpecialFolder.TOOLBAR, SpecialFolder.OTHER, SpecialFolder.MOBILE),
+        (SpecialFolder.MENU,),
+        BOOKMARKIE_HTML_HEADER,
+        "</DL>\n",
+    ),
+    Chrome: (
+        (SpecialFolder.TOOLBAR, SpecialFolder.OTHER, SpecialFolder.MOBILE),
+        (SpecialFolder.OTHER, SpecialFolder.MOBILE),
+        CHROME_HTML_HEADER,
+        "</DL><p>\n",
+    ),
+    Firefox: (
+        (SpecialFolder.MENU, SpecialFolder.TOOLBAR, SpecialFolder.OTHER),
+        (SpecialFolder.MENU,),
+        MOZILLA_HTML_HEADER,
+        "</DL>\n",
+    ),
+}
+
+JSON_SPECIAL_FOLDERS = {
+    Bookmarkie: (
+        SpecialFolder.MENU,
+        SpecialFolder.TOOLBAR,
+        SpecialFolder.OTHER,
+        SpecialFolder.MOBILE,
+    ),
+    Chrome: (SpecialFolder.TOOLBAR, SpecialFolder.OTHER, SpecialFolder.MOBILE),
+    Firefox: (SpecialFolder.MENU, SpecialFolder.TOOLBAR, SpecialFolder.OTHER, SpecialFolder.MOBILE),
+}
+
+CHROME_JSON_ROOTS = {
+    SpecialFolder.TOOLBAR: ("bookmark_bar", CHROME_BOOKMARK_BAR_FOLDER_TITLE),
+    SpecialFolder.OTHER: ("other", CHROME_BOOKMARK_OTHER_FOLDER_TITLE),
+    SpecialFolder.MOBILE: ("synced", CHROME_BOOKMARK_MOBILE_FOLDER_TITLE),
+}
+
+
+def _write_html(converter: Converter, generator: BookmarksGenerator, file: TextIO):
+    special_folders, inline_folders, header, footer = HTML_LAYOUTS[type(converter)]
+    writer = _IndentedWriter(file)
+    writer.write(header)
+    for event, node in generator.events(special_folders):
+        if event == EVENT_URL:
+            writer.write(converter._url_as_html(node))
+        elif node.special_folder in inline_folders:
+            continue
+        elif event == EVENT_OPEN:
+            writer.write(converter._folder_as_html(node))
+            writer.write("<DL><p>\n")
+        else:
+            writer.write("</DL><p>\n")
+    writer.write(footer)
+
+
+def _open_json_folder(folder_json: dict) -> str:
+    """Return the JSON of the folder, left open to stream its children."""
+    folder_json.pop("children", None)
+    return json.dumps(folder_json, ensure_ascii=False)[:-1] + ', "children": ['
+
+
+def _write_json_events(converter: Converter, events, file: TextIO):
+    # whether the current folder already has a child, to add the separators.
+    has_children = [False]
+    for event, node in events:
+        if event == EVENT_CLOSE:
+            file.write("]}")
+            has_children.pop()
+            continue
+
+        if has_children[-1]:
+            file.write(",")
+        has_children[-1] = True
+        if event == EVENT_OPEN:
+            file.write(_open_json_folder(converter._folder_as_json(node)))
+            has_children.append(False)
+        else:
+            file.write(json.dumps(converter._url_as_json(node), ensure_ascii=False))
+
+
+def _write_json(converter: Converter, generator: BookmarksGenerator, file: TextIO):
+    special_folders = JSON_SPECIAL_FOLDERS[type(converter)]
+    if isinstance(converter, Chrome):
+        _write_chrome_json(converter, generator, special_folders, file)
+        return
+
+    file.write(_open_json_folder(converter._folder_as_json(generator.root())))
+    _write_json_events(converter, generator.events(special_folders), file)
+    file.write("]}")
+
+
+def _write_chrome_json(converter: Chrome, generator: BookmarksGenerator, special_folders, file):
+    """Chrome stores each special folder under a key of the "roots" object."""
+    file.write('{"roots": {')
+    events = generator.events(special_folders)
+    for i, (_, special) in enumerate(events):
+        # the first event of the stream is always a special folder being opened.
+        key, title = CHROME_JSON_ROOTS[special.special_folder]
+        if i:
+            file.write(",")
+        folder_json = converter._folder_as_json(special)
+        folder_json["name"] = title
+        file.write(f'"{key}": {_open_json_folder(folder_json)}')
+
+        def _special_folder_events():
+            depth = 1
+            for event, node in events:
+                depth += {EVENT_OPEN: 1, EVENT_CLOSE: -1}.get(event, 0)
+                if depth == 0:
+                    return
+                yield event, node
+
+        _write_json_events(converter, _special_folder_events(), file)
+        file.write("]}")
+    file.write('}, "version": 1}')
+
+
+def _write_db(generator: BookmarksGenerator, filepath: Path):
+    """Write the bookmarks to a Bookmarkie DB, using batched inserts."""
+    table = DBBookmark.__table__
+    tag_table = DBTag.__table__
+    bookmark_tag_table = DBBookmarkTag.__table__
+    root = generator.root()
+    batch = [_db_row(root, 0)]
+    tags = {}
+    bookmark_tags = []
+    parents = [root.id]
+    special_folders = JSON_SPECIAL_FOLDERS[Bookmarkie]
+    with open_engine(filepath) as engine, engine.begin() as connection:
+        Base.metadata.create_all(connection, tables=[table, tag_table, bookmark_tag_table])
+        for event, node in generator.events(special_folders):
+            if event == EVENT_CLOSE:
+                parents.pop()
+                continue
+            batch.append(_db_row(node, parents[-1]))
+            if event == EVENT_OPEN:
+                parents.append(node.id)
+            elif event == EVENT_URL:
+                for position, name in enumerate(node.tags):
+                    tag_id = tags.setdefault(name, len(tags) + 1)
+                    bookmark_tags.append(
+                        {"bookmark_id": node.id, "position": position, "tag_id": tag_id}
+                    )
+            if len(batch) >= DB_BATCH_SIZE:
+                connection.execute(table.insert(), batch)
+                batch = []
+            if len(bookmark_tags) >= DB_BATCH_SIZE:
+                connection.execute(bookmark_tag_table.insert(), bookmark_tags)
+                bookmark_tags = []
+        for table_, rows in (
+            (table, batch),
+            (bookmark_tag_table, bookmark_tags),
+            (tag_table, [{"id": tag_id, "name": name} for name, tag_id in tags.items()]),
+        ):
+            if rows:
+                connection.execute(table_.insert(), rows)
+
+
+def _write_places(converter: Firefox, generator: BookmarksGenerator, filepath: Path):
+    """Write the bookmarks to a Firefox places.sqlite, using batched inserts."""
+    rows = PlacesRows()
+    with open_engine(filepath) as engine, engine.begin() as connection:
+        create_places_tables(connection)
+        parents = [converter._folder_as_places(rows, generator.root(), PLACES_ROOT_ID)]
+        for event, node in generator.events(JSON_SPECIAL_FOLDERS[Firefox]):
+            if event == EVENT_CLOSE:
+                parents.pop()
+                continue
+            if event == EVENT_OPEN:
+                parents.append(converter._folder_as_places(rows, node, parents[-1]))
+            else:
+                converter._url_as_places(rows, node, parents[-1])
+            if len(rows) >= DB_BATCH_SIZE:
+                write_places(connection, rows, complete=False)
+        write_places(connection, rows)
+
+
+def _db_row(node: Folder | Url, parent_id: int) -> dict:
+    row = {
+        "id": node.id,
+        "guid": node.guid,
+        "title": node.title,
+        "index": node.index,
+        "parent_id": parent_id,
+        "date_added": node.date_added,
+        "date_modified": node.date_modified,
+        "special_folder": None,
+        "url": None,
+        "icon": None,
+        "icon_uri": None,
+        "tags": None,
+    }
+    if isinstance(node, Folder):
+        row["type"] = "folder"
+        if node.special_folder:
+            row["special_folder"] = node.special_folder.value
+    else:
+        row["type"] = "url"
+        row.update(url=node.url, icon=node.icon, icon_uri=node.icon_uri, tags=",".join(node.tags))
+    return row
+
+
+def generate(converter: Converter, format_: Format, filepath: Path, options: GeneratorOptions):
+    """Generate a synthetic bookmarks file in the format of the converter."""
+    if format_ not in converter.formats:
+        raise ValueError(
+            f"The converter '{converter.__class__.__name__}' doesn't support the format '{format_}'"
+        )
+
+    generator = BookmarksGenerator(options)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    if format_ in (Format.DB, Format.PLACES):
+        release_engines(filepath)
+    if format_ == Format.DB:
+        filepath.unlink(missing_ok=True)
+        _write_db(generator, filepath)
+        return
+
+    # the guids converted to the mozilla format have to be derived from the generated ones, for
+    # the output to be reproducible.
+    with deterministic_guids():
+        if format_ == Format.PLACES:
+            filepath.unlink(missing_ok=True)
+            _write_places(converter, generator, filepath)
+            return
+        with filepath.open("w", encoding="utf-8", buffering=FILE_BUFFER_SIZE) as file:
+            if format_ == Format.HTML:
+                _write_html(converter, generator, file)
+            else:
+                _write_json(converter, generator, file)
+
+
+def generate_tree(options: GeneratorOptions) -> Folder:
+    """Generate the synthetic bookmarks as a Bookmark tree in memory, with all the special
+    folders, to export them without parsing a file first."""
+    generator = BookmarksGenerator(options)
+    root = generator.root()
+    stack = [root]
+    for event, node in generator.events(JSON_SPECIAL_FOLDERS[Bookmarkie]):
+        if event == EVENT_CLOSE:
+            stack.pop()
+            continue
+        stack[-1].children.append(node)
+        if event == EVENT_OPEN:
+            stack.append(node)
+    return root
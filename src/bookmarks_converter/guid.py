@@ -0,0 +1,156 @@
+import hashlib
+import os
+import re
+import threading
+import weakref
+from base64 import urlsafe_b64encode
+from contextlib import contextmanager
+from contextvars import ContextVar
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+MOZILLA_GUID_LENGTH = 12
+# firefox guids are the url-safe base64 encoding of 9 random bytes.
+MOZILLA_GUID_RANDOM_BYTES = 9
+UUID_RANDOM_BYTES = 16
+GUID_BUFFER_SIZE = 4096
+
+# canonical (lowercase/uppercase, hyphenated) uuid string, used as a fast path before
+# falling back to the full `uuid.UUID` parser.
+UUID_PATTERN = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+)
+UUID_VARIANT_NIBBLE = "89ab"
+# namespace of the uuid5 guids derived in deterministic mode.
+GUID_NAMESPACE = uuid5(NAMESPACE_URL, "https://github.com/radam9/bookmarks-converter")
+
+# the deterministic mode enabled by `deterministic_guids`, local to the thread (or task) running
+# the conversion, so the concurrent conversions keep their own mode.
+_deterministic_mode: ContextVar[bool] = ContextVar("deterministic_guids", default=False)
+
+
+# the generators to reset in the child processes.
+_generators: "weakref.WeakSet[GuidGenerator]" = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for generator in list(_generators):
+        generator._reset()
+
+
+# fork isn't available on windows.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class GuidGenerator:
+    """Generates the guids used by the converters.
+
+    Instead of asking the OS for randomness for every single guid, the random bytes are read
+    from a bulk `os.urandom` buffer which is refilled once exhausted. The buffer is dropped in
+    the child processes created with `fork`, which would otherwise generate the guids of their
+    parent (and of each other).
+    The generator produces two formats:
+
+    - RFC-4122 uuids, used by the Bookmark tree, Bookmarkie and Chrome.
+    - 12 character Mozilla guids, used by Firefox.
+
+    Every method accepts the stable content describing the bookmark the guid is generated for
+    (ex. its id, url and date_added). The content is ignored by default, but when
+    `deterministic` is set (or inside a `deterministic_guids` block), the guids are derived from
+    it (uuid5 / sha1) instead of random bytes, so converting the same input twice produces
+    identical output.
+    """
+
+    def __init__(self, buffer_size: int = GUID_BUFFER_SIZE, deterministic: bool = False):
+        self._deterministic = deterministic
+        self._buffer_size = buffer_size
+        self._reset()
+        _generators.add(self)
+
+    def _reset(self):
+        self._buffer = b""
+        self._offset = 0
+        # the lock may have been held by another thread of the parent when it forked.
+        self._lock = threading.Lock()
+
+    @property
+    def deterministic(self) -> bool:
+        return self._deterministic or _deterministic_mode.get()
+
+    @deterministic.setter
+    def deterministic(self, deterministic: bool):
+        self._deterministic = deterministic
+
+    def _random_bytes(self, size: int) -> bytes:
+        with self._lock:
+            if self._offset + size > len(self._buffer):
+                self._buffer = os.urandom(max(self._buffer_size, size))
+                self._offset = 0
+            start = self._offset
+            self._offset += size
+            return self._buffer[start : self._offset]
+
+    def uuid(self, *content) -> str:
+        """Return a new uuid as a hyphenated string.
+        A random uuid4 is returned, unless the generator is deterministic, then a uuid5 of the
+        content is returned."""
+        if self.deterministic and content:
+            return str(uuid5(GUID_NAMESPACE, _content_key(content)))
+        hex_ = self._random_bytes(UUID_RANDOM_BYTES).hex()
+        # set the version (4) and the variant (10xx) bits as defined by RFC-4122.
+        variant = UUID_VARIANT_NIBBLE[int(hex_[16], 16) & 3]
+        return f"{hex_[:8]}-{hex_[8:12]}-4{hex_[13:16]}-{variant}{hex_[17:20]}-{hex_[20:]}"
+
+    def mozilla_guid(self, *content) -> str:
+        """Return a new Mozilla Firefox guid, random unless the generator is deterministic.
+        The code for the guid generation in the firefox source code can be found in:
+        - /services/sync/modules/util.sys.mjs `makeGUID()`
+        - https://searchfox.org/mozilla-central/source/services/sync/modules/util.sys.mjs#204
+        """
+        if self.deterministic and content:
+            digest = hashlib.sha1(_content_key(content).encode("utf-8")).digest()
+            random_bytes = digest[:MOZILLA_GUID_RANDOM_BYTES]
+        else:
+            random_bytes = self._random_bytes(MOZILLA_GUID_RANDOM_BYTES)
+        return urlsafe_b64encode(random_bytes).decode("ascii")
+
+    def ensure_uuid(self, guid: str | None, *content) -> str:
+        """Return the guid if it is a valid uuid, otherwise return a new uuid.
+        The invalid guid itself is part of the content a deterministic uuid is derived from."""
+        if guid and (UUID_PATTERN.fullmatch(guid) or _is_uuid(guid)):
+            return guid
+        return self.uuid(guid, *content)
+
+    def ensure_mozilla_guid(self, guid: str | None, *content) -> str:
+        """Return the guid if it has the length of a Mozilla guid, otherwise return a new one.
+        The invalid guid itself is part of the content a deterministic guid is derived from."""
+        if guid and len(guid) == MOZILLA_GUID_LENGTH:
+            return guid
+        return self.mozilla_guid(guid, *content)
+
+
+def _is_uuid(guid: str) -> bool:
+    """Slow path of the uuid validation, accepting every format `uuid.UUID` accepts."""
+    try:
+        UUID(guid)
+    except ValueError:
+        return False
+    return True
+
+
+def _content_key(content: tuple) -> str:
+    return "\x1f".join(str(item) for item in content)
+
+
+guids = GuidGenerator()
+
+
+@contextmanager
+def deterministic_guids():
+    """Context manager enabling the deterministic mode of the guid generators, for the
+    conversions of the current thread (or asyncio task) only."""
+    token = _deterministic_mode.set(True)
+    try:
+        yield guids
+    finally:
+        _deterministic_mode.reset(token)
@@ -0,0 +1,404 @@
+"""History of snapshots of a Bookmark tree, stored in a DB with the Bookmarkie tables.
+
+Each bookmark (url/folder) of a snapshot is stored as a node keyed by the hash of its content,
+and the content of a folder includes the hashes of its children, like a Merkle tree. A folder
+that didn't change since a previous snapshot has the same hash, so it is stored once and shared
+by the snapshots with all of its subtree: adding a snapshot only stores the changed bookmarks
+and the folders above them, and the size of the DB grows with the changes rather than with the
+number of snapshots.
+
+A snapshot is materialized with two queries, following the children of its root with a recursive
+query, and two snapshots are compared by walking down both trees at once, skipping the subtrees
+they share without loading them.
+"""
+
+import hashlib
+import json
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import Connection, func, literal, select
+from sqlalchemy.dialects.sqlite import insert
+
+from bookmarks_converter.engines import open_engine
+from bookmarks_converter.icons import icon_key, load_icons, split_data_uri
+from bookmarks_converter.models import (
+    TYPE_FOLDER,
+    TYPE_URL,
+    Bookmark,
+    DBIcon,
+    DBSnapshot,
+    DBSnapshotChild,
+    DBSnapshotNode,
+    Folder,
+    SpecialFolder,
+    Url,
+)
+
+# maximum number of nodes per query when the nodes of a snapshot are looked up, below the
+# maximum number of variables of a SQLite statement.
+HISTORY_QUERY_BATCH_SIZE = 500
+
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_MODIFIED = "modified"
+
+_TABLES = [
+    DBIcon.__table__,
+    DBSnapshot.__table__,
+    DBSnapshotNode.__table__,
+    DBSnapshotChild.__table__,
+]
+# the columns of the nodes compared by the diffs, the hash also covers the children.
+_CONTENT_COLUMNS = (
+    "type",
+    "bookmark_id",
+    "guid",
+    "title",
+    "date_added",
+    "date_modified",
+    "special_folder",
+    "url",
+    "icon",
+    "icon_uri",
+    "tags",
+)
+
+
+@dataclass
+class Snapshot:
+    id: int
+    created: int
+    size: int
+    new_nodes: int
+
+
+@dataclass
+class SnapshotChange:
+    """A bookmark added, removed or modified between two snapshots. The bookmarks are the
+    versions of the old and new snapshot (None if the bookmark is missing from the snapshot),
+    without their children, and the parents are the guids of their folders."""
+
+    guid: str
+    old: Bookmark | None
+    new: Bookmark | None
+    old_parent: str | None = None
+    new_parent: str | None = None
+
+    @property
+    def status(self) -> str:
+        if self.old is None:
+            return CHANGE_ADDED
+        if self.new is None:
+            return CHANGE_REMOVED
+        return CHANGE_MODIFIED
+
+
+def _node_content(node: Bookmark, icon: str | None) -> dict:
+    """The row of the snapshot_node table of the bookmark, without its ids."""
+    content = dict.fromkeys(_CONTENT_COLUMNS)
+    content.update(
+        bookmark_id=node.id,
+        guid=node.guid,
+        title=node.title,
+        date_added=node.date_added,
+        date_modified=node.date_modified,
+    )
+    if isinstance(node, Folder):
+        special_folder = node.special_folder.value if node.special_folder else None
+        content.update(type=TYPE_FOLDER, special_folder=special_folder)
+    else:
+        content.update(
+            type=TYPE_URL,
+            url=node.url,
+            icon=icon,
+            icon_uri=node.icon_uri,
+            tags=json.dumps(node.tags, ensure_ascii=False),
+        )
+    return content
+
+
+class HistoryStore:
+    """Snapshots of a Bookmark tree, stored in a sqlite3 DB shared between the snapshots.
+
+    The engine of the DB is opened with `open_engine` until the store is closed: inside an
+    EngineCache the engine of the cache is used (and stays open after the store is closed),
+    otherwise the store has its own engine.
+
+    filepath: Path
+        path of the history DB, created if it doesn't exist.
+    """
+
+    def __init__(self, filepath: Path):
+        self.filepath = filepath
+        self._exit_stack = ExitStack()
+        self._engine = self._exit_stack.enter_context(open_engine(filepath))
+        with self._engine.begin() as connection:
+            DBSnapshot.metadata.create_all(connection, tables=_TABLES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the connections to the DB, unless its engine belongs to an EngineCache."""
+        self._exit_stack.close()
+
+    def add(self, tree: Bookmark, created: int | None = None) -> int:
+        """Add the tree as a new snapshot, and return its number.
+        Only the bookmarks that aren't stored by a previous snapshot are added to the DB."""
+        if created is None:
+            created = round(time.time() * 1000)
+        hashes, contents, icons = self._hash_tree(tree)
+
+        with self._engine.begin() as connection:
+            table = DBSnapshotNode.__table__
+            next_id = (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+            node_ids = {}
+            nodes = []
+            links = []
+            level = [tree]
+            # walk down the tree, the subtrees of the nodes already stored are skipped.
+            while level:
+                level = {hashes[id(node)]: node for node in level}
+                node_ids.update(
+                    self._find_nodes(connection, [h for h in level if h not in node_ids])
+                )
+                next_level = []
+                for hash_, node in level.items():
+                    if hash_ in node_ids:
+                        continue
+                    node_ids[hash_] = next_id
+                    nodes.append({"id": next_id, "hash": hash_, **contents[id(node)]})
+                    if isinstance(node, Folder):
+                        links.extend(
+                            (next_id, position, child)
+                            for position, child in enumerate(node.children)
+                        )
+                        next_level.extend(node.children)
+                    next_id += 1
+                level = next_level
+
+            icons = [icons[key] for key in {node.get("icon") for node in nodes} if key in icons]
+            if icons:
+                connection.execute(insert(DBIcon.__table__).on_conflict_do_nothing(), icons)
+            if nodes:
+                connection.execute(table.insert(), nodes)
+            if links:
+                connection.execute(
+                    DBSnapshotChild.__table__.insert(),
+                    [
+                        {
+                            "parent_id": parent_id,
+                            "position": position,
+                            "child_id": node_ids[hashes[id(child)]],
+                            "index": child.index,
+                        }
+                        for parent_id, position, child in links
+                    ],
+                )
+            result = connection.execute(
+                DBSnapshot.__table__.insert().values(
+                    created=created,
+                    root_id=node_ids[hashes[id(tree)]],
+                    root_index=tree.index,
+                    size=len(hashes),
+                    new_nodes=len(nodes),
+                )
+            )
+            return result.inserted_primary_key[0]
+
+    def snapshots(self) -> list[Snapshot]:
+        """The snapshots of the history, oldest first."""
+        table = DBSnapshot.__table__
+        with self._engine.connect() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.created, table.c.size, table.c.new_nodes).order_by(
+                    table.c.id
+                )
+            )
+            return [Snapshot(*row) for row in rows]
+
+    def materialize(self, snapshot: int) -> Bookmark:
+        """The Bookmark tree of the snapshot."""
+        nodes = DBSnapshotNode.__table__
+        children = DBSnapshotChild.__table__
+        with self._engine.connect() as connection:
+            root_id, root_index = self._snapshot_root(connection, snapshot)
+            reachable = select(literal(root_id).label("id")).cte("reachable", recursive=True)
+            reachable = reachable.union(
+                select(children.c.child_id).join(reachable, children.c.parent_id == reachable.c.id)
+            )
+            rows = connection.execute(select(nodes).join(reachable, nodes.c.id == reachable.c.id))
+            rows = {row.id: row for row in rows}
+            links = connection.execute(
+                select(children.c.parent_id, children.c.child_id, children.c.index)
+                .join(reachable, children.c.parent_id == reachable.c.id)
+                .order_by(children.c.parent_id, children.c.position)
+            )
+            folder_children = {}
+            for parent_id, child_id, index in links:
+                folder_children.setdefault(parent_id, []).append((child_id, index))
+            icons = load_icons(connection, (row.icon for row in rows.values() if row.icon))
+
+        tree = self._as_bookmark(rows[root_id], root_index, icons)
+        stack = [(tree, root_id)]
+        while stack:
+            folder, node_id = stack.pop()
+            for child_id, index in folder_children.get(node_id, ()):
+                child = self._as_bookmark(rows[child_id], index, icons)
+                folder.children.append(child)
+                if isinstance(child, Folder):
+                    stack.append((child, child_id))
+        return tree
+
+    def diff(self, old: int, new: int) -> list[SnapshotChange]:
+        """The bookmarks added, removed or modified (including moved) between the old and the new
+        snapshot, sorted by guid. The bookmarks are matched by guid."""
+        with self._engine.connect() as connection:
+            old_level = {(*self._snapshot_root(connection, old), None)}
+            new_level = {(*self._snapshot_root(connection, new), None)}
+            old_nodes = {}
+            new_nodes = {}
+            while old_level or new_level:
+                # the subtrees at the same place in both snapshots are identical.
+                common = old_level & new_level
+                old_level = self._expand(connection, old_level - common, old_nodes)
+                new_level = self._expand(connection, new_level - common, new_nodes)
+
+            changes = []
+            for guid in sorted(old_nodes.keys() | new_nodes.keys()):
+                old_node = old_nodes.get(guid)
+                new_node = new_nodes.get(guid)
+                if old_node is not None and new_node is not None:
+                    old_row, old_location = old_node
+                    new_row, new_location = new_node
+                    if old_location == new_location and all(
+                        getattr(old_row, column) == getattr(new_row, column)
+                        for column in _CONTENT_COLUMNS
+                    ):
+                        continue
+                changes.append((guid, old_node, new_node))
+            icons = load_icons(
+                connection,
+                (
+                    node[0].icon
+                    for _, old_node, new_node in changes
+                    for node in (old_node, new_node)
+                    if node is not None and node[0].icon
+                ),
+            )
+
+        result = []
+        for guid, old_node, new_node in changes:
+            change = SnapshotChange(guid, None, None)
+            if old_node is not None:
+                row, (index, parent) = old_node
+                change.old, change.old_parent = self._as_bookmark(row, index, icons), parent
+            if new_node is not None:
+                row, (index, parent) = new_node
+                change.new, change.new_parent = self._as_bookmark(row, index, icons), parent
+            result.append(change)
+        return result
+
+    @staticmethod
+    def _hash_tree(tree: Bookmark) -> tuple[dict[int, str], dict[int, dict], dict[str, dict]]:
+        """The hashes and the rows of the snapshot_node table of the nodes of the tree, by id of
+        the node objects, and the rows of the icon table of their icons, by key.
+        The hash of a folder covers the hashes and indexes of its children."""
+        hashes = {}
+        contents = {}
+        icons = {}
+        # post-order walk, the folders are hashed after their children.
+        stack = [(tree, False)]
+        while stack:
+            node, visited = stack.pop()
+            if isinstance(node, Folder) and not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            icon = node.icon if isinstance(node, Url) else None
+            split = split_data_uri(icon) if icon else None
+            if split is not None:
+                icon = icon_key(*split)
+                icons[icon] = {"key": icon, "mime_type": split[0], "data": split[1]}
+            content = _node_content(node, icon)
+            children = []
+            if isinstance(node, Folder):
+                children = [[hashes[id(child)], child.index] for child in node.children]
+            data = json.dumps([content, children], ensure_ascii=False, separators=(",", ":"))
+            hashes[id(node)] = hashlib.sha256(data.encode("utf-8")).hexdigest()
+            contents[id(node)] = content
+        return hashes, contents, icons
+
+    @staticmethod
+    def _find_nodes(connection: Connection, hashes: list[str]) -> dict[str, int]:
+        table = DBSnapshotNode.__table__
+        node_ids = {}
+        for start in range(0, len(hashes), HISTORY_QUERY_BATCH_SIZE):
+            batch = hashes[start : start + HISTORY_QUERY_BATCH_SIZE]
+            rows = connection.execute(
+                select(table.c.hash, table.c.id).where(table.c.hash.in_(batch))
+            )
+            node_ids.update(rows.all())
+        return node_ids
+
+    @staticmethod
+    def _snapshot_root(connection: Connection, snapshot: int) -> tuple[int, int]:
+        table = DBSnapshot.__table__
+        row = connection.execute(
+            select(table.c.root_id, table.c.root_index).where(table.c.id == snapshot)
+        ).first()
+        if row is None:
+            raise ValueError(f"The snapshot {snapshot} doesn't exist.")
+        return tuple(row)
+
+    @staticmethod
+    def _expand(connection: Connection, level: set[tuple], nodes: dict) -> set[tuple]:
+        """Add the nodes of the level, as (node id, index, parent guid) tuples, to the nodes by
+        guid, and return the next level: the children of the folders of the level."""
+        table = DBSnapshotNode.__table__
+        children = DBSnapshotChild.__table__
+        level = list(level)
+        next_level = set()
+        for start in range(0, len(level), HISTORY_QUERY_BATCH_SIZE):
+            batch = level[start : start + HISTORY_QUERY_BATCH_SIZE]
+            node_ids = {node_id for node_id, _, _ in batch}
+            rows = connection.execute(select(table).where(table.c.id.in_(node_ids)))
+            rows = {row.id: row for row in rows}
+            for node_id, index, parent in batch:
+                nodes[rows[node_id].guid] = (rows[node_id], (index, parent))
+            folder_ids = [node_id for node_id in node_ids if rows[node_id].type == TYPE_FOLDER]
+            links = connection.execute(
+                select(children.c.parent_id, children.c.child_id, children.c.index).where(
+                    children.c.parent_id.in_(folder_ids)
+                )
+            )
+            for parent_id, child_id, index in links:
+                next_level.add((child_id, index, rows[parent_id].guid))
+        return next_level
+
+    @staticmethod
+    def _as_bookmark(row, index: int, icons: dict[str, str]) -> Bookmark:
+        kwargs = {
+            "id": row.bookmark_id,
+            "guid": row.guid,
+            "index": index,
+            "title": row.title,
+            "date_added": row.date_added,
+            "date_modified": row.date_modified,
+        }
+        if row.type == TYPE_FOLDER:
+            special_folder = SpecialFolder(row.special_folder) if row.special_folder else None
+            return Folder(special_folder=special_folder, **kwargs)
+        return Url(
+            url=row.url,
+            icon=icons.get(row.icon, row.icon),
+            icon_uri=row.icon_uri,
+            tags=json.loads(row.tags),
+            **kwargs,
+        )
@@ -0,0 +1,110 @@
+"""Content-addressed storage of the url icons in Bookmarkie DBs.
+
+The icons are base64 data URIs, and the same icon is usually repeated on all the urls of a site.
+`save_db(..., icon_table=True)` stores each distinct icon once in the `icon` table, as raw bytes,
+keyed by the hash of its content. The icon column of the urls then holds the key of their icon,
+which is translated back to the data URI when the DB is imported.
+"""
+
+import base64
+import binascii
+import hashlib
+from typing import Iterable
+
+from sqlalchemy import Connection, inspect, select
+
+from bookmarks_converter.models import DBBookmark, DBFolder, DBIcon, DBUrl
+
+ICON_KEY_PREFIX = "sha256:"
+# maximum number of keys per query when the icons of the urls are looked up, below the
+# maximum number of variables of a SQLite statement.
+ICON_QUERY_BATCH_SIZE = 500
+
+_DATA_URI_PREFIX = "data:"
+_BASE64_SUFFIX = ";base64"
+
+
+def split_data_uri(icon: str) -> tuple[str, bytes] | None:
+    """Split a base64 data URI into its mime type and its decoded data.
+    Returns None if the icon isn't a base64 data URI that can be re-encoded identically."""
+    if not icon or not icon.startswith(_DATA_URI_PREFIX):
+        return None
+    header, separator, payload = icon.partition(",")
+    if not separator or not header.endswith(_BASE64_SUFFIX):
+        return None
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except binascii.Error:
+        return None
+    # the icons must be exported exactly as they were imported.
+    if base64.b64encode(data).decode("ascii") != payload:
+        return None
+    return header[len(_DATA_URI_PREFIX) : -len(_BASE64_SUFFIX)], data
+
+
+def data_uri(mime_type: str, data: bytes) -> str:
+    return f"{_DATA_URI_PREFIX}{mime_type}{_BASE64_SUFFIX},{base64.b64encode(data).decode('ascii')}"
+
+
+def icon_key(mime_type: str, data: bytes) -> str:
+    digest = hashlib.sha256(mime_type.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return f"{ICON_KEY_PREFIX}{digest.hexdigest()}"
+
+
+def extract_icons(bookmarks: DBBookmark) -> list[dict]:
+    """Replace the data URI icons of the urls of the DBBookmark tree by their key, and return
+    the rows of the icon table, one per distinct icon."""
+    icons = {}
+    stack = [bookmarks]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, DBFolder):
+            stack.extend(node.children)
+            continue
+        if not isinstance(node, DBUrl) or not node.icon:
+            continue
+        split = split_data_uri(node.icon)
+        if split is None:
+            continue
+        mime_type, data = split
+        key = icon_key(mime_type, data)
+        icons.setdefault(key, {"key": key, "mime_type": mime_type, "data": data})
+        node.icon = key
+    return list(icons.values())
+
+
+def has_icon_table(connection: Connection) -> bool:
+    return inspect(connection).has_table(DBIcon.__tablename__)
+
+
+def load_icons(connection: Connection, keys: Iterable[str] | None = None) -> dict[str, str]:
+    """Load the icons of the DB as data URIs, by key. If keys are given, only those icons are
+    loaded. DBs saved without an icon table have no icons to load."""
+    if keys is not None:
+        keys = sorted({key for key in keys if key.startswith(ICON_KEY_PREFIX)})
+        if not keys:
+            return {}
+    if not has_icon_table(connection):
+        return {}
+    table = DBIcon.__table__
+    if keys is None:
+        rows = connection.execute(select(table))
+        return {row.key: data_uri(row.mime_type, row.data) for row in rows}
+
+    icons = {}
+    for start in range(0, len(keys), ICON_QUERY_BATCH_SIZE):
+        batch = keys[start : start + ICON_QUERY_BATCH_SIZE]
+        rows = connection.execute(select(table).where(table.c.key.in_(batch)))
+        icons.update((row.key, data_uri(row.mime_type, row.data)) for row in rows)
+    return icons
+
+
+def resolve_icons(connection: Connection, rows: list):
+    """Replace the icon keys of the rows of the bookmark table by their data URI."""
+    icons = load_icons(connection, (row.icon for row in rows if row.icon))
+    if icons:
+        for row in rows:
+            if row.icon in icons:
+                row.icon = icons[row.icon]
@@ -0,0 +1,423 @@
+"""Instrumentation of the conversion stages.
+
+The loading and saving of the bookmarks is split in stages, each wrapped in a `stage` context
+manager. Observers registered with `observe` are notified when the stages start and finish,
+and do nothing (besides an empty list check) when no observer is registered.
+
+The loops of the stages count the nodes they process with the `Progress` returned by
+`current_progress`, which notifies the observers every `PROGRESS_REPORT_NODES` nodes.
+
+The entry points of the converters and of the formats (`from_*`, `as_*` and `save_*`) are
+wrapped in spans by the `traced` decorator, the spans hold the stages of the conversions.
+
+The observers are registered for the current context (see `contextvars`): a thread only
+reports its stages to the observers it registered, or to the ones of the context it runs in,
+so the stages of concurrent conversions are reported to their own observers. The writer threads
+of `formats.save_many` run in a copy of the caller's context, and report to its observers.
+"""
+
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+STAGE_IMPORT = "import"
+STAGE_READ = "read"
+STAGE_FORMAT = "format"
+STAGE_PARSE = "parse"
+STAGE_BUILD = "build"
+STAGE_SERIALIZE = "serialize"
+STAGE_WRITE = "write"
+STAGES = (STAGE_READ, STAGE_FORMAT, STAGE_PARSE, STAGE_BUILD, STAGE_SERIALIZE, STAGE_WRITE)
+
+COUNTER_NODES = "nodes"
+COUNTER_BYTES_IN = "bytes_in"
+COUNTER_BYTES_OUT = "bytes_out"
+
+RSS_SAMPLING_INTERVAL = 0.005
+PROGRESS_REPORT_NODES = 1000
+
+
+class StageObserver:
+    """Base class of the observers notified of the conversion stages."""
+
+    def stage_started(self, name: str):
+        pass
+
+    def stage_finished(self, name: str):
+        pass
+
+    def counter_recorded(self, name: str, value: int):
+        pass
+
+    def progress(self, name: str, nodes: int):
+        pass
+
+    def span_started(self, name: str):
+        pass
+
+    def span_finished(self, name: str, metadata: dict):
+        pass
+
+
+_observers: ContextVar[tuple[StageObserver, ...]] = ContextVar("stage_observers", default=())
+# stack of the progress of the stages running on each thread.
+_local = threading.local()
+# (wall time, cpu time) taken to import the package, set by the package's __init__.
+_import_time: tuple[float, float] | None = None
+
+
+def observing() -> bool:
+    """Whether any observer is registered, to skip computing values nobody would receive."""
+    return bool(_observers.get())
+
+
+def count(name: str, value: int):
+    """Notify the registered observers of a counter value, like the number of nodes loaded."""
+    for observer in _observers.get():
+        observer.counter_recorded(name, value)
+
+
+def set_import_time(wall: float, cpu: float):
+    global _import_time
+    _import_time = (wall, cpu)
+
+
+class Progress:
+    """Count the nodes processed by a stage. The observers are notified every
+    PROGRESS_REPORT_NODES nodes, and when the stage finishes."""
+
+    __slots__ = ("stage", "nodes", "_next_report", "_observers")
+
+    def __init__(self, stage: str, observers: tuple[StageObserver, ...]):
+        self.stage = stage
+        self.nodes = 0
+        self._next_report = PROGRESS_REPORT_NODES
+        self._observers = observers
+
+    def advance(self, nodes: int = 1):
+        self.nodes += nodes
+        if self.nodes >= self._next_report:
+            self._next_report = self.nodes + PROGRESS_REPORT_NODES
+            self.report()
+
+    def report(self):
+        for observer in self._observers:
+            observer.progress(self.stage, self.nodes)
+
+
+class _NoProgress:
+    """Progress of the stages running without observers, which doesn't count anything."""
+
+    __slots__ = ()
+
+    def advance(self, nodes: int = 1):
+        pass
+
+
+_NO_PROGRESS = _NoProgress()
+
+
+def current_progress() -> Progress | _NoProgress:
+    """Return the progress of the innermost stage running on the current thread."""
+    progress = getattr(_local, "progress", None)
+    return progress[-1] if progress else _NO_PROGRESS
+
+
+@contextmanager
+def stage(name: str):
+    """Notify the registered observers that the stage `name` runs inside the block."""
+    observers = _observers.get()
+    if not observers:
+        yield
+        return
+
+    # an observer can cancel the conversion by raising, the observers notified before it still
+    # see the stage finish.
+    started = 0
+    try:
+        for observer in observers:
+            observer.stage_started(name)
+            started += 1
+        progress = Progress(name, observers)
+        if not hasattr(_local, "progress"):
+            _local.progress = []
+        _local.progress.append(progress)
+        try:
+            yield
+            if progress.nodes:
+                progress.report()
+        finally:
+            _local.progress.pop()
+    finally:
+        for observer in reversed(observers[:started]):
+            observer.stage_finished(name)
+
+
+@contextmanager
+def span(name: str):
+    """Notify the registered observers that the span `name` runs inside the block.
+    The block can add metadata to the span in the dictionary it receives."""
+    observers = _observers.get()
+    metadata = {}
+    if not observers:
+        yield metadata
+        return
+
+    for observer in observers:
+        observer.span_started(name)
+    try:
+        yield metadata
+    finally:
+        for observer in reversed(observers):
+            observer.span_finished(name, metadata)
+
+
+def traced(function):
+    """Decorator wrapping the calls of the function in a span named after the function.
+    The bookmarks file passed to the function (if any) and its size are added to the span."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _observers.get():
+            return function(*args, **kwargs)
+
+        with span(function.__qualname__) as metadata:
+            path = next((arg for arg in (*args, *kwargs.values()) if isinstance(arg, Path)), None)
+            if path is not None:
+                metadata["file"] = str(path)
+            result = function(*args, **kwargs)
+            if path is not None and path.is_file():
+                metadata["bytes"] = path.stat().st_size
+            return result
+
+    return wrapper
+
+
+@contextmanager
+def observe(*observers: StageObserver):
+    """Register the observers in the current context for the duration of the block."""
+    token = _observers.set(_observers.get() + observers)
+    try:
+        yield
+    finally:
+        _observers.reset(token)
+
+
+def current_rss() -> int | None:
+    """Return the resident set size of the process in bytes, or None when it isn't available
+    on the platform (it is read from /proc, which only exists on linux)."""
+    try:
+        with open("/proc/self/statm", "rb") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+@dataclass
+class StageMemory:
+    """Memory used by a stage, in bytes.
+
+    peak: int
+        highest memory allocated (traced by tracemalloc) during the stage, above the memory
+        allocated when the stage started.
+    retained: int
+        memory still allocated when the stage finished, for example the parsed tree.
+    rss_peak: int | None
+        highest resident set size sampled during the stage, above the resident set size when
+        the stage started. None if the resident set size isn't available on the platform.
+    """
+
+    stage: str
+    peak: int
+    retained: int
+    rss_peak: int | None = None
+
+
+@dataclass
+class StageTiming:
+    """Time taken by a stage, in seconds. The cpu time is the time of the thread running the
+    stage (the import stage reports the cpu time of the process)."""
+
+    stage: str
+    wall: float
+    cpu: float
+
+
+class TimingRecorder(StageObserver):
+    """Record the wall and cpu time of each stage, and the counters (number of nodes and bytes
+    read and written) of the conversions:
+
+        with TimingRecorder() as timings:
+            tree = converter.from_html(path)
+        print(timings.report())
+
+    include_import: bool
+        add the time taken to import the package as the first stage.
+    """
+
+    def __init__(self, include_import: bool = False):
+        self.stages: list[StageTiming] = []
+        self.counters: dict[str, int] = {}
+        self._started = {}
+        self._lock = threading.Lock()
+        self._observing = None
+        if include_import and _import_time is not None:
+            self.stages.append(StageTiming(STAGE_IMPORT, *_import_time))
+
+    def __enter__(self):
+        self._observing = observe(self)
+        self._observing.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observing.__exit__(*exc_info)
+
+    def stage_started(self, name: str):
+        key = (threading.get_ident(), name)
+        self._started[key] = (time.perf_counter(), time.thread_time())
+
+    def stage_finished(self, name: str):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        wall_started, cpu_started = self._started.pop((threading.get_ident(), name))
+        with self._lock:
+            self.stages.append(StageTiming(name, wall - wall_started, cpu - cpu_started))
+
+    def counter_recorded(self, name: str, value: int):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": [asdict(stage_timing) for stage_timing in self.stages],
+            "counters": dict(self.counters),
+        }
+
+    def report(self) -> str:
+        """Human readable report of the stages timings and of the counters."""
+        lines = [f"{'stage':<10}{'wall (s)':>12}{'cpu (s)':>12}"]
+        for stage_timing in self.stages:
+            lines.append(
+                f"{stage_timing.stage:<10}{stage_timing.wall:>12.4f}{stage_timing.cpu:>12.4f}"
+            )
+        for name, value in self.counters.items():
+            lines.append(f"{name.replace('_', ' ')}: {value}")
+        return "\n".join(lines) + "\n"
+
+
+class _Frame:
+    def __init__(self, name: str, traced: int, rss: int | None):
+        self.name = name
+        self.traced = traced
+        self.traced_peak = traced
+        self.rss = rss
+        self.rss_peak = rss
+
+
+class MemoryRecorder(StageObserver):
+    """Record the peak and retained memory of each stage, using tracemalloc and by sampling the
+    resident set size of the process on a background thread.
+
+    tracemalloc slows the conversions down considerably, so the recorder is meant to be used in
+    benchmarks and tests:
+
+        with MemoryRecorder() as recorder:
+            tree = converter.from_html(path)
+        print(recorder.report())
+    """
+
+    def __init__(self, sampling_interval: float = RSS_SAMPLING_INTERVAL):
+        self.sampling_interval = sampling_interval
+        self.stages: list[StageMemory] = []
+        self._frames: list[_Frame] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+        self._observing = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._stopped.clear()
+        if current_rss() is not None:
+            self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self._sampler.start()
+        self._observing = observe(self)
+        self._observing.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observing.__exit__(*exc_info)
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _sample_rss(self):
+        while not self._stopped.wait(self.sampling_interval):
+            rss = current_rss()
+            with self._lock:
+                for frame in self._frames:
+                    frame.rss_peak = max(frame.rss_peak, rss)
+
+    def _update_peaks(self):
+        """Fold the traced peak into the open stages, before it is reset or read."""
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self._frames:
+            frame.traced_peak = max(frame.traced_peak, peak)
+
+    def stage_started(self, name: str):
+        with self._lock:
+            self._update_peaks()
+            # reset the peak, so the peak of the new stage only covers its own allocations.
+            tracemalloc.reset_peak()
+            self._frames.append(_Frame(name, tracemalloc.get_traced_memory()[0], current_rss()))
+
+    def stage_finished(self, name: str):
+        rss = current_rss()
+        with self._lock:
+            self._update_peaks()
+            # the stages of concurrent conversions can finish in any order.
+            index = max(i for i, frame in enumerate(self._frames) if frame.name == name)
+            frame = self._frames.pop(index)
+
+        rss_peak = None
+        if frame.rss is not None:
+            rss_peak = max(frame.rss_peak, rss) - frame.rss
+        traced = tracemalloc.get_traced_memory()[0]
+        self.stages.append(
+            StageMemory(
+                stage=name,
+                peak=frame.traced_peak - frame.traced,
+                retained=traced - frame.traced,
+                rss_peak=rss_peak,
+            )
+        )
+
+    def as_dict(self) -> list[dict]:
+        return [asdict(stage_memory) for stage_memory in self.stages]
+
+    def report(self) -> str:
+        """Human readable report of the memory used by the stages, in MiB."""
+        lines = [f"{'stage':<10}{'peak':>12}{'retained':>12}{'rss peak':>12}"]
+        for stage_memory in self.stages:
+            rss_peak = "-"
+            if stage_memory.rss_peak is not None:
+                rss_peak = f"{stage_memory.rss_peak / 1024 / 1024:.2f}"
+            lines.append(
+                f"{stage_memory.stage:<10}"
+                f"{stage_memory.peak / 1024 / 1024:>12.2f}"
+                f"{stage_memory.retained / 1024 / 1024:>12.2f}"
+                f"{rss_peak:>12}"
+            )
+        return "\n".join(lines) + "\n"
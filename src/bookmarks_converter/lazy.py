@@ -0,0 +1,122 @@
+"""Lazy Bookmark trees backed by a Bookmarkie DB.
+
+The children of a LazyFolder are only fetched from the DB, with an indexed query on their
+parent id, when they are first accessed. The loaded folders are kept in a bounded LRU cache, so
+browsing or filtering a small part of a huge DB never loads (or keeps in memory) the whole tree.
+
+The lazy trees don't own any connection to their DB: each query opens the DB with
+`engines.open_engine`. Inside a `with EngineCache():` block the queries reuse the engine of the
+cache, which is disposed when the block exits, outside of one each query opens and closes its
+own connection. A lazy tree can be dropped at any time without leaking connections.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import fields
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+
+from sqlalchemy import select
+
+from bookmarks_converter.cache import CacheStats
+from bookmarks_converter.engines import open_engine
+from bookmarks_converter.icons import resolve_icons
+from bookmarks_converter.models import Bookmark, DBBookmark, Folder
+from bookmarks_converter.tags import resolve_tags
+
+# maximum number of folders whose children are kept loaded.
+LAZY_DEFAULT_MAX_FOLDERS = 1024
+
+
+class FolderLoader:
+    """Load the children of the folders of a Bookmarkie DB, on demand.
+
+    The children of the `max_folders` most recently accessed folders are cached, the least
+    recently used ones are dropped from the cache and fetched again on their next access.
+
+    filepath: Path
+        path of the sqlite3 DB bookmarks file.
+    convert: Callable
+        converts a row of the bookmark table (and the loader) into a Url or LazyFolder.
+    max_folders: int
+        maximum number of folders whose children are cached.
+    """
+
+    def __init__(
+        self,
+        filepath: Path,
+        convert: Callable[[SimpleNamespace, "FolderLoader"], Bookmark],
+        max_folders: int = LAZY_DEFAULT_MAX_FOLDERS,
+    ):
+        if max_folders < 1:
+            raise ValueError("max_folders must be at least 1.")
+        self.filepath = filepath
+        self.max_folders = max_folders
+        self.stats = CacheStats()
+        self._convert = convert
+        self._cache: OrderedDict[int, list[Bookmark]] = OrderedDict()
+        # the trees can be exported concurrently (see formats.save_many).
+        self._lock = threading.Lock()
+
+    def _rows(self, *criteria) -> list[SimpleNamespace]:
+        table = DBBookmark.__table__
+        with open_engine(self.filepath) as engine, engine.connect() as connection:
+            rows = connection.execute(select(table).where(*criteria).order_by(table.c.index))
+            rows = [SimpleNamespace(**row) for row in rows.mappings()]
+            resolve_icons(connection, rows)
+            resolve_tags(connection, rows)
+        return rows
+
+    def load(self, *criteria) -> Bookmark | None:
+        """Load the first bookmark of the DB matching the criteria, without its descendants."""
+        with self._lock:
+            rows = self._rows(*criteria)
+        return self._convert(rows[0], self) if rows else None
+
+    def children(self, folder_id: int) -> list[Bookmark]:
+        """The children of the folder, sorted by index."""
+        with self._lock:
+            children = self._cache.get(folder_id)
+            if children is not None:
+                self._cache.move_to_end(folder_id)
+                self.stats.hits += 1
+                return children
+
+            self.stats.misses += 1
+            rows = self._rows(DBBookmark.__table__.c.parent_id == folder_id)
+            children = [self._convert(row, self) for row in rows]
+            self._cache[folder_id] = children
+            while len(self._cache) > self.max_folders:
+                self._cache.popitem(last=False)
+                self.stats.evictions += 1
+            return children
+
+
+class LazyFolder(Folder):
+    """Folder of a Bookmarkie DB whose children are loaded by its FolderLoader on first access.
+
+    Children assigned to the folder replace the ones of the DB, and are never evicted. A lazy
+    folder compares equal to the (eagerly loaded) Folder with the same fields and children.
+    """
+
+    def __init__(self, loader: FolderLoader, **kwargs):
+        self.loader = loader
+        super().__init__(**kwargs)
+        # the dataclass __init__ assigns the default (empty) children.
+        self._children = None
+
+    @property
+    def children(self) -> list[Bookmark]:
+        if self._children is not None:
+            return self._children
+        return self.loader.children(self.id)
+
+    @children.setter
+    def children(self, children: list[Bookmark]):
+        self._children = children
+
+    def __eq__(self, other):
+        if not isinstance(other, Folder):
+            return NotImplemented
+        return all(getattr(self, f.name) == getattr(other, f.name) for f in fields(Folder))
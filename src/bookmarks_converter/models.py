@@ -3,12 +3,14 @@ import time
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Optional
-from uuid import uuid4
 
 from bs4 import Tag
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Integer, LargeBinary, String
 from sqlalchemy.orm import DeclarativeBase, Mapped, relationship
 
+from bookmarks_converter.guid import guids
+from bookmarks_converter.instrumentation import current_progress
+
 TYPE_FOLDER = "folder"
 TYPE_URL = "url"
 
@@ -73,7 +75,7 @@ class DBBookmark(Base):
     type : str
         type of the bookmark (url/folder)
     parent_id : int
-        id of the folder the bookmark (url/folder) is contained in
+        id of the folder the bookmark (url/folder) is contained in (indexed, to load subtrees)
     parent : relation
         Many to One relation for the Folder, containing the bookmarks (url/folder)
     """
@@ -81,10 +83,10 @@ class DBBookmark(Base):
     __tablename__ = "bookmark"
 
     id = Column(Integer, primary_key=True)
-    guid = Column(String, unique=True, default=str(uuid4()))
+    guid = Column(String, unique=True, default=lambda: guids.uuid())
     title = Column(String)
     index = Column(Integer)
-    parent_id = Column(Integer, ForeignKey("bookmark.id"), nullable=True)
+    parent_id = Column(Integer, ForeignKey("bookmark.id"), nullable=True, index=True)
     date_added = Column(Integer, nullable=False, default=round(time.time() * 1000))
     date_modified = Column(Integer, nullable=False, default=0)
     type = Column(String)
@@ -98,16 +100,18 @@ class DBBookmark(Base):
         if not isinstance(other, type(self)):
             return ValueError
         # skip if the attribute is '_sa_instance_state' which is in .__dict__
-        # since the object is a sqlalchemy object.
-        remove = "_sa_instance_state"
-        vars_self = {k: v for k, v in self.__dict__.items() if k != remove}
-        vars_other = {k: v for k, v in other.__dict__.items() if k != remove}
+        # since the object is a sqlalchemy object, and the attributes which aren't columns.
+        remove = ("_sa_instance_state", "tag_names")
+        vars_self = {k: v for k, v in self.__dict__.items() if k not in remove}
+        vars_other = {k: v for k, v in other.__dict__.items() if k not in remove}
         return vars_self == vars_other
 
     def __repr__(self):
         """__repr__ function that mimics the @dataclass __repr__ method."""
         sorted_field = sorted(
-            field_ for field_ in vars(self) if field_ not in ("_sa_instance_state", "parent")
+            field_
+            for field_ in vars(self)
+            if field_ not in ("_sa_instance_state", "parent", "tag_names")
         )
         fields = (
             f"{name}={value!r}"
@@ -199,12 +203,17 @@ class DBUrl(DBBookmark):
     icon_uri : str
         html icon_uri found in firefox bookmarks
     tags : str
-        tags describing url"""
+        tags describing url, joined with commas (kept for the search index and the older
+        versions, the tags are read from the tag tables)
+    tag_names : list[str]
+        tags of the url, written to the tag and bookmark_tag tables (not a column, None if the
+        url was loaded from a DB)"""
 
     url = Column(String)
     icon = Column(String)
     icon_uri = Column(String)
     tags = Column(String)
+    tag_names = None
 
     __mapper_args__ = {"polymorphic_identity": "url", "polymorphic_on": "type"}
 
@@ -221,6 +230,7 @@ class DBUrl(DBBookmark):
         icon=None,
         icon_uri=None,
         tags=None,
+        tag_names=None,
     ):
         self.type = "url"
         if _id:
@@ -238,6 +248,153 @@ class DBUrl(DBBookmark):
         self.icon = icon
         self.icon_uri = icon_uri
         self.tags = tags
+        self.tag_names = tag_names
+
+
+class DBIcon(Base):
+    """Model of the icons of the urls, stored once per distinct icon (when the DB is saved with
+    an icon table, see icons.py).
+    ...
+    Attributes
+    ----------
+    key : str
+        "sha256:" followed by the hex digest of the mime type and data of the icon, stored in
+        the icon column of the urls using the icon.
+    mime_type : str
+        mime type of the icon, ex. "image/png"
+    data : bytes
+        raw (decoded) icon data"""
+
+    __tablename__ = "icon"
+
+    key = Column(String, primary_key=True)
+    mime_type = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+
+class DBTag(Base):
+    """Model of the tags of the urls, each tag name is stored once.
+    ...
+    Attributes
+    ----------
+    id : int
+        id of the tag
+    name : str
+        name of the tag (unique and indexed)"""
+
+    __tablename__ = "tag"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+class DBBookmarkTag(Base):
+    """Model of the tags of each url, in the order of the tags of the url.
+    ...
+    Attributes
+    ----------
+    bookmark_id : int
+        id of the url
+    position : int
+        position of the tag in the tags of the url
+    tag_id : int
+        id of the tag (indexed, to find the urls with a tag)"""
+
+    __tablename__ = "bookmark_tag"
+
+    bookmark_id = Column(Integer, ForeignKey("bookmark.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tag.id"), nullable=False, index=True)
+
+
+class DBSnapshot(Base):
+    """Model of the snapshots of a history DB (see history.py).
+    ...
+    Attributes
+    ----------
+    id : int
+        number of the snapshot, the snapshots are numbered from 1 in the order they were added.
+    created : int
+        date the snapshot was added on
+    root_id : int
+        id of the node of the root folder of the snapshot
+    root_index : int
+        index of the root folder
+    size : int
+        number of bookmarks (urls/folders) in the snapshot
+    new_nodes : int
+        number of nodes added by the snapshot, the other nodes are shared with the previous
+        snapshots"""
+
+    __tablename__ = "snapshot"
+
+    id = Column(Integer, primary_key=True)
+    created = Column(Integer, nullable=False)
+    root_id = Column(Integer, ForeignKey("snapshot_node.id"), nullable=False)
+    root_index = Column(Integer)
+    size = Column(Integer, nullable=False)
+    new_nodes = Column(Integer, nullable=False)
+
+
+class DBSnapshotNode(Base):
+    """Model of the bookmarks (urls/folders) of the snapshots of a history DB, stored once per
+    distinct content. The content of a folder includes its children, so an unchanged subtree
+    is the same node in every snapshot.
+    ...
+    Attributes
+    ----------
+    id : int
+        id of the node
+    hash : str
+        hex digest of the content of the node and of its subtree (unique)
+    type : str
+        type of the bookmark (url/folder)
+    bookmark_id : int
+        id of the bookmark
+    guid, title, date_added, date_modified : see DBBookmark
+    special_folder : str
+        special folder of the folders, see DBFolder
+    url, icon, icon_uri : see DBUrl, the icons are stored in the icon table
+    tags : str
+        tags of the urls, as a json list"""
+
+    __tablename__ = "snapshot_node"
+
+    id = Column(Integer, primary_key=True)
+    hash = Column(String, unique=True, nullable=False)
+    type = Column(String, nullable=False)
+    bookmark_id = Column(Integer)
+    guid = Column(String)
+    title = Column(String)
+    date_added = Column(Integer)
+    date_modified = Column(Integer)
+    special_folder = Column(String)
+    url = Column(String)
+    icon = Column(String)
+    icon_uri = Column(String)
+    tags = Column(String)
+
+
+class DBSnapshotChild(Base):
+    """Model of the children of the folder nodes of a history DB, in order.
+    ...
+    Attributes
+    ----------
+    parent_id : int
+        id of the folder node
+    position : int
+        position of the child in the children of the folder
+    child_id : int
+        id of the node of the child (indexed)
+    index : int
+        index of the child in the folder"""
+
+    __tablename__ = "snapshot_child"
+
+    parent_id = Column(Integer, ForeignKey("snapshot_node.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    child_id = Column(Integer, ForeignKey("snapshot_node.id"), nullable=False, index=True)
+    index = Column(Integer)
 
 
 class HTMLBookmark(Tag):
@@ -262,14 +419,18 @@ class HTMLBookmark(Tag):
         if self.name in ("a", "h3"):
             if not self.attrs.get("id"):
                 self.attrs["id"] = next(__class__.id_counter)
-        self.attrs["guid"] = str(uuid4())
+            # the tags are created by BeautifulSoup while it parses the file, counting them
+            # reports the progress of (and checks the deadline during) the parse stage.
+            current_progress().advance()
+        self._guid = None
 
     @property
     def date_added(self) -> int:
         """The date_added value in html bookmarks is in seconds, so we convert to microseconds"""
         date_added = self.attrs.get("add_date")
         if not date_added:
-            date_added = round(time.time() * 1000)
+            # deterministic conversions must not depend on the time they are run at.
+            date_added = 0 if guids.deterministic else round(time.time() * 1000)
         return int(date_added) * 1000_000
 
     @property
@@ -298,7 +459,19 @@ class HTMLBookmark(Tag):
 
     @property
     def guid(self) -> str:
-        return self.attrs.get("guid")
+        """The guid is only generated when first accessed, so the tags which are not
+        converted into bookmarks don't consume any.
+        The id (position of the element in the html file), url, title and add_date are used as
+        the content of deterministic guids.
+        A guid attribute found in the html file is replaced, as it always was."""
+        if self._guid is None:
+            self._guid = self.attrs["guid"] = guids.uuid(
+                self.attrs.get("id"),
+                self.url,
+                self.title,
+                self.attrs.get("add_date"),
+            )
+        return self._guid
 
     @property
     def index(self) -> int:
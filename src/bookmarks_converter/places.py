@@ -0,0 +1,524 @@
+"""Tables of the Firefox places database (places.sqlite).
+
+Firefox stores the bookmarks in the `moz_bookmarks` table, and their urls once per distinct url
+in the `moz_places` table, which is shared with the browsing history. The tags are folders of
+the tags folder, holding a bookmark of each tagged url. `PlacesRows` converts the bookmarks into
+the rows of these tables, and `write_places` inserts them with batched statements, so databases
+of hundreds of thousands of bookmarks are written in seconds.
+
+`create_places_tables` creates every table and index of the places database, and sets its schema
+version, like Firefox creates a new profile: Firefox treats a database without a schema version
+as corrupt and replaces it, and migrates the older (or newer) schema versions when it opens them.
+The history, keywords and annotations tables are left empty.
+"""
+
+import itertools
+from urllib.parse import urlsplit
+
+from sqlalchemy import (
+    BLOB,
+    CheckConstraint,
+    Column,
+    Connection,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    UniqueConstraint,
+    func,
+    select,
+    text,
+)
+
+from bookmarks_converter.guid import guids
+from bookmarks_converter.models import Folder, SpecialFolder, Url
+
+# values of the type column of the moz_bookmarks table.
+PLACES_TYPE_BOOKMARK = 1
+PLACES_TYPE_FOLDER = 2
+PLACES_TYPE_SEPARATOR = 3
+# sync status of the bookmarks that were never synced.
+PLACES_SYNC_STATUS_NEW = 1
+
+PLACES_ROOT_ID = 1
+PLACES_TAGS_FOLDER_ID = 4
+PLACES_TAGS_FOLDER_GUID = "tags________"
+# the folders always present in places.sqlite: (id, guid, title, parent, position), the tags
+# folder is the only one without a matching special folder.
+PLACES_ROOTS = {
+    SpecialFolder.ROOT: (PLACES_ROOT_ID, "root________", "", 0, 0),
+    SpecialFolder.MENU: (2, "menu________", "menu", PLACES_ROOT_ID, 0),
+    SpecialFolder.TOOLBAR: (3, "toolbar_____", "toolbar", PLACES_ROOT_ID, 1),
+    None: (PLACES_TAGS_FOLDER_ID, PLACES_TAGS_FOLDER_GUID, "tags", PLACES_ROOT_ID, 2),
+    SpecialFolder.OTHER: (5, "unfiled_____", "unfiled", PLACES_ROOT_ID, 3),
+    SpecialFolder.MOBILE: (6, "mobile______", "mobile", PLACES_ROOT_ID, 4),
+}
+# the bookmarks outside of the special folders are moved to the unfiled folder.
+PLACES_DEFAULT_FOLDER = SpecialFolder.OTHER
+
+PLACES_BATCH_SIZE = 10_000
+
+# the version of the places schema created by `create_places_tables` (`DATABASE_SCHEMA_VERSION`
+# in toolkit/components/places/Database.cpp), stored in the user_version of the database.
+PLACES_SCHEMA_VERSION = 77
+
+# firefox only hashes the first characters of the urls, and looks for the scheme in the first
+# characters (see `HashURL` in toolkit/components/places/Helpers.cpp).
+_URL_HASH_MAX_LENGTH = 1500
+_URL_HASH_MAX_PREFIX_LENGTH = 50
+_GOLDEN_RATIO = 0x9E3779B9
+_UINT32_MASK = 0xFFFFFFFF
+
+places_metadata = MetaData()
+
+moz_origins = Table(
+    "moz_origins",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("prefix", Text, nullable=False),
+    Column("host", Text, nullable=False),
+    Column("frecency", Integer, nullable=False),
+    Column("recalc_frecency", Integer, nullable=False, server_default=text("0")),
+    Column("alt_frecency", Integer),
+    Column("recalc_alt_frecency", Integer, nullable=False, server_default=text("0")),
+    UniqueConstraint("prefix", "host"),
+)
+
+moz_places = Table(
+    "moz_places",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("url", Text),
+    Column("title", Text),
+    Column("rev_host", Text),
+    Column("visit_count", Integer, server_default=text("0")),
+    Column("hidden", Integer, nullable=False, server_default=text("0")),
+    Column("typed", Integer, nullable=False, server_default=text("0")),
+    Column("frecency", Integer, nullable=False, server_default=text("-1")),
+    Column("last_visit_date", Integer),
+    Column("guid", Text),
+    Column("foreign_count", Integer, nullable=False, server_default=text("0")),
+    Column("url_hash", Integer, nullable=False, server_default=text("0")),
+    Column("description", Text),
+    Column("preview_image_url", Text),
+    Column("site_name", Text),
+    Column("origin_id", Integer, ForeignKey("moz_origins.id")),
+    Column("recalc_frecency", Integer, nullable=False, server_default=text("0")),
+    Column("alt_frecency", Integer),
+    Column("recalc_alt_frecency", Integer, nullable=False, server_default=text("0")),
+)
+Index("moz_places_url_hashindex", moz_places.c.url_hash)
+Index("moz_places_hostindex", moz_places.c.rev_host)
+Index("moz_places_visitcount", moz_places.c.visit_count)
+Index("moz_places_frecencyindex", moz_places.c.frecency)
+Index("moz_places_lastvisitdateindex", moz_places.c.last_visit_date)
+Index("moz_places_guid_uniqueindex", moz_places.c.guid, unique=True)
+Index("moz_places_originidindex", moz_places.c.origin_id)
+Index("moz_places_altfrecencyindex", moz_places.c.alt_frecency)
+
+moz_places_extra = Table(
+    "moz_places_extra",
+    places_metadata,
+    Column("place_id", Integer, ForeignKey("moz_places.id", ondelete="CASCADE"), primary_key=True),
+    Column("sync_json", Text),
+)
+
+moz_historyvisits = Table(
+    "moz_historyvisits",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("from_visit", Integer),
+    Column("place_id", Integer),
+    Column("visit_date", Integer),
+    Column("visit_type", Integer),
+    Column("session", Integer),
+    Column("source", Integer, nullable=False, server_default=text("0")),
+    Column("triggeringPlaceId", Integer),
+)
+Index(
+    "moz_historyvisits_placedateindex",
+    moz_historyvisits.c.place_id,
+    moz_historyvisits.c.visit_date,
+)
+Index("moz_historyvisits_fromindex", moz_historyvisits.c.from_visit)
+Index("moz_historyvisits_dateindex", moz_historyvisits.c.visit_date)
+
+moz_historyvisits_extra = Table(
+    "moz_historyvisits_extra",
+    places_metadata,
+    Column(
+        "visit_id",
+        Integer,
+        ForeignKey("moz_historyvisits.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column("sync_json", Text),
+)
+
+moz_inputhistory = Table(
+    "moz_inputhistory",
+    places_metadata,
+    Column("place_id", Integer, primary_key=True, autoincrement=False),
+    Column("input", Text, primary_key=True),
+    Column("use_count", Integer),
+)
+
+moz_bookmarks = Table(
+    "moz_bookmarks",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("type", Integer),
+    Column("fk", Integer, server_default=text("NULL")),
+    Column("parent", Integer),
+    Column("position", Integer),
+    Column("title", Text),
+    Column("keyword_id", Integer),
+    Column("folder_type", Text),
+    Column("dateAdded", Integer),
+    Column("lastModified", Integer),
+    Column("guid", Text),
+    Column("syncStatus", Integer, nullable=False, server_default=text("0")),
+    Column("syncChangeCounter", Integer, nullable=False, server_default=text("1")),
+)
+Index("moz_bookmarks_itemindex", moz_bookmarks.c.fk, moz_bookmarks.c.type)
+Index("moz_bookmarks_parentindex", moz_bookmarks.c.parent, moz_bookmarks.c.position)
+Index("moz_bookmarks_itemlastmodifiedindex", moz_bookmarks.c.fk, moz_bookmarks.c.lastModified)
+Index("moz_bookmarks_dateaddedindex", moz_bookmarks.c.dateAdded)
+Index("moz_bookmarks_guid_uniqueindex", moz_bookmarks.c.guid, unique=True)
+
+moz_bookmarks_deleted = Table(
+    "moz_bookmarks_deleted",
+    places_metadata,
+    Column("guid", Text, primary_key=True),
+    Column("dateRemoved", Integer, nullable=False, server_default=text("0")),
+)
+
+moz_keywords = Table(
+    "moz_keywords",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("keyword", Text, unique=True),
+    Column("place_id", Integer),
+    Column("post_data", Text),
+    sqlite_autoincrement=True,
+)
+Index(
+    "moz_keywords_placepostdata_uniqueindex",
+    moz_keywords.c.place_id,
+    moz_keywords.c.post_data,
+    unique=True,
+)
+
+moz_anno_attributes = Table(
+    "moz_anno_attributes",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(32), nullable=False, unique=True),
+)
+
+
+def _annos_table(name: str, item_column: str) -> Table:
+    """moz_annos and moz_items_annos only differ by the column of the annotated item."""
+    return Table(
+        name,
+        places_metadata,
+        Column("id", Integer, primary_key=True),
+        Column(item_column, Integer, nullable=False),
+        Column("anno_attribute_id", Integer),
+        Column("content", Text),
+        Column("flags", Integer, server_default=text("0")),
+        Column("expiration", Integer, server_default=text("0")),
+        Column("type", Integer, server_default=text("0")),
+        Column("dateAdded", Integer, server_default=text("0")),
+        Column("lastModified", Integer, server_default=text("0")),
+    )
+
+
+moz_annos = _annos_table("moz_annos", "place_id")
+Index(
+    "moz_annos_placeattributeindex",
+    moz_annos.c.place_id,
+    moz_annos.c.anno_attribute_id,
+    unique=True,
+)
+moz_items_annos = _annos_table("moz_items_annos", "item_id")
+Index(
+    "moz_items_annos_itemattributeindex",
+    moz_items_annos.c.item_id,
+    moz_items_annos.c.anno_attribute_id,
+    unique=True,
+)
+
+moz_meta = Table(
+    "moz_meta",
+    places_metadata,
+    Column("key", Text, primary_key=True),
+    # the values have no type in firefox, a BLOB column has the same (lack of) affinity.
+    Column("value", BLOB, nullable=False),
+    sqlite_with_rowid=False,
+)
+
+moz_places_metadata_search_queries = Table(
+    "moz_places_metadata_search_queries",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("terms", Text, nullable=False, unique=True),
+)
+
+moz_places_metadata = Table(
+    "moz_places_metadata",
+    places_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("place_id", Integer, ForeignKey("moz_places.id", ondelete="CASCADE"), nullable=False),
+    Column("referrer_place_id", Integer, ForeignKey("moz_places.id", ondelete="CASCADE")),
+    *(
+        Column(name, Integer, nullable=False, server_default=text("0"))
+        for name in (
+            "created_at",
+            "updated_at",
+            "total_view_time",
+            "typing_time",
+            "key_presses",
+            "scrolling_time",
+            "scrolling_distance",
+            "document_type",
+        )
+    ),
+    Column(
+        "search_query_id",
+        Integer,
+        ForeignKey("moz_places_metadata_search_queries.id", ondelete="CASCADE"),
+    ),
+    CheckConstraint("place_id != referrer_place_id"),
+)
+Index(
+    "moz_places_metadata_placecreated_uniqueindex",
+    moz_places_metadata.c.place_id,
+    moz_places_metadata.c.created_at,
+    unique=True,
+)
+Index("moz_places_metadata_referrerindex", moz_places_metadata.c.referrer_place_id)
+
+moz_previews_tombstones = Table(
+    "moz_previews_tombstones",
+    places_metadata,
+    Column("hash", Text, primary_key=True),
+    sqlite_with_rowid=False,
+)
+
+
+def _hash_string(data: bytes) -> int:
+    """mozilla::HashString (mfbt/HashFunctions.h)."""
+    hash_ = 0
+    for byte in data:
+        rotated = ((hash_ << 5) | (hash_ >> 27)) & _UINT32_MASK
+        hash_ = (_GOLDEN_RATIO * (rotated ^ byte)) & _UINT32_MASK
+    return hash_
+
+
+def url_hash(url: str) -> int:
+    """The url_hash of the url in moz_places, used by firefox to look the urls up: the hash of
+    the url, prefixed by 16 bits of the hash of its scheme."""
+    spec = url.encode("utf-8")
+    hash_ = _hash_string(spec[:_URL_HASH_MAX_LENGTH])
+    prefix, separator, _ = spec[:_URL_HASH_MAX_PREFIX_LENGTH].partition(b":")
+    if not separator:
+        return hash_
+    return ((_hash_string(prefix) & 0xFFFF) << 32) + hash_
+
+
+def _split_origin(url: str) -> tuple[str, str, str]:
+    """The prefix and host of the origin of the url, and the reversed host of moz_places."""
+    try:
+        parts = urlsplit(url)
+        hostname = parts.hostname or ""
+        host = f"{hostname}:{parts.port}" if parts.port else hostname
+    except ValueError:
+        parts = urlsplit("")
+        hostname = host = ""
+    prefix = f"{parts.scheme}://" if parts.netloc else f"{parts.scheme}:"
+    rev_host = f"{hostname[::-1]}." if hostname else ""
+    return prefix, host, rev_host
+
+
+class PlacesRows:
+    """The rows of the places tables of a bookmark tree, added one bookmark at a time.
+
+    The folders and urls are added parent first, with the id of their parent in moz_bookmarks.
+    The special folders are mapped to the folders always present in places.sqlite, whose rows
+    are only returned once the tree is complete. The rows can be taken before the tree is
+    complete, to insert large trees without holding all their rows in memory.
+
+    The guids of moz_bookmarks are unique, a guid already given to another bookmark (ex. two
+    bookmarks of the input file sharing a guid) is replaced by a new one.
+    """
+
+    def __init__(self):
+        self.origins: list[dict] = []
+        self.places: list[dict] = []
+        self.bookmarks: list[dict] = []
+        self._ids = itertools.count(max(root[0] for root in PLACES_ROOTS.values()) + 1)
+        self._place_ids: dict[str, int] = {}
+        self._origin_ids: dict[tuple[str, str], int] = {}
+        self._tag_ids: dict[str, int] = {}
+        # the next position in each folder.
+        self._positions: dict[int, int] = {PLACES_ROOT_ID: len(PLACES_ROOTS) - 1}
+        self._guids: set[str] = {root[1] for root in PLACES_ROOTS.values()}
+        self._roots = {
+            special_folder: self._row(id_, PLACES_TYPE_FOLDER, None, parent, position, title, guid)
+            for special_folder, (id_, guid, title, parent, position) in PLACES_ROOTS.items()
+        }
+
+    @staticmethod
+    def _row(
+        id_: int,
+        type_: int,
+        fk: int | None,
+        parent: int,
+        position: int,
+        title: str | None,
+        guid: str,
+    ) -> dict:
+        return {
+            "id": id_,
+            "type": type_,
+            "fk": fk,
+            "parent": parent,
+            "position": position,
+            "title": title,
+            "dateAdded": 0,
+            "lastModified": 0,
+            "guid": guid,
+            "syncStatus": PLACES_SYNC_STATUS_NEW,
+        }
+
+    def _child_row(
+        self, type_: int, fk: int | None, parent: int, title: str | None, guid: str
+    ) -> dict:
+        """A new bookmark row, after the last child of its parent."""
+        position = self._positions.get(parent, 0)
+        self._positions[parent] = position + 1
+        id_ = next(self._ids)
+        while guid in self._guids:
+            guid = guids.mozilla_guid(guid, id_)
+        self._guids.add(guid)
+        return self._row(id_, type_, fk, parent, position, title, guid)
+
+    @staticmethod
+    def _set_dates(row: dict, bookmark: Folder | Url):
+        row["dateAdded"] = bookmark.date_added
+        row["lastModified"] = bookmark.date_modified or bookmark.date_added
+
+    def _parent(self, parent_id: int) -> int:
+        if parent_id == PLACES_ROOT_ID:
+            return PLACES_ROOTS[PLACES_DEFAULT_FOLDER][0]
+        return parent_id
+
+    def add_folder(self, folder: Folder, guid: str, parent_id: int) -> int:
+        """Add the folder, and return its id. The special folders take the id (and guid) of the
+        matching places folder."""
+        if folder.special_folder is not None:
+            root = self._roots[folder.special_folder]
+            self._set_dates(root, folder)
+            return root["id"]
+        row = self._child_row(PLACES_TYPE_FOLDER, None, self._parent(parent_id), folder.title, guid)
+        self._set_dates(row, folder)
+        self.bookmarks.append(row)
+        return row["id"]
+
+    def add_url(self, url: Url, guid: str, parent_id: int) -> int:
+        """Add the url, and its tags, and return its id."""
+        place_id = self._place_id(url)
+        row = self._child_row(
+            PLACES_TYPE_BOOKMARK, place_id, self._parent(parent_id), url.title, guid
+        )
+        self._set_dates(row, url)
+        self.bookmarks.append(row)
+        for tag in dict.fromkeys(url.tags):
+            tag_row = self._child_row(
+                PLACES_TYPE_BOOKMARK,
+                place_id,
+                self._tag_id(tag, url),
+                None,
+                guids.mozilla_guid(guid, tag),
+            )
+            self._set_dates(tag_row, url)
+            self.bookmarks.append(tag_row)
+        return row["id"]
+
+    def _place_id(self, url: Url) -> int:
+        place_id = self._place_ids.get(url.url)
+        if place_id is not None:
+            return place_id
+        place_id = len(self._place_ids) + 1
+        self._place_ids[url.url] = place_id
+        prefix, host, rev_host = _split_origin(url.url)
+        origin_id = self._origin_ids.get((prefix, host))
+        if origin_id is None:
+            origin_id = len(self._origin_ids) + 1
+            self._origin_ids[(prefix, host)] = origin_id
+            self.origins.append({"id": origin_id, "prefix": prefix, "host": host, "frecency": 0})
+        self.places.append(
+            {
+                "id": place_id,
+                "url": url.url,
+                "title": url.title,
+                "rev_host": rev_host,
+                "guid": guids.mozilla_guid(url.url),
+                "url_hash": url_hash(url.url),
+                "origin_id": origin_id,
+                # let firefox compute the frecency of the places.
+                "recalc_frecency": 1,
+            }
+        )
+        return place_id
+
+    def _tag_id(self, tag: str, url: Url) -> int:
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            row = self._child_row(
+                PLACES_TYPE_FOLDER,
+                None,
+                PLACES_TAGS_FOLDER_ID,
+                tag,
+                guids.mozilla_guid(PLACES_TAGS_FOLDER_GUID, tag),
+            )
+            self._set_dates(row, url)
+            self.bookmarks.append(row)
+            tag_id = self._tag_ids[tag] = row["id"]
+        return tag_id
+
+    def __len__(self) -> int:
+        return len(self.origins) + len(self.places) + len(self.bookmarks)
+
+    def take(self, complete: bool = True) -> tuple[list[dict], list[dict], list[dict]]:
+        """Return (and forget) the rows of moz_origins, moz_places and moz_bookmarks added since
+        the last call. Once the tree is complete, the rows of the places folders are added."""
+        rows = self.origins, self.places, self.bookmarks
+        if complete:
+            rows[2].extend(self._roots.values())
+        self.origins, self.places, self.bookmarks = [], [], []
+        return rows
+
+
+def create_places_tables(connection: Connection):
+    """Create the tables and indexes of places.sqlite, and set the version of its schema."""
+    places_metadata.create_all(connection)
+    connection.exec_driver_sql(f"PRAGMA user_version = {PLACES_SCHEMA_VERSION}")
+
+
+def write_places(connection: Connection, rows: PlacesRows, complete: bool = True):
+    """Insert the rows taken from `rows` with batched statements. Once the tree is complete,
+    the number of bookmarks referencing each place is updated, firefox removes the places
+    without bookmarks or visits."""
+    for table, table_rows in zip((moz_origins, moz_places, moz_bookmarks), rows.take(complete)):
+        for start in range(0, len(table_rows), PLACES_BATCH_SIZE):
+            connection.execute(table.insert(), table_rows[start : start + PLACES_BATCH_SIZE])
+    if complete:
+        bookmarks = (
+            select(func.count()).where(moz_bookmarks.c.fk == moz_places.c.id).scalar_subquery()
+        )
+        connection.execute(moz_places.update().values(foreign_count=bookmarks))
@@ -0,0 +1,164 @@
+"""Profiling of the conversion stages with cProfile.
+
+The profiles are written as a `.pstats` file (for `pstats`, snakeviz, ...) and as a collapsed
+stack file (one "caller;callee;... microseconds" line per stack), which is the input format of
+flamegraph tools like flamegraph.pl, speedscope or inferno.
+"""
+
+import cProfile
+import pstats
+import sys
+import threading
+from pathlib import Path
+from typing import Iterable
+
+from bookmarks_converter.instrumentation import StageObserver, observe
+
+COLLAPSED_SUFFIX = ".collapsed"
+# stacks taking less time than this (in seconds), or than this fraction of the total time, are
+# left out of the collapsed stacks, which bounds their number on large profiles.
+COLLAPSED_MIN_TIME = 1e-6
+COLLAPSED_MIN_FRACTION = 1e-5
+# before python 3.12, cProfile only profiles the thread it is enabled on. Since 3.12, a profiler
+# profiles all the threads, and enabling a second one while it runs raises a ValueError.
+PROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class StageProfiler(StageObserver):
+    """Profile the conversion stages, or only the given stages:
+
+        with StageProfiler(stages=[STAGE_PARSE]) as profiler:
+            tree = converter.from_html(path)
+        profiler.dump(Path("parse.pstats"))
+
+    Before python 3.12, cProfile only profiles the thread it is enabled on, so each thread
+    running a stage (see formats.save_many) gets its own profile, and the profiles are merged
+    when the stats are written. Since 3.12, a single profile covers all the threads, it is
+    enabled while any thread runs a profiled stage.
+
+    stages: Iterable[str] | None
+        names of the profiled stages, all the stages are profiled if None.
+    """
+
+    def __init__(self, stages: Iterable[str] | None = None):
+        self.stages = set(stages) if stages is not None else None
+        # the profiles by thread id, or a single profile with the id 0 (see _profile_key).
+        self._profiles: dict[int, cProfile.Profile] = {}
+        # number of profiled stages running on each profile, the stages can be nested.
+        self._depths: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._observing = None
+
+    def __enter__(self):
+        self._observing = observe(self)
+        self._observing.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observing.__exit__(*exc_info)
+
+    def stage_started(self, name: str):
+        if self.stages is not None and name not in self.stages:
+            return
+        key = _profile_key()
+        with self._lock:
+            depth = self._depths.get(key, 0)
+            self._depths[key] = depth + 1
+            if depth == 0:
+                self._profiles.setdefault(key, cProfile.Profile()).enable()
+
+    def stage_finished(self, name: str):
+        if self.stages is not None and name not in self.stages:
+            return
+        key = _profile_key()
+        with self._lock:
+            self._depths[key] -= 1
+            if self._depths[key] == 0:
+                self._profiles[key].disable()
+
+    def stats(self) -> pstats.Stats | None:
+        """Return the merged stats of all the threads, None if no stage was profiled."""
+        profiles = list(self._profiles.values())
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def dump(self, path: Path) -> tuple[Path, Path]:
+        """Write the stats to path, and the collapsed stacks next to it (with the '.collapsed'
+        suffix, added to the name of path if it already has it). Returns the paths of both
+        files."""
+        stats = self.stats()
+        if stats is None:
+            # write an (almost) empty profile, so the files always exist after a profiled
+            # conversion. pstats can't read back a profile without any function.
+            profile = cProfile.Profile()
+            profile.enable()
+            profile.disable()
+            stats = pstats.Stats(profile)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(path)
+
+        collapsed_path = path.with_suffix(COLLAPSED_SUFFIX)
+        if collapsed_path == path:
+            collapsed_path = path.with_name(f"{path.name}{COLLAPSED_SUFFIX}")
+        with collapsed_path.open("w", encoding="utf-8") as file:
+            for stack, seconds in collapsed_stacks(stats):
+                file.write(f"{';'.join(stack)} {round(seconds * 1000_000)}\n")
+        return path, collapsed_path
+
+
+def _profile_key() -> int:
+    """The key of the profile of the running thread."""
+    return 0 if PROFILE_ALL_THREADS else threading.get_ident()
+
+
+def _label(function: tuple[str, int, str]) -> str:
+    filename, line, name = function
+    if filename == "~":
+        # built-in functions have no file.
+        label = name
+    else:
+        label = f"{Path(filename).stem}:{name}:{line}"
+    # the semicolons separate the frames of the collapsed stacks.
+    return label.replace(";", ":")
+
+
+def collapsed_stacks(stats: pstats.Stats) -> list[tuple[tuple[str, ...], float]]:
+    """Rebuild the call stacks from the caller/callee pairs of the stats.
+
+    cProfile doesn't record full stacks, so the time of a function is split amongst its
+    callers in proportion of the time spent in each call site. Returns (stack, self time in
+    seconds) pairs, recursive calls are folded into the first call of the function.
+    """
+    callees = {}
+    roots = []
+    for function, (_, _, _, cumulative, callers) in stats.stats.items():
+        known_callers = [caller for caller in callers if caller in stats.stats]
+        if not known_callers:
+            roots.append((function, cumulative))
+        for caller in known_callers:
+            # the cumulative time of the function when called from this caller.
+            callees.setdefault(caller, []).append((function, callers[caller][3]))
+
+    total = sum(cumulative for _, cumulative in roots)
+    min_time = max(COLLAPSED_MIN_TIME, total * COLLAPSED_MIN_FRACTION)
+    stacks = []
+    # stack of (function, time spent in the function on this path, path to the function)
+    stack = [(function, cumulative, ()) for function, cumulative in reversed(roots)]
+    while stack:
+        function, seconds, path = stack.pop()
+        if seconds < min_time:
+            continue
+        _, _, own_time, cumulative, _ = stats.stats[function]
+        path = (*path, _label(function))
+        ratio = seconds / cumulative if cumulative else 0
+        if own_time * ratio >= min_time:
+            stacks.append((path, own_time * ratio))
+
+        for callee, callee_time in reversed(callees.get(function, [])):
+            if _label(callee) not in path:
+                stack.append((callee, callee_time * ratio, path))
+    return stacks
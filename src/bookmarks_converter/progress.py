@@ -0,0 +1,177 @@
+"""Progress reporting and cancellation of the conversions.
+
+The stages count the nodes they process (see `instrumentation.current_progress`), the
+observers of this module turn those counts into progress callbacks at a bounded rate, and
+cancel the conversions running past a deadline. Like all the observers, they only observe the
+conversions of the context they are entered in: the current thread, and the writer threads of
+`formats.save_many`. The conversions running concurrently on other threads are unaffected.
+"""
+
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, TextIO
+
+from bookmarks_converter.instrumentation import (
+    COUNTER_BYTES_IN,
+    COUNTER_NODES,
+    STAGE_SERIALIZE,
+    StageObserver,
+    observe,
+)
+
+# minimum time between two progress callbacks, in seconds.
+PROGRESS_INTERVAL = 0.1
+PROGRESS_BAR_WIDTH = 30
+
+
+class ConversionCancelled(Exception):
+    """Raised inside the conversion when it is cancelled."""
+
+
+@dataclass
+class ProgressEvent:
+    """Progress of the conversion when the callback is called.
+
+    stage: str
+        name of the running stage.
+    nodes: int
+        number of nodes processed by the running stage.
+    bytes_read: int
+        number of bytes of bookmarks files read so far.
+    elapsed: float
+        seconds since the reporter started.
+    total_nodes: int | None
+        number of nodes of the loaded bookmarks, once they are loaded.
+    """
+
+    stage: str
+    nodes: int
+    bytes_read: int
+    elapsed: float
+    total_nodes: int | None = None
+
+
+class ProgressReporter(StageObserver):
+    """Call `callback` with a ProgressEvent when a stage starts, and while it runs:
+
+        with ProgressReporter(lambda event: print(event.stage, event.nodes)):
+            tree = converter.from_html(path)
+
+    The callback is called at most once every `interval` seconds while a stage runs, it can
+    raise ConversionCancelled to stop the conversion.
+    """
+
+    def __init__(self, callback: Callable[[ProgressEvent], None], interval=PROGRESS_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.bytes_read = 0
+        self.total_nodes = None
+        self._started = time.perf_counter()
+        self._last_call = None
+        self._lock = threading.Lock()
+        self._observing = None
+
+    def __enter__(self):
+        self._observing = observe(self)
+        self._observing.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observing.__exit__(*exc_info)
+
+    def _notify(self, name: str, nodes: int, force: bool = False):
+        now = time.perf_counter()
+        with self._lock:
+            if not force and self._last_call is not None and now - self._last_call < self.interval:
+                return
+            self._last_call = now
+            event = ProgressEvent(
+                name, nodes, self.bytes_read, now - self._started, self.total_nodes
+            )
+        self.callback(event)
+
+    def stage_started(self, name: str):
+        self._notify(name, 0, force=True)
+
+    def progress(self, name: str, nodes: int):
+        self._notify(name, nodes)
+
+    def counter_recorded(self, name: str, value: int):
+        with self._lock:
+            if name == COUNTER_BYTES_IN:
+                self.bytes_read += value
+            elif name == COUNTER_NODES:
+                self.total_nodes = value
+
+
+class Deadline(StageObserver):
+    """Cancel the conversions still running `seconds` after the deadline is created:
+
+        with Deadline(30):
+            tree = converter.from_html(path)
+
+    The deadline is checked when a stage starts and whenever a stage reports its progress, so
+    a conversion is cancelled within PROGRESS_REPORT_NODES nodes of its deadline: lines of the
+    file while an HTML file is formatted, bookmarks while it is parsed by BeautifulSoup, and
+    bookmarks in the other stages. The stages which don't count anything (ex. reading the file,
+    or loading a JSON file with the json module) can't be interrupted, the deadline is only
+    checked when the next stage starts.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.perf_counter() + seconds
+        self._observing = None
+
+    def __enter__(self):
+        self._observing = observe(self)
+        self._observing.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observing.__exit__(*exc_info)
+
+    def check(self):
+        """Raise ConversionCancelled if the deadline has passed."""
+        if time.perf_counter() > self.expires:
+            raise ConversionCancelled(f"The conversion exceeded its {self.seconds}s deadline.")
+
+    def stage_started(self, name: str):
+        self.check()
+
+    def progress(self, name: str, nodes: int):
+        self.check()
+
+
+class ProgressBar:
+    """Progress callback drawing a progress bar on a terminal. The bar is filled while the
+    bookmarks are serialized, the number of nodes is only known once they are loaded."""
+
+    def __init__(self, stream: TextIO | None = None, width: int = PROGRESS_BAR_WIDTH):
+        self.stream = stream if stream is not None else sys.stderr
+        self.width = width
+        self._line_length = 0
+
+    def __call__(self, event: ProgressEvent):
+        if event.total_nodes and event.stage == STAGE_SERIALIZE:
+            ratio = min(event.nodes / event.total_nodes, 1)
+            filled = round(ratio * self.width)
+            bar = f"[{'#' * filled}{'.' * (self.width - filled)}] {ratio:>4.0%}"
+        else:
+            bar = f"[{' ' * self.width}]"
+        line = (
+            f"{event.stage:<10}{bar} {event.nodes} nodes, "
+            f"{event.bytes_read / 1024:.0f} KiB read, {event.elapsed:.1f}s"
+        )
+        # pad the line to overwrite the end of a longer previous line.
+        self.stream.write(f"\r{line:<{self._line_length}}")
+        self.stream.flush()
+        self._line_length = len(line)
+
+    def finish(self):
+        """End the line of the progress bar."""
+        if self._line_length:
+            self.stream.write("\n")
+            self.stream.flush()
@@ -0,0 +1,107 @@
+"""Full-text search of the urls of Bookmarkie DBs.
+
+`save_db(..., search_index=True)` adds an SQLite FTS5 index over the title, url and tags of the
+bookmarks to the DB. The index is an external content table of the `bookmark` table, so the text
+isn't stored twice, and triggers keep it in sync with the changes made to the `bookmark` table.
+The searches then run in the DB file, without loading the bookmarks in Python.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import OperationalError
+
+from bookmarks_converter.engines import MODE_READ_ONLY, open_engine
+from bookmarks_converter.models import TYPE_URL
+
+SEARCH_TABLE = "bookmark_search"
+SEARCH_DEFAULT_LIMIT = 20
+# bm25 weights of the title, url and tags columns, a match in the title ranks the highest.
+SEARCH_COLUMN_WEIGHTS = (10.0, 1.0, 5.0)
+
+_SEARCH_INDEX_DDL = (
+    f"""CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+        title, url, tags, content='bookmark', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON bookmark BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, title, url, tags)
+        VALUES (new.id, new.title, new.url, new.tags);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON bookmark BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, url, tags)
+        VALUES ('delete', old.id, old.title, old.url, old.tags);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE ON bookmark BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, url, tags)
+        VALUES ('delete', old.id, old.title, old.url, old.tags);
+        INSERT INTO {SEARCH_TABLE}(rowid, title, url, tags)
+        VALUES (new.id, new.title, new.url, new.tags);
+    END""",
+    # index the rows already in the bookmark table, in a single pass.
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+
+_SEARCH_QUERY = f"""
+    SELECT bookmark.id, bookmark.guid, bookmark.title, bookmark.url, bookmark.tags,
+        bm25({SEARCH_TABLE}, {", ".join(map(str, SEARCH_COLUMN_WEIGHTS))}) AS rank
+    FROM {SEARCH_TABLE} JOIN bookmark ON bookmark.id = {SEARCH_TABLE}.rowid
+    WHERE {SEARCH_TABLE} MATCH :query AND bookmark.type = :type
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+
+@dataclass
+class SearchResult:
+    """A url matching a search, the lower the rank the better the match."""
+
+    id: int
+    guid: str
+    title: str
+    url: str
+    rank: float
+    tags: list[str] = field(default_factory=list)
+
+
+def create_search_index(connection: Connection):
+    """Create the full-text search index of the bookmarks of the DB, and its triggers."""
+    for statement in _SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+
+
+def has_search_index(connection: Connection) -> bool:
+    return (
+        connection.scalar(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": SEARCH_TABLE},
+        )
+        is not None
+    )
+
+
+def search(filepath: Path, query: str, limit: int = SEARCH_DEFAULT_LIMIT) -> list[SearchResult]:
+    """Search the urls of the DB bookmarks file, best matches first.
+    The query uses the FTS5 query syntax, ex. `python`, `"release notes"`, `py*`, `title:python`
+    or `python NOT snake`. The DB must have been saved with a search index."""
+    with open_engine(filepath, MODE_READ_ONLY) as engine, engine.connect() as connection:
+        if not has_search_index(connection):
+            raise ValueError(f"The DB '{filepath}' has no search index.")
+        try:
+            rows = connection.execute(
+                text(_SEARCH_QUERY), {"query": query, "type": TYPE_URL, "limit": limit}
+            )
+        except OperationalError as e:
+            # the syntax errors of the query are only detected when it runs.
+            raise ValueError(f"Invalid search query: {query!r}") from e
+        return [
+            SearchResult(
+                id=row.id,
+                guid=row.guid,
+                title=row.title,
+                url=row.url,
+                rank=row.rank,
+                tags=row.tags.split(",") if row.tags else [],
+            )
+            for row in rows
+        ]
@@ -0,0 +1,140 @@
+"""Normalized storage of the url tags in Bookmarkie DBs.
+
+Each tag name is stored once in the `tag` table, and the `bookmark_tag` table links the urls to
+their tags, in order. Unlike the comma-joined tags column of the `bookmark` table, the tags can
+contain commas, and the urls with a tag are found with the indexes of the two tables instead of
+a scan of all the urls. DBs saved by earlier versions, without the tag tables, are read from
+the tags column.
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+from sqlalchemy import Connection, func, inspect, select
+
+from bookmarks_converter.engines import MODE_READ_ONLY, open_engine
+from bookmarks_converter.icons import resolve_icons
+from bookmarks_converter.models import (
+    TYPE_URL,
+    DBBookmark,
+    DBBookmarkTag,
+    DBFolder,
+    DBTag,
+    DBUrl,
+    Url,
+)
+
+# maximum number of urls per query when the tags of the urls are looked up, below the maximum
+# number of variables of a SQLite statement.
+TAG_QUERY_BATCH_SIZE = 500
+
+
+def extract_tags(bookmarks: DBBookmark) -> tuple[list[dict], list[dict]]:
+    """Return the rows of the tag and bookmark_tag tables of the urls of the DBBookmark tree.
+    The ids of the urls must be set (the tree must have been flushed to the DB)."""
+    tags = {}
+    links = []
+    stack = [bookmarks]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, DBFolder):
+            stack.extend(node.children)
+        elif isinstance(node, DBUrl):
+            names = node.tag_names
+            if names is None:
+                names = node.tags.split(",") if node.tags else []
+            for position, name in enumerate(names):
+                tag_id = tags.setdefault(name, len(tags) + 1)
+                links.append({"bookmark_id": node.id, "position": position, "tag_id": tag_id})
+    return [{"id": tag_id, "name": name} for name, tag_id in tags.items()], links
+
+
+def has_tag_tables(connection: Connection) -> bool:
+    return inspect(connection).has_table(DBBookmarkTag.__tablename__)
+
+
+def load_tags(connection: Connection, bookmark_ids: list[int] | None = None) -> dict | None:
+    """Load the tags of the urls of the DB, as lists of tag names by url id. If bookmark_ids
+    are given, only the tags of those urls are loaded.
+    Returns None for the DBs saved without the tag tables."""
+    if not has_tag_tables(connection):
+        return None
+    query = (
+        select(DBBookmarkTag.bookmark_id, DBTag.name)
+        .join(DBTag, DBTag.id == DBBookmarkTag.tag_id)
+        .order_by(DBBookmarkTag.bookmark_id, DBBookmarkTag.position)
+    )
+    if bookmark_ids is None:
+        batches = [query]
+    else:
+        batches = [
+            query.where(DBBookmarkTag.bookmark_id.in_(bookmark_ids[i : i + TAG_QUERY_BATCH_SIZE]))
+            for i in range(0, len(bookmark_ids), TAG_QUERY_BATCH_SIZE)
+        ]
+    tags = {}
+    for batch in batches:
+        for bookmark_id, name in connection.execute(batch):
+            tags.setdefault(bookmark_id, []).append(name)
+    return tags
+
+
+def resolve_tags(connection: Connection, rows: list):
+    """Replace the comma-joined tags of the url rows of the bookmark table by the lists of
+    their tags."""
+    tags = load_tags(connection, [row.id for row in rows if row.type == TYPE_URL])
+    for row in rows:
+        if tags is not None:
+            row.tags = tags.get(row.id, [])
+        else:
+            row.tags = row.tags.split(",") if row.tags else []
+
+
+def find_by_tag(filepath: Path, tag: str) -> list[Url]:
+    """The urls of the DB bookmarks file with the tag, sorted by id.
+    The DB must have been saved with the tag tables."""
+    with open_engine(filepath, MODE_READ_ONLY) as engine, engine.connect() as connection:
+        if not has_tag_tables(connection):
+            raise ValueError(f"The DB '{filepath}' has no tag tables.")
+        table = DBBookmark.__table__
+        rows = connection.execute(
+            select(table)
+            .join(DBBookmarkTag, DBBookmarkTag.bookmark_id == table.c.id)
+            .join(DBTag, DBTag.id == DBBookmarkTag.tag_id)
+            .where(DBTag.name == tag)
+            .distinct()
+            .order_by(table.c.id)
+        )
+        rows = [SimpleNamespace(**row) for row in rows.mappings()]
+        resolve_icons(connection, rows)
+        resolve_tags(connection, rows)
+    return [
+        Url(
+            id=row.id,
+            guid=row.guid,
+            index=row.index,
+            title=row.title,
+            date_added=row.date_added,
+            date_modified=row.date_modified,
+            url=row.url,
+            icon=row.icon,
+            icon_uri=row.icon_uri,
+            tags=row.tags,
+        )
+        for row in rows
+    ]
+
+
+def count_tags(filepath: Path) -> dict[str, int]:
+    """The number of urls of the DB bookmarks file with each tag, most used tags first.
+    The DB must have been saved with the tag tables."""
+    with open_engine(filepath, MODE_READ_ONLY) as engine, engine.connect() as connection:
+        if not has_tag_tables(connection):
+            raise ValueError(f"The DB '{filepath}' has no tag tables.")
+        urls = func.count(DBBookmarkTag.bookmark_id.distinct())
+        rows = connection.execute(
+            select(DBTag.name, urls)
+            .join(DBBookmarkTag, DBBookmarkTag.tag_id == DBTag.id)
+            .group_by(DBTag.id)
+            .order_by(urls.desc(), DBTag.name)
+        )
+        return dict(rows.all())
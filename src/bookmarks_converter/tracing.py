@@ -0,0 +1,127 @@
+"""Export of the conversion spans and stages in the Chrome trace event format.
+
+The trace files open in Perfetto (https://ui.perfetto.dev) and chrome://tracing, which show
+how the stages of concurrent conversions overlap on the threads of the process.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from bookmarks_converter.instrumentation import StageObserver, observe
+
+CATEGORY_SPAN = "converter"
+CATEGORY_STAGE = "stage"
+
+
+class TraceRecorder(StageObserver):
+    """Record the spans and stages of the conversions as trace events:
+
+        with TraceRecorder() as trace:
+            tree = converter.from_html(path)
+        trace.dump(Path("conversion.trace.json"))
+
+    Each span or stage is a complete ("X") event on the thread it ran on, with the metadata of
+    the span (the bookmarks file and its size) as arguments. The counters (number of nodes,
+    bytes read and written) are counter ("C") events.
+    """
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+        # start timestamps of the running spans and stages, for each thread.
+        self._started: dict[int, list[float]] = {}
+        self._threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._observing = None
+
+    def __enter__(self):
+        self._observing = observe(self)
+        self._observing.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observing.__exit__(*exc_info)
+
+    def _timestamp(self) -> float:
+        """Microseconds since the recorder was created."""
+        return (time.perf_counter() - self._origin) * 1000_000
+
+    def _begin(self):
+        thread = threading.get_native_id()
+        with self._lock:
+            self._threads.setdefault(thread, threading.current_thread().name)
+            self._started.setdefault(thread, []).append(self._timestamp())
+
+    def _end(self, name: str, category: str, args: dict):
+        end = self._timestamp()
+        thread = threading.get_native_id()
+        with self._lock:
+            start = self._started[thread].pop()
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": start,
+                    "dur": end - start,
+                    "pid": self._pid,
+                    "tid": thread,
+                    "args": args,
+                }
+            )
+
+    def stage_started(self, name: str):
+        self._begin()
+
+    def stage_finished(self, name: str):
+        self._end(name, CATEGORY_STAGE, {})
+
+    def span_started(self, name: str):
+        self._begin()
+
+    def span_finished(self, name: str, metadata: dict):
+        self._end(name, CATEGORY_SPAN, dict(metadata))
+
+    def counter_recorded(self, name: str, value: int):
+        event = {
+            "name": name,
+            "ph": "C",
+            "ts": self._timestamp(),
+            "pid": self._pid,
+            "tid": threading.get_native_id(),
+            "args": {name: value},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def as_dict(self) -> dict:
+        # metadata events naming the process and the threads in the trace viewers.
+        names = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": self._pid,
+                "args": {"name": "bookmarks-converter"},
+            }
+        ]
+        for thread, thread_name in self._threads.items():
+            names.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self._pid,
+                    "tid": thread,
+                    "args": {"name": thread_name},
+                }
+            )
+        return {"traceEvents": names + self.events, "displayTimeUnit": "ms"}
+
+    def dump(self, path: Path):
+        """Write the trace events to path, as JSON."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as file:
+            json.dump(self.as_dict(), file)
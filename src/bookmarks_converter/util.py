@@ -1,9 +1,40 @@
 import re
 from pathlib import Path
+from typing import TextIO
+
+from bookmarks_converter.instrumentation import (
+    COUNTER_BYTES_IN,
+    PROGRESS_REPORT_NODES,
+    STAGE_FORMAT,
+    STAGE_READ,
+    count,
+    current_progress,
+    observing,
+    stage,
+)
 
 HTML_INDENT = "    "
 
 
+def read_file(filepath: Path) -> str:
+    """Read the content of a bookmarks file, as the read stage of its conversion."""
+    with stage(STAGE_READ):
+        with filepath.open("r", encoding="utf-8") as file:
+            content = file.read()
+        if observing():
+            count(COUNTER_BYTES_IN, filepath.stat().st_size)
+    return content
+
+
+def _count_bytes_read(file: TextIO, counted: int) -> int:
+    """Count the bytes read from the file since `counted` bytes were, and return the total.
+    The bytes are read in chunks, the count is ahead of the lines returned by at most a chunk."""
+    position = file.buffer.tell()
+    if position > counted:
+        count(COUNTER_BYTES_IN, position - counted)
+    return position
+
+
 def format_html(filepath: Path) -> str:
     """Reads the content of an HTML Bookmarks file and reformats it to simplify tree traversal
     after the contents are parsed by BeautifulSoup.
@@ -14,10 +45,16 @@ def format_html(filepath: Path) -> str:
     - All "<H3>" and "<A>" tag's inner text are added as a "title"
     attribute within the html element.
 
+    The file is streamed one line at a time, so only the formatted lines are held in memory:
+    the read stage opens the file, and its lines are read while they are formatted.
+
     filepath: str
         absolute path to bookmarks html file.
     """
-    with filepath.open("r", encoding="utf-8") as input_file:
+    with stage(STAGE_READ):
+        input_file = filepath.open("r", encoding="utf-8")
+
+    with input_file, stage(STAGE_FORMAT):
         # regex to select an entire H1/H3/A HTML element
         element = re.compile(r"(<(H1|H3|A))(.*?(?=>))>(.*)(<\/\2>)\n")
 
@@ -35,21 +72,33 @@ def format_html(filepath: Path) -> str:
                 .strip()
             )
 
-        lines = [_format(line) for line in input_file]
+        progress = current_progress()
+        counting = observing()
+        bytes_read = 0
+        lines = []
+        for number, line in enumerate(input_file, 1):
+            lines.append(_format(line))
+            # the bytes read are counted before the lines are reported, every report has both.
+            if counting and number % PROGRESS_REPORT_NODES == 0:
+                bytes_read = _count_bytes_read(input_file, bytes_read)
+            progress.advance()
+        if counting:
+            _count_bytes_read(input_file, bytes_read)
         return "".join(lines)
 
 
 def indent_html(html: str) -> str:
     """Adds indentation to HTML Bookmarks file."""
-    output = ""
+    # the lines are joined once at the end, appending to a string is quadratic in the worst case.
+    output = []
     depth = 0
     for line in html.splitlines():
         if line.startswith("</DL>"):
             depth -= 1
 
-        output += f"{depth*HTML_INDENT}{line}\n"
+        output.append(f"{depth*HTML_INDENT}{line}\n")
 
         if line.startswith("<DL><p>"):
             depth += 1
 
-    return output
+    return "".join(output)
@@ -1,4 +1,9 @@
+import gc
+import itertools
 import json
+import math
+import sqlite3
+import time
 from pathlib import Path
 
 import pytest
@@ -23,6 +28,28 @@ TEST_FILE_BOOKMARKIE_HTML_FORMATTED = DATA_DIR.joinpath("bookmarks_bookmarkie_fo
 TEST_INPUT_FILE = DATA_DIR.joinpath("INPUT_TEST_FILE")
 TEST_OUTPUT_FILE = DATA_DIR.joinpath("OUTPUT_TEST_FILE")
 
+# highest exponent of the runtime of an operation over its input size (see `scaling_exponent`):
+# n log n has an exponent of about 1.1 over the sizes of the tests and a quadratic path about 2,
+# the generous margin in between absorbs the timing noise.
+MAX_SCALING_EXPONENT = 1.6
+
+
+def tree_nodes(tree: Folder) -> list:
+    """The bookmarks (folders and urls) of the tree in pre-order, starting with its root."""
+    nodes = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        if isinstance(node, Folder):
+            stack.extend(reversed(node.children))
+    return nodes
+
+
+def tree_urls(tree: Folder) -> list[Url]:
+    """The urls of the tree in pre-order."""
+    return [node for node in tree_nodes(tree) if isinstance(node, Url)]
+
 
 @pytest.fixture
 def get_data_from_db():
@@ -44,6 +71,116 @@ def get_data_from_db():
     return _function
 
 
+# the tables of a Firefox places.sqlite read by the converters (the unused columns are omitted).
+PLACES_SCHEMA = """
+CREATE TABLE moz_places (
+    id INTEGER PRIMARY KEY, url LONGVARCHAR, title LONGVARCHAR, guid TEXT UNIQUE,
+    foreign_count INTEGER DEFAULT 0 NOT NULL
+);
+CREATE TABLE moz_bookmarks (
+    id INTEGER PRIMARY KEY, type INTEGER, fk INTEGER DEFAULT NULL, parent INTEGER,
+    position INTEGER, title LONGVARCHAR, keyword_id INTEGER, folder_type TEXT, dateAdded INTEGER,
+    lastModified INTEGER, guid TEXT UNIQUE, syncStatus INTEGER NOT NULL DEFAULT 0,
+    syncChangeCounter INTEGER NOT NULL DEFAULT 1
+);
+"""
+
+
+@pytest.fixture
+def write_places():
+    """
+    Write a Firefox JSON bookmarks backup as a places.sqlite database. The tags folder is added
+    at the index skipped by the children of the root, with a folder for each of the `tags`, and a
+    separator is added at the end of the menu.
+    """
+
+    def _function(jsondata: dict, db_path: Path, tags: dict[str, list[str]]):
+        places = {}
+        bookmarks = []
+        stack = [(jsondata, 0)]
+        while stack:
+            node, parent = stack.pop()
+            row = [node["id"], 2, None, parent, node["index"], node.get("title")]
+            if "uri" in node:
+                place_id = places.setdefault(node["uri"], len(places) + 1)
+                row[1:3] = [1, place_id]
+            row += [node["dateAdded"], node["lastModified"], node["guid"]]
+            bookmarks.append(row)
+            stack.extend((child, node["id"]) for child in node.get("children", []))
+
+        ids = itertools.count(max(row[0] for row in bookmarks) + 1)
+        root_indexes = {child["index"] for child in jsondata["children"]}
+        tags_index = min(set(range(len(root_indexes) + 1)) - root_indexes)
+        tags_folder_id = next(ids)
+        bookmarks.append([tags_folder_id, 2, None, 1, tags_index, "tags", 0, 0, "tags________"])
+        for position, (tag, urls) in enumerate(tags.items()):
+            tag_id = next(ids)
+            bookmarks.append([tag_id, 2, None, tags_folder_id, position, tag, 0, 0, f"tag{tag_id}"])
+            for url_position, url in enumerate(urls):
+                url_id = next(ids)
+                bookmarks.append(
+                    [url_id, 1, places[url], tag_id, url_position, None, 0, 0, f"tag{url_id}"]
+                )
+        menu_id = next(row[0] for row in bookmarks if row[-1] == "menu________")
+        menu_size = sum(1 for row in bookmarks if row[3] == menu_id)
+        bookmarks.append([next(ids), 3, None, menu_id, menu_size, None, 0, 0, "separator___"])
+
+        with sqlite3.connect(db_path) as connection:
+            connection.executescript(PLACES_SCHEMA)
+            connection.executemany(
+                "INSERT INTO moz_places (id, url, guid) VALUES (?, ?, ?)",
+                [(place_id, url, f"place{place_id:07}") for url, place_id in places.items()],
+            )
+            connection.executemany(
+                "INSERT INTO moz_bookmarks (id, type, fk, parent, position, title, dateAdded,"
+                " lastModified, guid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                bookmarks,
+            )
+        connection.close()
+
+    return _function
+
+
+FAVICONS_SCHEMA = """
+CREATE TABLE icon_mapping (id INTEGER PRIMARY KEY, page_url LONGVARCHAR NOT NULL, icon_id INTEGER);
+CREATE INDEX icon_mapping_page_url_idx ON icon_mapping(page_url);
+CREATE TABLE favicons (id INTEGER PRIMARY KEY, url LONGVARCHAR NOT NULL, icon_type INTEGER);
+CREATE TABLE favicon_bitmaps (
+    id INTEGER PRIMARY KEY, icon_id INTEGER NOT NULL, last_updated INTEGER DEFAULT 0,
+    image_data BLOB, width INTEGER DEFAULT 0, height INTEGER DEFAULT 0
+);
+"""
+
+
+@pytest.fixture
+def write_favicons():
+    """
+    Write a Chrome Favicons database. Each favicon is a tuple of its url, its icon_type, the
+    page urls it is the icon of, and its bitmaps as (width, image_data, last_updated) tuples.
+    """
+
+    def _function(db_path: Path, favicons: list[tuple[str, int, list[str], list[tuple]]]):
+        with sqlite3.connect(db_path) as connection:
+            connection.executescript(FAVICONS_SCHEMA)
+            for icon_id, (icon_url, icon_type, page_urls, bitmaps) in enumerate(favicons, 1):
+                connection.execute(
+                    "INSERT INTO favicons (id, url, icon_type) VALUES (?, ?, ?)",
+                    (icon_id, icon_url, icon_type),
+                )
+                connection.executemany(
+                    "INSERT INTO icon_mapping (page_url, icon_id) VALUES (?, ?)",
+                    [(page_url, icon_id) for page_url in page_urls],
+                )
+                connection.executemany(
+                    "INSERT INTO favicon_bitmaps (icon_id, width, height, image_data, last_updated)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [(icon_id, width, width, data, updated) for width, data, updated in bitmaps],
+                )
+        connection.close()
+
+    return _function
+
+
 @pytest.fixture
 def read_json():
     def _function(filepath: Path) -> dict:
@@ -72,3 +209,54 @@ def modify_folder_and_url_methods():
 
     Folder.__eq__ = equality_ignore_guid
     Url.__eq__ = equality_ignore_guid
+
+
+@pytest.fixture
+def scaling_exponent():
+    """
+    Fit the exponent `k` of `runtime ~ size**k` of `function`, over geometrically growing sizes.
+    `setup(size)` builds a fresh input outside of the timed section, and the best of `repeat` runs
+    is kept for each size to reduce the noise. The exponent is the slope of the least squares
+    line through the (log size, log runtime) points: a linear implementation has an exponent
+    close to 1 (n log n slightly above it), while a quadratic implementation is close to 2.
+
+    The timings of shared CI runners are noisy, a slow run only inflates the exponent of one fit
+    while a quadratic implementation is slow in all of them: the sizes are timed again up to
+    `attempts` times while the exponent is above MAX_SCALING_EXPONENT, and the lowest exponent
+    is returned.
+    """
+
+    def _fit(setup, function, sizes: tuple[int, ...], repeat: int) -> float:
+        points = []
+        for size in sizes:
+            runtimes = []
+            for _ in range(repeat):
+                input_ = setup(size)
+                # the collections of the garbage collector depend on everything allocated
+                # before, they are kept out of the timings to reduce the noise.
+                gc.disable()
+                try:
+                    start = time.perf_counter()
+                    function(input_)
+                    runtimes.append(time.perf_counter() - start)
+                finally:
+                    gc.enable()
+            points.append((math.log(size), math.log(min(runtimes))))
+
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        covariance = sum((x - mean_x) * (y - mean_y) for x, y in points)
+        variance = sum((x - mean_x) ** 2 for x, _ in points)
+        return covariance / variance
+
+    def _function(
+        setup, function, sizes: tuple[int, ...], repeat: int = 3, attempts: int = 3
+    ) -> float:
+        exponent = _fit(setup, function, sizes, repeat)
+        for _ in range(attempts - 1):
+            if exponent < MAX_SCALING_EXPONENT:
+                break
+            exponent = min(exponent, _fit(setup, function, sizes, repeat))
+        return exponent
+
+    return _function
@@ -1,7 +1,12 @@
 from uuid import UUID, uuid4
 
 import pytest
-from conftest import TEST_FILE_BOOKMARKIE_DB, TEST_FILE_BOOKMARKIE_HTML, TEST_FILE_BOOKMARKIE_JSON
+from conftest import (
+    MAX_SCALING_EXPONENT,
+    TEST_FILE_BOOKMARKIE_DB,
+    TEST_FILE_BOOKMARKIE_HTML,
+    TEST_FILE_BOOKMARKIE_JSON,
+)
 from resources.bookmarks_bookmarkie import bookmarks_html, bookmarks_json
 
 from bookmarks_converter.converters.bookmarkie import (
@@ -101,6 +106,38 @@ class TestBookmarkie:
 
         assert result == expected
 
+    test_from_db_subtree_params = (
+        pytest.param({"special_folder": SpecialFolder.ROOT}, (), id="root"),
+        pytest.param({"special_folder": SpecialFolder.MENU}, (0,), id="special_folder"),
+        pytest.param({"special_folder": "toolbar"}, (1,), id="special_folder_value"),
+        pytest.param({"folder_id": 7}, (0, 0), id="folder_id"),
+        pytest.param({"guid": "e65b4d55-050c-420c-8a89-a4216025d14c"}, (0, 0), id="guid"),
+    )
+
+    @pytest.mark.parametrize("selector, path", test_from_db_subtree_params)
+    def test_from_db_subtree(self, selector, path):
+        result = self.bookmarkie.from_db_subtree(TEST_FILE_BOOKMARKIE_DB, **selector)
+
+        expected = bookmarks_json()
+        for index in path:
+            expected = expected.children[index]
+
+        assert result == expected
+
+    test_from_db_subtree_error_params = (
+        pytest.param({}, "Exactly one of", id="no_selector"),
+        pytest.param({"folder_id": 7, "guid": "guid"}, "Exactly one of", id="two_selectors"),
+        pytest.param({"folder_id": 1000}, "No folder with id=1000", id="missing_folder"),
+        pytest.param({"folder_id": 8}, "No folder with id=8", id="url_id"),
+    )
+
+    @pytest.mark.parametrize("selector, message", test_from_db_subtree_error_params)
+    def test_from_db_subtree_error(self, selector, message):
+        with pytest.raises(ValueError) as err_info:
+            self.bookmarkie.from_db_subtree(TEST_FILE_BOOKMARKIE_DB, **selector)
+
+        assert message in str(err_info.value)
+
     def test_as_html(self):
         result = self.bookmarkie.as_html(bookmarks_html())
 
@@ -263,6 +300,46 @@ class TestBookmarkie:
 
         assert result == expected
 
+    def test_restructure_root(self):
+        menu = HTMLBookmark(name="h3", attrs={"title": "menu"})
+        menu.children.extend(
+            [
+                HTMLBookmark(name="a", attrs={"href": "https://www.example.com/0"}),
+                HTMLBookmark(
+                    name="h3", attrs={"title": "special", "personal_toolbar_folder": "true"}
+                ),
+                HTMLBookmark(
+                    name="h3", attrs={"title": "special", "unfiled_bookmarks_folder": "true"}
+                ),
+                HTMLBookmark(
+                    name="h3", attrs={"title": "special", "mobile_bookmarks_folder": "true"}
+                ),
+                HTMLBookmark(name="a", attrs={"href": "https://www.example.com/1"}),
+            ]
+        )
+        special_folders = menu.children[1:-1]
+        urls = [menu.children[0], menu.children[-1]]
+
+        result = self.bookmarkie._restructure_root(menu)
+
+        assert result.children == [menu, *special_folders]
+        assert menu.children == urls
+        HTMLBookmark.reset_id_counter()
+
+    def test_restructure_root_scales_linearly(self, scaling_exponent):
+        urls = [HTMLBookmark(name="a", attrs={"href": "https://www.example.com/"})] * 64000
+
+        def setup(size: int) -> HTMLBookmark:
+            menu = HTMLBookmark(name="h3", attrs={"title": "menu"})
+            menu.children.extend(urls[:size])
+            return menu
+
+        exponent = scaling_exponent(
+            setup, self.bookmarkie._restructure_root, sizes=(4000, 16000, 64000)
+        )
+        HTMLBookmark.reset_id_counter()
+        assert exponent < MAX_SCALING_EXPONENT
+
     test_get_html_special_folder_params = (
         pytest.param("test-title", None, id="normal_folder"),
         pytest.param(BOOKMARKIE_BOOKMARKS_MENU_FOLDER_TITLE, SpecialFolder.MENU, id="menu_folder"),
@@ -0,0 +1,125 @@
+import shutil
+import zlib
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import TEST_FILE_BOOKMARKIE_HTML, TEST_FILE_CHROME_JSON
+from resources.bookmarks_bookmarkie import bookmarks_json
+from resources.bookmarks_chrome import bookmarks_html as chrome_bookmarks_html
+
+from bookmarks_converter import Bookmarkie, Chrome
+from bookmarks_converter.cache import ParseCache, decode_tree, encode_tree
+from bookmarks_converter.formats import Format, HTMLFormat, JSONFormat
+from bookmarks_converter.guid import deterministic_guids
+from bookmarks_converter.instrumentation import COUNTER_BYTES_IN, TimingRecorder
+
+
+@pytest.mark.parametrize("tree", (bookmarks_json(), chrome_bookmarks_html()))
+def test_encode_decode_tree(tree):
+    result = decode_tree(encode_tree(tree))
+    assert result == tree
+
+
+class TestParseCache:
+    def test_get_miss_then_hit(self):
+        tree = bookmarks_json()
+        with TemporaryDirectory() as tmpdir:
+            cache = ParseCache(Path(tmpdir))
+            assert cache.get("key") is None
+            cache.put("key", tree)
+            assert cache.get("key") == tree
+        assert cache.stats.misses == 1
+        assert cache.stats.hits == 1
+
+    def test_key(self):
+        with TemporaryDirectory() as tmpdir:
+            cache = ParseCache(Path(tmpdir))
+            filepath = Path(tmpdir).joinpath("bookmarks.html")
+            shutil.copy(TEST_FILE_BOOKMARKIE_HTML, filepath)
+            key = cache.key(Bookmarkie(), Format.HTML, filepath)
+
+            assert key == cache.key(Bookmarkie(), Format.HTML, filepath)
+            assert key != cache.key(Chrome(), Format.HTML, filepath)
+            assert key != cache.key(Bookmarkie(), Format.JSON, filepath)
+
+            with filepath.open("a", encoding="utf-8") as file:
+                file.write("\n")
+            assert key != cache.key(Bookmarkie(), Format.HTML, filepath)
+
+    def test_evict_least_recently_used(self):
+        tree = bookmarks_json()
+        with TemporaryDirectory() as tmpdir:
+            cache = ParseCache(Path(tmpdir))
+            cache.put("first", tree)
+            entry_size = cache._entry_path("first").stat().st_size
+            cache.max_size = entry_size * 2
+            cache.put("second", tree)
+            # make the first entry the most recently used one.
+            cache._entry_path("second").touch()
+            cache._entry_path("first").touch()
+            cache.put("third", tree)
+
+            assert cache.stats.evictions == 1
+            assert cache.get("second") is None
+            assert cache.get("first") == tree
+            assert cache.get("third") == tree
+
+    test_get_corrupted_params = (
+        pytest.param(lambda data: data[: len(data) // 2], id="truncated"),
+        pytest.param(lambda data: b"not a cache entry", id="garbage"),
+        pytest.param(lambda data: zlib.compress(b'{"roots": []}'), id="not_a_tree"),
+        pytest.param(lambda data: zlib.compress(b'[["f", 1]]'), id="short_record"),
+    )
+
+    @pytest.mark.parametrize("corrupt", test_get_corrupted_params)
+    def test_get_corrupted(self, corrupt):
+        tree = bookmarks_json()
+        with TemporaryDirectory() as tmpdir:
+            cache = ParseCache(Path(tmpdir))
+            cache.put("key", tree)
+            entry = cache._entry_path("key")
+            entry.write_bytes(corrupt(entry.read_bytes()))
+
+            assert cache.get("key") is None
+            assert not entry.exists()
+            assert (cache.stats.hits, cache.stats.misses, cache.stats.errors) == (0, 1, 1)
+            cache.put("key", tree)
+            assert cache.get("key") == tree
+
+
+test_load_with_cache_params = (
+    pytest.param(Bookmarkie(), HTMLFormat(Format.HTML), TEST_FILE_BOOKMARKIE_HTML, id="html"),
+    pytest.param(Chrome(), JSONFormat(Format.JSON), TEST_FILE_CHROME_JSON, id="json"),
+)
+
+
+@pytest.mark.parametrize("converter,format_,filepath", test_load_with_cache_params)
+def test_load_with_cache(converter, format_, filepath: Path):
+    with TemporaryDirectory() as tmpdir:
+        cache = ParseCache(Path(tmpdir))
+        expected = format_.load(converter, filepath, cache)
+        with TimingRecorder() as timings:
+            result = format_.load(converter, filepath, cache)
+
+    assert result == expected
+    assert result is not expected
+    assert cache.stats.misses == 1
+    assert cache.stats.hits == 1
+    # the input file is still read to compute the key of the cached tree.
+    assert timings.counters[COUNTER_BYTES_IN] == filepath.stat().st_size
+
+
+def test_load_with_corrupted_cache():
+    converter, format_ = Bookmarkie(), HTMLFormat(Format.HTML)
+    # the tree parsed again must have the guids of the cached one.
+    with TemporaryDirectory() as tmpdir, deterministic_guids():
+        cache = ParseCache(Path(tmpdir))
+        expected = format_.load(converter, TEST_FILE_BOOKMARKIE_HTML, cache)
+        (entry,) = Path(tmpdir).iterdir()
+        entry.write_bytes(entry.read_bytes()[:-10])
+
+        # the input file is parsed again, and the entry rewritten.
+        assert format_.load(converter, TEST_FILE_BOOKMARKIE_HTML, cache) == expected
+        assert format_.load(converter, TEST_FILE_BOOKMARKIE_HTML, cache) == expected
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.errors) == (1, 2, 1)
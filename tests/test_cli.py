@@ -1,19 +1,27 @@
 import filecmp
+import json
+import pstats
+import shutil
+import sqlite3
 from argparse import ArgumentTypeError
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
 import pytest
 from conftest import (
+    TEST_FILE_BOOKMARKIE_DB,
     TEST_FILE_BOOKMARKIE_HTML,
     TEST_FILE_BOOKMARKIE_JSON,
+    TEST_FILE_CHROME_JSON,
     TEST_FILE_FIREFOX_HTML,
+    TEST_FILE_FIREFOX_JSON,
     TEST_INPUT_FILE,
     TEST_OUTPUT_FILE,
 )
 
 from bookmarks_converter import Bookmarkie, Chrome, Firefox
 from bookmarks_converter.cli import (
+    _get_version,
     _input_file,
     _output_file,
     _parse_args,
@@ -21,7 +29,9 @@ from bookmarks_converter.cli import (
     main,
 )
 from bookmarks_converter.converters.converter import Converter
-from bookmarks_converter.formats import BaseFormat, DBFormat, HTMLFormat, JSONFormat
+from bookmarks_converter.favicons import FAVICON_CACHE_FILE_SUFFIX
+from bookmarks_converter.formats import BaseFormat, DBFormat, HTMLFormat, JSONFormat, PlacesFormat
+from bookmarks_converter.icons import data_uri
 
 
 def test_input_file():
@@ -52,6 +62,11 @@ def test_output_file_error():
 
 USAGE_MSG = (
     "usage: bookmarks-converter [-h] [-V] -i INPUT -I INPUT_FORMAT [-o OUTPUT] -O OUTPUT_FORMAT\n"
+    "                           [--favicons FAVICONS] [--deterministic] [--cache-dir CACHE_DIR]\n"
+    "                           [--skip-unchanged] [--timings [{text,json}]] [--profile PROFILE]\n"
+    "                           [--profile-stage {read,format,parse,build,serialize,write}]\n"
+    "                           [--trace TRACE] [--progress] [--timeout SECONDS] [--search-index]\n"
+    "                           [--icon-table]\n"
 )
 
 test_parse_args_positional_arguments_params = (
@@ -82,9 +97,9 @@ def test_parse_args_positional_arguments(
     _, args = _parse_args(argv)
     assert args.input == input_
     assert args.input_format == input_format
-    assert args.output_format == output_format
+    assert args.output_format == [output_format]
     if output_file:
-        assert args.output == Path(output_file)
+        assert args.output == [Path(output_file)]
 
 
 test_parse_bookmark_format_params = (
@@ -94,6 +109,7 @@ test_parse_bookmark_format_params = (
     pytest.param("chrome/json", Chrome, JSONFormat, id="chrome/json"),
     pytest.param("firefox/html", Firefox, HTMLFormat, id="firefox/html"),
     pytest.param("firefox/json", Firefox, JSONFormat, id="firefox/json"),
+    pytest.param("firefox/places", Firefox, PlacesFormat, id="firefox/places"),
 )
 
 
@@ -180,6 +196,411 @@ def test_main(
         assert filecmp.cmp(output_filepath, expected_result)
 
 
+def test_main_places(capsys, read_json, write_places):
+    with TemporaryDirectory() as tmpdir:
+        places_path = Path(tmpdir).joinpath("places.sqlite")
+        write_places(read_json(TEST_FILE_FIREFOX_JSON), places_path, {})
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        exit_code = main(
+            ["-i", str(places_path), "-I", "firefox/places", "-O", "firefox/html"]
+            + ["-o", str(output_filepath)]
+        )
+        out, err = capsys.readouterr()
+        assert exit_code == 0
+        assert err == ""
+
+        assert filecmp.cmp(output_filepath, TEST_FILE_FIREFOX_HTML)
+
+
+def test_main_favicons(capsys, write_favicons):
+    icon = b"\x89PNG\r\n\x1a\n" + bytes(16)
+    with TemporaryDirectory() as tmpdir:
+        favicons_path = Path(tmpdir).joinpath("Favicons")
+        write_favicons(
+            favicons_path,
+            [("https://github.com/favicon.ico", 1, ["https://github.com/"], [(16, icon, 0)])],
+        )
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        exit_code = main(
+            ["-i", str(TEST_FILE_CHROME_JSON), "-I", "chrome/json", "-O", "chrome/html"]
+            + ["-o", str(output_filepath), "--favicons", str(favicons_path)]
+        )
+        out, err = capsys.readouterr()
+        assert exit_code == 0
+        assert err == ""
+
+        output = output_filepath.read_text(encoding="utf-8")
+        assert output.count(f'ICON="{data_uri("image/png", icon)}"') == 1
+
+
+def test_main_favicons_cache_dir(capsys, write_favicons):
+    icon = b"\x89PNG\r\n\x1a\n" + bytes(16)
+    with TemporaryDirectory() as tmpdir:
+        favicons_path = Path(tmpdir).joinpath("Favicons")
+        cache_dir = Path(tmpdir).joinpath("cache")
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        argv = ["-i", str(TEST_FILE_CHROME_JSON), "-I", "chrome/json", "-O", "chrome/html"]
+        argv += ["-o", str(output_filepath), "--favicons", str(favicons_path)]
+        argv += ["--cache-dir", str(cache_dir)]
+        write_favicons(
+            favicons_path,
+            [("https://github.com/favicon.ico", 1, ["https://github.com/"], [(16, icon, 0)])],
+        )
+        assert main(argv) == 0
+        assert len(list(cache_dir.glob(f"*{FAVICON_CACHE_FILE_SUFFIX}"))) == 1
+
+        # the icon (not updated since it was cached) is reused by the next conversion.
+        with sqlite3.connect(favicons_path) as connection:
+            connection.execute("UPDATE favicon_bitmaps SET image_data = ?", (icon + b"new",))
+        connection.close()
+        assert main(argv) == 0
+        out, err = capsys.readouterr()
+        assert err == ""
+
+        output = output_filepath.read_text(encoding="utf-8")
+        assert output.count(f'ICON="{data_uri("image/png", icon)}"') == 1
+
+
+@pytest.mark.parametrize("output_format", ("bookmarkie/json", "firefox/json", "bookmarkie/db"))
+def test_main_deterministic(capsys, output_format: str):
+    with TemporaryDirectory() as tmpdir:
+        output_files = [Path(tmpdir).joinpath(f"output_file_{i}") for i in range(2)]
+        for output_file in output_files:
+            exit_code = main(
+                [
+                    "-i",
+                    str(TEST_FILE_FIREFOX_HTML),
+                    "-I",
+                    "firefox/html",
+                    "-O",
+                    output_format,
+                    "-o",
+                    str(output_file),
+                    "--deterministic",
+                ]
+            )
+            assert exit_code == 0
+
+        assert filecmp.cmp(*output_files, shallow=False)
+
+
+def test_main_cache_dir(capsys):
+    with TemporaryDirectory() as tmpdir:
+        cache_dir = Path(tmpdir).joinpath("cache")
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        for _ in range(2):
+            exit_code = main(
+                [
+                    "-i",
+                    str(TEST_FILE_BOOKMARKIE_JSON),
+                    "-I",
+                    "bookmarkie/json",
+                    "-O",
+                    "bookmarkie/html",
+                    "-o",
+                    str(output_filepath),
+                    "--cache-dir",
+                    str(cache_dir),
+                ]
+            )
+            assert exit_code == 0
+            assert filecmp.cmp(output_filepath, TEST_FILE_BOOKMARKIE_HTML, shallow=False)
+
+        assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_main_skip_unchanged(capsys):
+    with TemporaryDirectory() as tmpdir:
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        argv = [
+            "-i",
+            str(TEST_FILE_BOOKMARKIE_JSON),
+            "-I",
+            "bookmarkie/json",
+            "-O",
+            "bookmarkie/html",
+            "-o",
+            str(output_filepath),
+            "--skip-unchanged",
+        ]
+        assert main(argv) == 0
+        out, _ = capsys.readouterr()
+        assert out.endswith(f"can be found at '{output_filepath}'\n")
+
+        assert main(argv) == 0
+        out, _ = capsys.readouterr()
+        assert out == (
+            f"Conversion successful!\nThe converted file at '{output_filepath}' is unchanged\n"
+        )
+        assert filecmp.cmp(output_filepath, TEST_FILE_BOOKMARKIE_HTML, shallow=False)
+
+
+def test_main_multiple_outputs(capsys):
+    with TemporaryDirectory() as tmpdir:
+        html_filepath = Path(tmpdir).joinpath("output.html")
+        json_filepath = Path(tmpdir).joinpath("output.json")
+        exit_code = main(
+            [
+                "-i",
+                str(TEST_FILE_BOOKMARKIE_JSON),
+                "-I",
+                "bookmarkie/json",
+                "-O",
+                "bookmarkie/html",
+                "-o",
+                str(html_filepath),
+                "-O",
+                "bookmarkie/json",
+                "-o",
+                str(json_filepath),
+            ]
+        )
+        out, err = capsys.readouterr()
+        assert exit_code == 0
+        assert out == (
+            "Conversion successful!\n"
+            f"The converted file can be found at '{html_filepath}'\n"
+            f"The converted file can be found at '{json_filepath}'\n"
+        )
+        assert filecmp.cmp(html_filepath, TEST_FILE_BOOKMARKIE_HTML, shallow=False)
+        assert filecmp.cmp(json_filepath, TEST_FILE_BOOKMARKIE_JSON, shallow=False)
+
+
+def test_main_multiple_outputs_generated_names(capsys):
+    with TemporaryDirectory() as tmpdir:
+        input_filepath = Path(tmpdir).joinpath("input.json")
+        shutil.copy(TEST_FILE_BOOKMARKIE_JSON, input_filepath)
+        exit_code = main(
+            ["-i", str(input_filepath), "-I", "bookmarkie/json"]
+            + ["-O", "bookmarkie/html", "-O", "firefox/html"]
+        )
+        assert exit_code == 0
+        outputs = sorted(p.name for p in Path(tmpdir).iterdir() if p != input_filepath)
+        assert len(outputs) == 2
+        assert outputs[0].endswith("-bookmarkie.html")
+        assert outputs[1].endswith("-firefox.html")
+
+
+def test_main_timings(capsys):
+    with TemporaryDirectory() as tmpdir:
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+        argv += ["-O", "bookmarkie/html", "-o", str(output_filepath)]
+
+        assert main(argv + ["--timings"]) == 0
+        out, err = capsys.readouterr()
+        assert (
+            out
+            == f"Conversion successful!\nThe converted file can be found at '{output_filepath}'\n"
+        )
+        lines = err.splitlines()
+        assert lines[0].split() == ["stage", "wall", "(s)", "cpu", "(s)"]
+        assert [line.split()[0] for line in lines[1:6]] == [
+            "import",
+            "read",
+            "parse",
+            "serialize",
+            "write",
+        ]
+        assert lines[6:] == [
+            f"bytes in: {TEST_FILE_BOOKMARKIE_JSON.stat().st_size}",
+            "nodes: 44",
+            f"bytes out: {output_filepath.stat().st_size}",
+        ]
+
+        assert main(argv + ["--timings", "json"]) == 0
+        _, err = capsys.readouterr()
+        timings = json.loads(err)
+        stages = [stage_timing["stage"] for stage_timing in timings["stages"]]
+        assert stages == ["import", "read", "parse", "serialize", "write"]
+        assert all(stage_timing["wall"] >= 0 for stage_timing in timings["stages"])
+        assert timings["counters"]["nodes"] == 44
+
+
+def test_main_profile(capsys):
+    with TemporaryDirectory() as tmpdir:
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        profile_path = Path(tmpdir).joinpath("profile.pstats")
+        collapsed_path = Path(tmpdir).joinpath("profile.collapsed")
+        argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+        argv += ["-O", "bookmarkie/html", "-o", str(output_filepath)]
+        argv += ["--profile", str(profile_path), "--profile-stage", "serialize"]
+
+        assert main(argv) == 0
+        out, _ = capsys.readouterr()
+        assert out == (
+            "Conversion successful!\n"
+            f"The converted file can be found at '{output_filepath}'\n"
+            f"The profile can be found at '{profile_path}' and '{collapsed_path}'\n"
+        )
+        assert profile_path.is_file()
+        assert "as_html" in collapsed_path.read_text(encoding="utf-8")
+        assert filecmp.cmp(output_filepath, TEST_FILE_BOOKMARKIE_HTML, shallow=False)
+
+
+def test_main_profile_multiple_outputs(capsys):
+    # the outputs are written on threads, which are all profiled.
+    with TemporaryDirectory() as tmpdir:
+        html_filepath = Path(tmpdir).joinpath("output.html")
+        json_filepath = Path(tmpdir).joinpath("output.json")
+        profile_path = Path(tmpdir).joinpath("profile.collapsed")
+        collapsed_path = Path(tmpdir).joinpath("profile.collapsed.collapsed")
+        argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+        argv += ["-O", "bookmarkie/html", "-o", str(html_filepath)]
+        argv += ["-O", "firefox/json", "-o", str(json_filepath)]
+        argv += ["--profile", str(profile_path)]
+
+        assert main(argv) == 0
+        out, _ = capsys.readouterr()
+        assert out.endswith(
+            f"The profile can be found at '{profile_path}' and '{collapsed_path}'\n"
+        )
+        names = {name for _, _, name in pstats.Stats(str(profile_path)).stats}
+        assert {"as_html", "as_json"} <= names
+        collapsed = collapsed_path.read_text(encoding="utf-8")
+        assert ":as_html:" in collapsed
+        assert ":as_json:" in collapsed
+        assert filecmp.cmp(html_filepath, TEST_FILE_BOOKMARKIE_HTML, shallow=False)
+
+
+def test_main_trace(capsys):
+    with TemporaryDirectory() as tmpdir:
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        trace_path = Path(tmpdir).joinpath("trace.json")
+        argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+        argv += ["-O", "bookmarkie/html", "-o", str(output_filepath), "--trace", str(trace_path)]
+
+        assert main(argv) == 0
+        out, _ = capsys.readouterr()
+        assert out.endswith(f"The trace can be found at '{trace_path}'\n")
+        with trace_path.open("r", encoding="utf-8") as file:
+            trace = json.load(file)
+        names = {event["name"] for event in trace["traceEvents"]}
+        assert {"Bookmarkie.from_json", "Bookmarkie.as_html", "save_html"} <= names
+
+
+@pytest.mark.parametrize("option", ["-V", "--version"])
+def test_main_version(option, capsys):
+    with pytest.raises(SystemExit) as err_info:
+        main([option])
+    (retv,) = err_info.value.args
+    out, _ = capsys.readouterr()
+    assert retv == 0
+    assert out == f"bookmarks-converter {_get_version()}\n"
+
+
+def test_main_progress(capsys):
+    with TemporaryDirectory() as tmpdir:
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+        argv += ["-O", "bookmarkie/html", "-o", str(output_filepath), "--progress"]
+
+        assert main(argv) == 0
+        out, err = capsys.readouterr()
+        assert out.startswith("Conversion successful!\n")
+        assert err.startswith("\rread ")
+        assert "serialize [" in err
+        assert err.endswith("\n")
+
+
+def test_main_timeout(capsys):
+    with TemporaryDirectory() as tmpdir:
+        output_filepath = Path(tmpdir).joinpath("output_file")
+        argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+        argv += ["-O", "bookmarkie/html", "-o", str(output_filepath), "--timeout", "1e-9"]
+
+        with pytest.raises(SystemExit) as err_info:
+            main(argv)
+        (retv,) = err_info.value.args
+        _, err = capsys.readouterr()
+        assert retv == 2
+        assert err.endswith("error: The conversion exceeded its 1e-09s deadline.\n")
+        assert not output_filepath.exists()
+
+
+@pytest.mark.parametrize("seconds", ["0", "-1", "soon"])
+def test_main_timeout_error(seconds, capsys):
+    argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+    argv += ["-O", "bookmarkie/html", "--timeout", seconds]
+    with pytest.raises(SystemExit):
+        main(argv)
+    _, err = capsys.readouterr()
+    assert "argument --timeout" in err
+
+
+def test_main_generate(capsys):
+    with TemporaryDirectory() as tmpdir:
+        output_filepath = Path(tmpdir).joinpath("generated.json")
+        argv = ["generate", "-o", str(output_filepath), "-O", "chrome/json", "--size", "50"]
+        assert main(argv) == 0
+        out, _ = capsys.readouterr()
+        assert out == (
+            f"Generation successful!\nThe generated file can be found at '{output_filepath}'\n"
+        )
+        content = output_filepath.read_bytes()
+
+        # the same options generate the same file.
+        assert main(argv) == 0
+        assert output_filepath.read_bytes() == content
+
+        bookmarks = Chrome().from_json(output_filepath)
+        assert len(bookmarks.children) == 3
+
+
+def test_main_generate_error(capsys):
+    with pytest.raises(SystemExit) as err_info:
+        main(["generate", "-o", "generated.db", "-O", "chrome/db"])
+    (retv,) = err_info.value.args
+    out, err = capsys.readouterr()
+    assert retv == 2
+    assert out == ""
+    assert err.endswith(
+        "bookmarks-converter generate: error: "
+        "The converter 'Chrome' doesn't support the format 'db'\n"
+    )
+
+
+def test_main_search(capsys):
+    with TemporaryDirectory() as tmpdir:
+        db_filepath = Path(tmpdir).joinpath("bookmarks.db")
+        argv = ["-i", str(TEST_FILE_BOOKMARKIE_JSON), "-I", "bookmarkie/json"]
+        argv += ["-o", str(db_filepath), "-O", "bookmarkie/db", "--search-index"]
+        assert main(argv) == 0
+        capsys.readouterr()
+
+        assert main(["search", "-i", str(db_filepath), "international", "--limit", "1"]) == 0
+        out, _ = capsys.readouterr()
+        assert out in (
+            "https://www.audi.com/en.html\tAudi.com – the international Audi website | audi.com\n",
+            "https://www.bmw.com/en/index.html\tBMW.com | The international BMW Website\n",
+        )
+
+
+test_main_search_error_params = (
+    pytest.param(
+        ["-i", str(TEST_FILE_BOOKMARKIE_DB), "audi"],
+        f"The DB '{TEST_FILE_BOOKMARKIE_DB}' has no search index.",
+        id="no_index",
+    ),
+    pytest.param(
+        ["-i", str(TEST_FILE_BOOKMARKIE_HTML), "audi"],
+        f"The provided file '{TEST_FILE_BOOKMARKIE_HTML}' is not a valid sqlite3 database file.",
+        id="not_database",
+    ),
+)
+
+
+@pytest.mark.parametrize("argv, message", test_main_search_error_params)
+def test_main_search_error(capsys, argv, message):
+    with pytest.raises(SystemExit) as err_info:
+        main(["search", *argv])
+    (retv,) = err_info.value.args
+    out, err = capsys.readouterr()
+    assert retv == 2
+    assert out == ""
+    assert err.endswith(f"bookmarks-converter search: error: {message}\n")
+
+
 test_main_error_params = (
     pytest.param(
         ["-i", str(TEST_INPUT_FILE), "-I", "bookmarkie/db", "-O", "firefox/json"],
@@ -199,6 +620,13 @@ test_main_error_params = (
         + f"bookmarks-converter: error: The provided file '{str(TEST_INPUT_FILE)}' is not a valid bookmarks file.\n",
         id="not_html",
     ),
+    pytest.param(
+        ["-i", str(TEST_FILE_CHROME_JSON), "-I", "chrome/json", "-O", "chrome/html"]
+        + ["--favicons", str(TEST_INPUT_FILE)],
+        USAGE_MSG
+        + f"bookmarks-converter: error: The provided file '{str(TEST_INPUT_FILE)}' is not a valid Chrome Favicons database.\n",
+        id="not_favicons",
+    ),
     pytest.param(
         ["-i", str(TEST_INPUT_FILE), "-I", "a", "-O", "firefox/json"],
         USAGE_MSG + "bookmarks-converter: error: Invalid bookmark format: a\n",
@@ -219,6 +647,20 @@ test_main_error_params = (
         USAGE_MSG + "bookmarks-converter: error: 'x' is not a valid Format\n",
         id="invalid_output_format_type",
     ),
+    pytest.param(
+        ["-i", str(TEST_INPUT_FILE), "-I", "firefox/json", "-O", "firefox/html"]
+        + ["-o", str(TEST_OUTPUT_FILE), "-o", str(TEST_INPUT_FILE)],
+        USAGE_MSG
+        + "bookmarks-converter: error: More output files than output formats were provided.\n",
+        id="too_many_output_files",
+    ),
+    pytest.param(
+        ["-i", str(TEST_INPUT_FILE), "-I", "firefox/json", "-O", "firefox/html"]
+        + ["-o", str(TEST_OUTPUT_FILE), "-O", "chrome/html", "-o", str(TEST_OUTPUT_FILE)],
+        USAGE_MSG
+        + "bookmarks-converter: error: The same output file is used for multiple output formats.\n",
+        id="duplicate_output_file",
+    ),
 )
 
 
@@ -0,0 +1,191 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import TEST_FILE_BOOKMARKIE_DB
+from resources.bookmarks_bookmarkie import bookmarks_json
+
+from bookmarks_converter import Bookmarkie
+from bookmarks_converter.engines import (
+    MODE_IMMUTABLE,
+    MODE_READ_ONLY,
+    MODE_READ_WRITE,
+    EngineCache,
+    current_engines,
+    database_url,
+    open_engine,
+)
+from bookmarks_converter.formats import FORMATS, Format, save_db, save_many
+from bookmarks_converter.history import HistoryStore
+
+PROC_FDS = Path("/proc/self/fd")
+needs_proc = pytest.mark.skipif(not PROC_FDS.is_dir(), reason="lists the open files in /proc")
+
+
+def _open_files(filepath: Path) -> int:
+    """The number of file descriptors of the process opened on the file."""
+    target = str(Path(filepath).resolve())
+    count = 0
+    for fd in PROC_FDS.iterdir():
+        try:
+            count += os.readlink(fd) == target
+        except OSError:
+            continue
+    return count
+
+
+def _copy_db(directory: str, name: str) -> Path:
+    filepath = Path(directory).joinpath(name)
+    shutil.copyfile(TEST_FILE_BOOKMARKIE_DB, filepath)
+    return filepath
+
+
+test_database_url_params = (
+    pytest.param(MODE_READ_WRITE, "sqlite:////tmp/bookmarks.db", id="read_write"),
+    pytest.param(MODE_READ_ONLY, "sqlite:///file:///tmp/bookmarks.db?mode=ro&uri=true", id="ro"),
+    pytest.param(
+        MODE_IMMUTABLE,
+        "sqlite:///file:///tmp/bookmarks.db?mode=ro&immutable=1&uri=true",
+        id="immutable",
+    ),
+)
+
+
+@pytest.mark.parametrize("mode, expected", test_database_url_params)
+def test_database_url(mode, expected):
+    assert database_url(Path("/tmp/bookmarks.db"), mode) == expected
+
+
+@needs_proc
+def test_from_db_closes_connections():
+    with TemporaryDirectory() as tmpdir:
+        filepath = _copy_db(tmpdir, "bookmarks.db")
+
+        assert Bookmarkie().from_db(filepath) == bookmarks_json()
+        assert _open_files(filepath) == 0
+
+
+@needs_proc
+def test_lazy_from_db_closes_connections():
+    with TemporaryDirectory() as tmpdir:
+        filepath = _copy_db(tmpdir, "bookmarks.db")
+
+        result = Bookmarkie().from_db(filepath, lazy=True)
+        assert result == bookmarks_json()
+        # the lazy tree doesn't keep a connection to its DB.
+        assert _open_files(filepath) == 0
+
+        with EngineCache() as engines:
+            result = Bookmarkie().from_db(filepath, lazy=True)
+            assert result == bookmarks_json()
+            assert (engines.stats.misses, _open_files(filepath)) == (1, 1)
+        assert _open_files(filepath) == 0
+
+
+class TestEngineCache:
+    bookmarkie = Bookmarkie()
+
+    @needs_proc
+    def test_reuse(self):
+        with TemporaryDirectory() as tmpdir:
+            filepath = _copy_db(tmpdir, "bookmarks.db")
+            with EngineCache() as engines:
+                assert current_engines() is engines
+                for _ in range(3):
+                    assert self.bookmarkie.from_db(filepath) == bookmarks_json()
+                assert (engines.stats.hits, engines.stats.misses, len(engines)) == (2, 1, 1)
+                # the connection is kept open for the next conversions.
+                assert _open_files(filepath) == 1
+
+            assert current_engines() is None
+            assert len(engines) == 0
+            assert _open_files(filepath) == 0
+
+    @needs_proc
+    def test_evictions(self):
+        with TemporaryDirectory() as tmpdir:
+            filepaths = [_copy_db(tmpdir, f"bookmarks_{i}.db") for i in range(5)]
+            with EngineCache(max_engines=2) as engines:
+                for filepath in filepaths:
+                    self.bookmarkie.from_db(filepath)
+
+                assert (len(engines), engines.stats.evictions) == (2, 3)
+                assert sum(_open_files(filepath) for filepath in filepaths) == 2
+
+    def test_modes(self):
+        with TemporaryDirectory() as tmpdir:
+            filepath = _copy_db(tmpdir, "bookmarks.db")
+            with EngineCache() as engines:
+                with open_engine(filepath, MODE_READ_ONLY) as read_only:
+                    assert read_only is engines.engine(filepath, MODE_READ_ONLY)
+                with open_engine(filepath) as read_write:
+                    assert read_write is not read_only
+                assert len(engines) == 2
+
+    def test_replaced_file(self):
+        tree = bookmarks_json()
+        tree.children[0].title = "replaced"
+        with TemporaryDirectory() as tmpdir:
+            filepath = _copy_db(tmpdir, "bookmarks.db")
+            other = Path(tmpdir).joinpath("other.db")
+            with EngineCache() as engines:
+                assert self.bookmarkie.from_db(filepath) == bookmarks_json()
+
+                save_db(self.bookmarkie.as_db(tree), other)
+                os.replace(other, filepath)
+                assert self.bookmarkie.from_db(filepath) == tree
+
+                # save_db replaces the file, and forgets the engine of its temporary file.
+                save_db(self.bookmarkie.as_db(bookmarks_json()), filepath, skip_unchanged=True)
+                assert self.bookmarkie.from_db(filepath) == bookmarks_json()
+                paths = {Path(path) for path, _ in engines._engines}
+                assert paths == {filepath.resolve(), other.resolve()}
+
+    def test_nested(self):
+        with EngineCache() as outer:
+            with EngineCache() as inner:
+                assert current_engines() is inner
+                self.bookmarkie.from_db(TEST_FILE_BOOKMARKIE_DB)
+            assert current_engines() is outer
+            assert (len(inner), len(outer)) == (0, 0)
+            assert inner.stats.misses == 1
+
+    def test_threads(self):
+        # a thread doesn't use the cache entered by another thread.
+        results = []
+        with EngineCache():
+            thread = threading.Thread(target=lambda: results.append(current_engines()))
+            thread.start()
+            thread.join()
+        assert results == [None]
+
+    def test_save_many(self):
+        # the writer threads use the cache of the caller.
+        with TemporaryDirectory() as tmpdir, EngineCache() as engines:
+            outputs = [
+                (self.bookmarkie, FORMATS[Format.DB], Path(tmpdir).joinpath(f"{name}.db"))
+                for name in ("first", "second")
+            ]
+            assert save_many(bookmarks_json(), outputs) == [True, True]
+            assert len(engines) == 2
+
+    @needs_proc
+    def test_history_store(self):
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("history.db")
+            with EngineCache() as engines:
+                with HistoryStore(filepath) as store:
+                    store.add(bookmarks_json())
+                assert (engines.stats.misses, len(engines)) == (1, 1)
+                # the engine belongs to the cache, and outlives the store.
+                assert _open_files(filepath) == 1
+            assert _open_files(filepath) == 0
+
+    def test_invalid_max_engines(self):
+        with pytest.raises(ValueError) as err_info:
+            EngineCache(max_engines=0)
+
+        assert err_info.value.args[0] == "max_engines must be at least 1."
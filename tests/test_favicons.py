@@ -0,0 +1,179 @@
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import TEST_FILE_CHROME_JSON, tree_urls
+
+from bookmarks_converter import Chrome
+from bookmarks_converter.favicons import (
+    FAVICON_CACHE_FILE_SUFFIX,
+    FAVICON_TYPE_FAVICON,
+    FaviconCache,
+    add_favicons,
+)
+from bookmarks_converter.icons import data_uri
+
+PNG_16 = b"\x89PNG\r\n\x1a\n" + b"16" * 8
+PNG_32 = b"\x89PNG\r\n\x1a\n" + b"32" * 8
+ICO = b"\x00\x00\x01\x00" + b"ico" * 4
+TOUCH_ICON_TYPE = 2
+
+FAVICONS = [
+    (
+        "https://github.githubassets.com/favicon.ico",
+        FAVICON_TYPE_FAVICON,
+        ["https://github.com/", "https://gitlab.com/explore"],
+        [(32, PNG_32, 100), (16, PNG_16, 100)],
+    ),
+    (
+        "https://golang.org/favicon.ico",
+        FAVICON_TYPE_FAVICON,
+        ["https://golang.org/"],
+        [(32, ICO, 5)],
+    ),
+    ("https://golang.org/touch.png", TOUCH_ICON_TYPE, ["https://golang.org/"], [(16, PNG_16, 5)]),
+    ("https://discord.com/touch.png", TOUCH_ICON_TYPE, ["https://discord.com/"], [(16, PNG_16, 5)]),
+    ("https://www.ubuntu.com/favicon.ico", FAVICON_TYPE_FAVICON, ["http://www.ubuntu.com/"], []),
+]
+EXPECTED = {
+    "https://github.com/": (data_uri("image/png", PNG_16), FAVICONS[0][0]),
+    "https://gitlab.com/explore": (data_uri("image/png", PNG_16), FAVICONS[0][0]),
+    # the favicon is preferred to the touch icon.
+    "https://golang.org/": (data_uri("image/x-icon", ICO), FAVICONS[1][0]),
+    "https://discord.com/": (data_uri("image/png", PNG_16), FAVICONS[3][0]),
+}
+
+
+@pytest.fixture
+def favicons_db(write_favicons):
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("Favicons")
+        write_favicons(filepath, FAVICONS)
+        yield filepath
+
+
+def test_from_json_favicons(favicons_db):
+    tree = Chrome().from_json(TEST_FILE_CHROME_JSON, favicons=favicons_db)
+
+    urls = tree_urls(tree)
+    assert {url.url: (url.icon, url.icon_uri) for url in urls if url.icon} == EXPECTED
+    assert not any(url.icon for url in tree_urls(Chrome().from_json(TEST_FILE_CHROME_JSON)))
+
+
+def test_add_favicons_keeps_icons(favicons_db):
+    tree = Chrome().from_json(TEST_FILE_CHROME_JSON)
+    github = next(url for url in tree_urls(tree) if url.url == "https://github.com/")
+    github.icon = data_uri("image/png", PNG_32)
+    github.icon_uri = "https://github.com/icon.png"
+
+    assert add_favicons(tree, favicons_db, FaviconCache()) == len(EXPECTED) - 1
+    assert (github.icon, github.icon_uri) == (
+        data_uri("image/png", PNG_32),
+        "https://github.com/icon.png",
+    )
+
+
+class TestFaviconCache:
+    def test_unchanged_icons(self, favicons_db):
+        cache = FaviconCache()
+
+        assert add_favicons(Chrome().from_json(TEST_FILE_CHROME_JSON), favicons_db, cache) == 4
+        # the github and gitlab urls share their icon.
+        assert (cache.stats.hits, cache.stats.misses, len(cache)) == (0, 3, 3)
+
+        tree = Chrome().from_json(TEST_FILE_CHROME_JSON)
+        assert add_favicons(tree, favicons_db, cache) == 4
+        assert (cache.stats.hits, cache.stats.misses) == (3, 3)
+        assert {
+            url.url: (url.icon, url.icon_uri) for url in tree_urls(tree) if url.icon
+        } == EXPECTED
+
+    def test_updated_icon(self, favicons_db):
+        cache = FaviconCache()
+        add_favicons(Chrome().from_json(TEST_FILE_CHROME_JSON), favicons_db, cache)
+        with sqlite3.connect(favicons_db) as connection:
+            connection.execute(
+                "UPDATE favicon_bitmaps SET image_data = ?, last_updated = 200"
+                " WHERE width = 16 AND last_updated = 100",
+                (PNG_32,),
+            )
+        connection.close()
+
+        tree = Chrome().from_json(TEST_FILE_CHROME_JSON)
+        add_favicons(tree, favicons_db, cache)
+
+        assert (cache.stats.hits, cache.stats.misses) == (2, 4)
+        github = next(url for url in tree_urls(tree) if url.url == "https://github.com/")
+        assert github.icon == data_uri("image/png", PNG_32)
+
+    def test_evictions(self, favicons_db):
+        cache = FaviconCache(max_size=2)
+
+        add_favicons(Chrome().from_json(TEST_FILE_CHROME_JSON), favicons_db, cache)
+
+        assert (len(cache), cache.stats.evictions) == (2, 1)
+
+    def test_threads(self, favicons_db):
+        cache = FaviconCache()
+        trees = [Chrome().from_json(TEST_FILE_CHROME_JSON) for _ in range(8)]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            added = list(executor.map(lambda tree: add_favicons(tree, favicons_db, cache), trees))
+
+        assert added == [4] * len(trees)
+        assert len(cache) == 3
+        assert cache.stats.hits + cache.stats.misses == 3 * len(trees)
+
+    def test_directory(self, favicons_db):
+        with TemporaryDirectory() as tmpdir:
+            add_favicons(
+                Chrome().from_json(TEST_FILE_CHROME_JSON),
+                favicons_db,
+                FaviconCache(directory=tmpdir),
+            )
+            (entry,) = Path(tmpdir).glob(f"*{FAVICON_CACHE_FILE_SUFFIX}")
+
+            # a new cache (ex. in the next process) reads the icons stored by the previous one.
+            cache = FaviconCache(directory=tmpdir)
+            tree = Chrome().from_json(TEST_FILE_CHROME_JSON)
+            assert add_favicons(tree, favicons_db, cache) == 4
+            assert (cache.stats.hits, cache.stats.misses) == (3, 0)
+            assert {
+                url.url: (url.icon, url.icon_uri) for url in tree_urls(tree) if url.icon
+            } == EXPECTED
+
+            cache.clear()
+            assert not entry.exists()
+
+    @pytest.mark.parametrize("content", [b"{truncated", b"[1, 2]", b'{"1": 2}'])
+    def test_directory_corrupted(self, favicons_db, content: bytes):
+        with TemporaryDirectory() as tmpdir:
+            add_favicons(
+                Chrome().from_json(TEST_FILE_CHROME_JSON),
+                favicons_db,
+                FaviconCache(directory=tmpdir),
+            )
+            (entry,) = Path(tmpdir).glob(f"*{FAVICON_CACHE_FILE_SUFFIX}")
+            entry.write_bytes(content)
+
+            cache = FaviconCache(directory=tmpdir)
+            assert add_favicons(Chrome().from_json(TEST_FILE_CHROME_JSON), favicons_db, cache) == 4
+            assert (cache.stats.errors, cache.stats.misses) == (1, 3)
+            # the icons read again replace the corrupted file.
+            assert len(json.loads(entry.read_bytes())) == 3
+
+
+def test_add_favicons_locked(favicons_db):
+    # Chrome holds an exclusive lock on the database while it runs.
+    connection = sqlite3.connect(favicons_db, isolation_level=None)
+    connection.execute("PRAGMA locking_mode = EXCLUSIVE")
+    connection.execute("BEGIN EXCLUSIVE")
+    try:
+        tree = Chrome().from_json(TEST_FILE_CHROME_JSON)
+        assert add_favicons(tree, favicons_db, FaviconCache()) == len(EXPECTED)
+    finally:
+        connection.execute("COMMIT")
+        connection.close()
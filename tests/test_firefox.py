@@ -1,8 +1,12 @@
+import sqlite3
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from uuid import uuid4
 
 import pytest
 from conftest import (
+    MAX_SCALING_EXPONENT,
+    PLACES_SCHEMA,
     TEST_FILE_FIREFOX_HTML,
     TEST_FILE_FIREFOX_JSON,
     TEST_FILE_FIREFOX_JSON_WITH_SEPARATOR,
@@ -30,6 +34,26 @@ from bookmarks_converter.converters.firefox import (
 )
 from bookmarks_converter.models import Folder, HTMLBookmark, SpecialFolder, Url
 
+PLACES_TAGS = {
+    "cars, german": ["https://www.audi.com/en.html", "https://www.bmw.com/en/index.html"],
+    "photos": ["https://www.flickr.com/"],
+}
+
+
+def _places_tree() -> Folder:
+    """The tree of the firefox JSON file, as imported from places.sqlite: the icons aren't
+    imported, and the urls have the tags of PLACES_TAGS."""
+    tree = bookmarks_json()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Folder):
+            stack.extend(node.children)
+            continue
+        node.icon_uri = ""
+        node.tags = [tag for tag, urls in PLACES_TAGS.items() if node.url in urls]
+    return tree
+
 
 class TestFirefox:
     firefox = Firefox()
@@ -42,6 +66,43 @@ class TestFirefox:
 
         assert result == expected
 
+    def test_restructure_root(self):
+        menu = HTMLBookmark(name="h3", attrs={"title": "menu"})
+        menu.children.extend(
+            [
+                HTMLBookmark(name="a", attrs={"href": "https://www.example.com/0"}),
+                HTMLBookmark(
+                    name="h3", attrs={"title": "special", "personal_toolbar_folder": "true"}
+                ),
+                HTMLBookmark(
+                    name="h3", attrs={"title": "special", "unfiled_bookmarks_folder": "true"}
+                ),
+                HTMLBookmark(name="a", attrs={"href": "https://www.example.com/1"}),
+            ]
+        )
+        special_folders = menu.children[1:-1]
+        urls = [menu.children[0], menu.children[-1]]
+
+        result = self.firefox._restructure_root(menu)
+
+        assert result.children == [menu, *special_folders]
+        assert menu.children == urls
+        HTMLBookmark.reset_id_counter()
+
+    def test_restructure_root_scales_linearly(self, scaling_exponent):
+        urls = [HTMLBookmark(name="a", attrs={"href": "https://www.example.com/"})] * 64000
+
+        def setup(size: int) -> HTMLBookmark:
+            menu = HTMLBookmark(name="h3", attrs={"title": "menu"})
+            menu.children.extend(urls[:size])
+            return menu
+
+        exponent = scaling_exponent(
+            setup, self.firefox._restructure_root, sizes=(4000, 16000, 64000)
+        )
+        HTMLBookmark.reset_id_counter()
+        assert exponent < MAX_SCALING_EXPONENT
+
     test_get_html_special_folder_params = (
         pytest.param("test-title", None, id="normal_folder"),
         pytest.param(MOZILLA_MENU_FOLDER_HTML_TITLE, SpecialFolder.MENU, id="menu_folder"),
@@ -440,3 +501,40 @@ class TestFirefox:
         assert url.id == id_
         assert url.title == title
         assert url.url == url_address
+
+    def test_from_places(self, read_json, write_places):
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("places.sqlite")
+            write_places(read_json(TEST_FILE_FIREFOX_JSON), filepath, PLACES_TAGS)
+
+            result = self.firefox.from_places(filepath)
+
+        assert result == _places_tree()
+
+    def test_from_places_locked(self, read_json, write_places):
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("places.sqlite")
+            write_places(read_json(TEST_FILE_FIREFOX_JSON), filepath, PLACES_TAGS)
+            # a running firefox holds an exclusive lock on its places.sqlite.
+            connection = sqlite3.connect(filepath)
+            try:
+                connection.execute("PRAGMA locking_mode = EXCLUSIVE")
+                connection.execute("BEGIN EXCLUSIVE")
+
+                result = self.firefox.from_places(filepath)
+            finally:
+                connection.close()
+
+        assert result == _places_tree()
+
+    def test_from_places_no_root(self):
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("places.sqlite")
+            with sqlite3.connect(filepath) as connection:
+                connection.executescript(PLACES_SCHEMA)
+            connection.close()
+
+            with pytest.raises(ValueError) as err_info:
+                self.firefox.from_places(filepath)
+
+        assert err_info.value.args[0] == "The places database has no root folder."
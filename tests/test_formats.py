@@ -1,8 +1,27 @@
+import copy
 import datetime
+import filecmp
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
+import pytest
 from conftest import DATA_DIR
+from resources.bookmarks_bookmarkie import bookmarks_json
 
-from bookmarks_converter.formats import Format, _new_file_name
+from bookmarks_converter import Bookmarkie, Chrome, Firefox
+from bookmarks_converter.converters import CONVERTERS
+from bookmarks_converter.formats import (
+    DIGEST_SUFFIX,
+    FORMATS,
+    Format,
+    _new_file_name,
+    save_db,
+    save_html,
+    save_json,
+    save_many,
+)
+from bookmarks_converter.guid import deterministic_guids
 
 
 def test_new_file_name():
@@ -15,3 +34,117 @@ def test_new_file_name():
     assert name == "bookmarks"
     assert date == now.strftime("%Y%m%d")
     assert time.isdigit()
+
+
+test_save_skip_unchanged_params = (
+    pytest.param(save_html, "<DL><p>\n</DL>\n", "<DL><p>\n</DL><p>\n", id="html"),
+    pytest.param(save_json, {"roots": {}, "version": 1}, {"roots": {}, "version": 2}, id="json"),
+)
+
+
+@pytest.mark.parametrize("save,bookmarks,changed_bookmarks", test_save_skip_unchanged_params)
+def test_save_skip_unchanged(save, bookmarks, changed_bookmarks):
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks")
+        assert save(bookmarks, filepath, skip_unchanged=True)
+        expected = filepath.read_bytes()
+        inode = filepath.stat().st_ino
+
+        assert not save(bookmarks, filepath, skip_unchanged=True)
+        assert filepath.stat().st_ino == inode
+
+        assert save(changed_bookmarks, filepath, skip_unchanged=True)
+        assert filepath.read_bytes() != expected
+        # no temporary files are left behind.
+        assert sorted(p.name for p in Path(tmpdir).iterdir()) == [
+            "bookmarks",
+            f"bookmarks{DIGEST_SUFFIX}",
+        ]
+
+
+@pytest.mark.parametrize("save,bookmarks,_", test_save_skip_unchanged_params)
+def test_save_skip_unchanged_same_as_save(save, bookmarks, _):
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks")
+        save(bookmarks, filepath)
+        # the existing file is compared by content when there is no digest file.
+        assert not save(bookmarks, filepath, skip_unchanged=True)
+
+
+def test_save_skip_unchanged_stale_digest():
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.html")
+        save_html("<DL><p>\n</DL>\n", filepath, skip_unchanged=True)
+        # the file is modified by someone else after the digest was written, within the same
+        # tick of a coarse filesystem clock: only its size tells it changed.
+        mtime = filepath.stat().st_mtime_ns
+        filepath.write_text("modified", encoding="utf-8")
+        os.utime(filepath, ns=(mtime, mtime))
+
+        assert save_html("<DL><p>\n</DL>\n", filepath, skip_unchanged=True)
+        assert filepath.read_text(encoding="utf-8") == "<DL><p>\n</DL>\n"
+
+
+def test_save_db_skip_unchanged():
+    bookmarkie = Bookmarkie()
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.db")
+        assert save_db(bookmarkie.as_db(bookmarks_json()), filepath, skip_unchanged=True)
+        assert not save_db(bookmarkie.as_db(bookmarks_json()), filepath, skip_unchanged=True)
+        assert bookmarkie.from_db(filepath) == bookmarks_json()
+
+
+test_as_format_does_not_modify_tree_params = [
+    pytest.param(converter, format_, id=f"{name}/{format_}")
+    for name, converter in CONVERTERS.items()
+    for format_ in converter.formats
+]
+
+
+@pytest.mark.parametrize("converter,format_", test_as_format_does_not_modify_tree_params)
+def test_as_format_does_not_modify_tree(converter, format_):
+    # the tree contains all the special folders, which some formats skip or rename.
+    tree = bookmarks_json()
+    expected = copy.deepcopy(tree)
+
+    getattr(converter(), f"as_{format_}")(tree)
+
+    assert tree == expected
+
+
+def test_save_many():
+    # the tree contains all the special folders, which some formats skip or rename.
+    tree = bookmarks_json()
+    expected = copy.deepcopy(tree)
+    with TemporaryDirectory() as tmpdir:
+        outputs = [
+            (Chrome(), FORMATS[Format.HTML], Path(tmpdir).joinpath("chrome.html")),
+            (Chrome(), FORMATS[Format.JSON], Path(tmpdir).joinpath("chrome.json")),
+            (Firefox(), FORMATS[Format.HTML], Path(tmpdir).joinpath("firefox.html")),
+            (Bookmarkie(), FORMATS[Format.DB], Path(tmpdir).joinpath("bookmarkie.db")),
+        ]
+        result = save_many(tree, outputs)
+
+        assert result == [True] * len(outputs)
+        for converter, format_, path in outputs:
+            with TemporaryDirectory() as single_dir:
+                single_path = Path(single_dir).joinpath(path.name)
+                format_.save(converter, tree, single_path)
+                assert filecmp.cmp(path, single_path, shallow=False)
+    assert tree == expected
+
+
+def test_save_many_deterministic():
+    tree = bookmarks_json()
+    with TemporaryDirectory() as tmpdir, deterministic_guids():
+        paths = []
+        for run in range(2):
+            outputs = [
+                (Firefox(), FORMATS[Format.JSON], Path(tmpdir).joinpath(f"firefox_{run}.json")),
+                (Chrome(), FORMATS[Format.HTML], Path(tmpdir).joinpath(f"chrome_{run}.html")),
+            ]
+            save_many(tree, outputs)
+            paths.append(outputs[0][2])
+
+        # the writer threads use the guid mode of the caller.
+        assert filecmp.cmp(*paths, shallow=False)
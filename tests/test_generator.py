@@ -0,0 +1,133 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import tree_nodes, tree_urls
+
+from bookmarks_converter.converters import CONVERTERS, Bookmarkie, Chrome
+from bookmarks_converter.formats import FORMATS, Format
+from bookmarks_converter.generator import (
+    EVENT_CLOSE,
+    EVENT_OPEN,
+    EVENT_URL,
+    JSON_SPECIAL_FOLDERS,
+    UNICODE_WORDS,
+    BookmarksGenerator,
+    GeneratorOptions,
+    generate,
+    generate_tree,
+)
+from bookmarks_converter.models import SpecialFolder, Url
+
+SPECIAL_FOLDERS = (SpecialFolder.TOOLBAR, SpecialFolder.OTHER)
+
+
+def _urls(options: GeneratorOptions) -> list[Url]:
+    events = BookmarksGenerator(options).events(SPECIAL_FOLDERS)
+    return [node for event, node in events if event == EVENT_URL]
+
+
+class TestBookmarksGenerator:
+    def test_events(self):
+        options = GeneratorOptions(size=1000, max_depth=3, folder_ratio=0.3)
+        events = list(BookmarksGenerator(options).events(SPECIAL_FOLDERS))
+
+        opened = [node for event, node in events if event == EVENT_OPEN]
+        closed = [node for event, node in events if event == EVENT_CLOSE]
+        assert opened[0].special_folder == SpecialFolder.TOOLBAR
+        assert sorted(folder.id for folder in opened) == sorted(folder.id for folder in closed)
+        # every generated bookmark is counted, the special folders aren't.
+        assert len(events) - len(closed) == options.size + len(SPECIAL_FOLDERS)
+        assert len({node.id for _, node in events}) == len(events) - len(closed)
+
+        depth = max_depth = 0
+        for event, _ in events:
+            depth += {EVENT_OPEN: 1, EVENT_CLOSE: -1}.get(event, 0)
+            max_depth = max(max_depth, depth)
+        assert depth == 0
+        # the special folders are one level above the generated folders.
+        assert max_depth <= options.max_depth + 1
+
+    def test_events_reproducible(self):
+        options = GeneratorOptions(size=200, icon_size=16, max_tags=3)
+        urls = _urls(options)
+        assert urls == _urls(options)
+        assert urls != _urls(GeneratorOptions(size=200, icon_size=16, max_tags=3, seed=1))
+
+    def test_events_options(self):
+        options = GeneratorOptions(
+            size=500,
+            folder_ratio=0,
+            icon_size=30,
+            icon_ratio=1,
+            max_tags=2,
+            unicode_ratio=1,
+            duplicate_ratio=0.5,
+        )
+        urls = _urls(options)
+        assert len(urls) == options.size
+        assert all(url.icon.startswith("data:image/png;base64,") for url in urls)
+        # base64 encodes 3 bytes as 4 characters.
+        assert all(len(url.icon) == len("data:image/png;base64,") + 40 for url in urls)
+        assert all(len(url.tags) <= options.max_tags for url in urls)
+        assert all(url.title.split(" ")[0] in UNICODE_WORDS for url in urls)
+        assert 100 < len(urls) - len({url.url for url in urls}) < 400
+
+    def test_events_defaults(self):
+        urls = _urls(GeneratorOptions(size=500, duplicate_ratio=0))
+        assert all(url.icon == "" and url.tags == [] for url in urls)
+        assert len({url.url for url in urls}) == len(urls)
+
+
+generate_params = [
+    pytest.param(converter, format_, id=f"{name}/{format_}")
+    for name, converter in CONVERTERS.items()
+    for format_ in converter.formats
+]
+
+
+@pytest.mark.parametrize("converter, format_", generate_params)
+def test_generate(converter, format_: Format):
+    options = GeneratorOptions(size=300, icon_size=8, max_tags=2)
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath(f"bookmarks.{format_}")
+        generate(converter(), format_, filepath, options)
+        content = filepath.read_bytes()
+
+        generate(converter(), format_, filepath, options)
+        assert filepath.read_bytes() == content
+
+        tree = FORMATS[format_].load(converter(), filepath)
+        urls = tree_urls(tree)
+        assert 0 < len(urls) <= options.size
+        assert len(tree_nodes(tree)) > options.size
+
+
+def test_generate_bookmarkie_tags():
+    options = GeneratorOptions(size=100, folder_ratio=0, max_tags=3, icon_size=8, icon_ratio=1)
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.db")
+        generate(Bookmarkie(), Format.DB, filepath, options)
+        tree = Bookmarkie().from_db(filepath)
+
+    urls = tree_urls(tree)
+    assert len(urls) == options.size
+    assert all(url.icon.startswith("data:image/png;base64,") for url in urls)
+    assert any(url.tags for url in urls)
+    assert all(len(url.tags) <= options.max_tags for url in urls)
+
+
+def test_generate_tree():
+    options = GeneratorOptions(size=300, icon_size=8, max_tags=2)
+    tree = generate_tree(options)
+
+    special_folders = [child.special_folder for child in tree.children]
+    assert special_folders == list(JSON_SPECIAL_FOLDERS[Bookmarkie])
+    # the root and the special folders aren't part of the generated bookmarks.
+    assert len(tree_nodes(tree)) == options.size + 1 + len(special_folders)
+    assert tree == generate_tree(options)
+
+
+def test_generate_unsupported_format():
+    with pytest.raises(ValueError, match="The converter 'Chrome' doesn't support the format 'db'"):
+        generate(Chrome(), Format.DB, Path("bookmarks.db"), GeneratorOptions())
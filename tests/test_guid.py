@@ -0,0 +1,129 @@
+import os
+import threading
+from uuid import UUID
+
+import pytest
+
+from bookmarks_converter.guid import MOZILLA_GUID_LENGTH, GuidGenerator, deterministic_guids, guids
+
+
+class TestGuidGenerator:
+    def test_uuid(self):
+        generator = GuidGenerator()
+        result = generator.uuid()
+        uuid = UUID(result)
+        assert str(uuid) == result
+        assert uuid.version == 4
+        assert uuid.variant == "specified in RFC 4122"
+
+    def test_uuid_unique(self):
+        # use a small buffer to make sure the buffer is refilled multiple times.
+        generator = GuidGenerator(buffer_size=64)
+        result = {generator.uuid() for _ in range(1000)}
+        assert len(result) == 1000
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="forks the process")
+    def test_uuid_fork(self):
+        generator = GuidGenerator()
+        # fill the buffer before forking.
+        generator.uuid()
+        children = []
+        for _ in range(2):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                os.write(write_fd, generator.uuid().encode("ascii"))
+                os._exit(0)
+            os.close(write_fd)
+            with os.fdopen(read_fd, "rb") as pipe:
+                children.append(pipe.read().decode("ascii"))
+            os.waitpid(pid, 0)
+
+        # the children don't continue the buffer of the parent, or generate the same guids.
+        result = {generator.uuid(), *children}
+        assert len(result) == 3
+
+    def test_mozilla_guid(self):
+        generator = GuidGenerator()
+        result = generator.mozilla_guid()
+        assert len(result) == MOZILLA_GUID_LENGTH
+        assert set(result) <= set(
+            "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_"
+        )
+
+    def test_mozilla_guid_unique(self):
+        generator = GuidGenerator(buffer_size=64)
+        result = {generator.mozilla_guid() for _ in range(1000)}
+        assert len(result) == 1000
+
+    test_ensure_uuid_valid_params = (
+        pytest.param("c4d6c7cd-5228-4d45-9317-7913b134ba38", id="uuid4"),
+        pytest.param("C4D6C7CD-5228-4D45-9317-7913B134BA38", id="uuid4-uppercase"),
+        pytest.param("c4d6c7cd52284d4593177913b134ba38", id="uuid4-without-hyphens"),
+        pytest.param("{c4d6c7cd-5228-4d45-9317-7913b134ba38}", id="uuid4-braces"),
+    )
+
+    @pytest.mark.parametrize("guid", test_ensure_uuid_valid_params)
+    def test_ensure_uuid_valid(self, guid: str):
+        result = GuidGenerator().ensure_uuid(guid)
+        assert result == guid
+
+    test_ensure_uuid_invalid_params = (
+        pytest.param(None, id="none"),
+        pytest.param("", id="empty"),
+        pytest.param("some-random-non-uuid-guid", id="non-uuid"),
+        pytest.param("0pdiR3ZFnRvz", id="mozilla-guid"),
+    )
+
+    @pytest.mark.parametrize("guid", test_ensure_uuid_invalid_params)
+    def test_ensure_uuid_invalid(self, guid: str):
+        result = GuidGenerator().ensure_uuid(guid)
+        assert result != guid
+        assert UUID(result).version == 4
+
+    def test_ensure_mozilla_guid_valid(self):
+        guid = "0pdiR3ZFnRvz"
+        result = GuidGenerator().ensure_mozilla_guid(guid)
+        assert result == guid
+
+    @pytest.mark.parametrize("guid", ("", None, "c4d6c7cd-5228-4d45-9317-7913b134ba38"))
+    def test_ensure_mozilla_guid_invalid(self, guid: str):
+        result = GuidGenerator().ensure_mozilla_guid(guid)
+        assert result != guid
+        assert len(result) == MOZILLA_GUID_LENGTH
+
+    def test_uuid_deterministic(self):
+        generator = GuidGenerator(deterministic=True)
+        result = generator.uuid(2, "https://www.example.com/", 1719774198)
+        assert result == generator.uuid(2, "https://www.example.com/", 1719774198)
+        assert result != generator.uuid(3, "https://www.example.com/", 1719774198)
+        assert UUID(result).version == 5
+
+    def test_mozilla_guid_deterministic(self):
+        generator = GuidGenerator(deterministic=True)
+        result = generator.mozilla_guid(2, "https://www.example.com/", 1719774198)
+        assert len(result) == MOZILLA_GUID_LENGTH
+        assert result == generator.mozilla_guid(2, "https://www.example.com/", 1719774198)
+        assert result != generator.mozilla_guid(3, "https://www.example.com/", 1719774198)
+
+    def test_ensure_mozilla_guid_deterministic(self):
+        generator = GuidGenerator(deterministic=True)
+        guid = "c4d6c7cd-5228-4d45-9317-7913b134ba38"
+        assert generator.ensure_mozilla_guid(guid) == generator.ensure_mozilla_guid(guid)
+
+    def test_deterministic_guids(self):
+        assert not guids.deterministic
+        with deterministic_guids() as generator:
+            assert generator is guids
+            assert guids.deterministic
+        assert not guids.deterministic
+
+    def test_deterministic_guids_thread(self):
+        results = []
+        with deterministic_guids():
+            thread = threading.Thread(target=lambda: results.append(guids.deterministic))
+            thread.start()
+            thread.join()
+        # the mode is local to the thread running the conversion.
+        assert results == [False]
@@ -0,0 +1,157 @@
+import dataclasses
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import tree_nodes, tree_urls
+from resources.bookmarks_bookmarkie import bookmarks_json
+from sqlalchemy import create_engine, text
+
+from bookmarks_converter.generator import GeneratorOptions, generate_tree
+from bookmarks_converter.history import CHANGE_ADDED, CHANGE_MODIFIED, CHANGE_REMOVED, HistoryStore
+from bookmarks_converter.models import Folder, Url
+
+
+def _url(tree: Folder) -> Url:
+    return tree_urls(tree)[0]
+
+
+def _path(tree: Folder, target: Url) -> list:
+    """The folders from the root of the tree to the target, and the target."""
+    stack = [[tree]]
+    while stack:
+        path = stack.pop()
+        if path[-1] is target:
+            return path
+        if isinstance(path[-1], Folder):
+            stack.extend(path + [child] for child in path[-1].children)
+
+
+def _count(filepath: Path, table: str) -> int:
+    engine = create_engine(f"sqlite:///{filepath}")
+    with engine.connect() as connection:
+        count = connection.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    engine.dispose()
+    return count
+
+
+@pytest.fixture
+def history():
+    with TemporaryDirectory() as tmpdir:
+        with HistoryStore(Path(tmpdir).joinpath("history.db")) as store:
+            yield store
+
+
+class TestHistoryStore:
+    def test_materialize(self, history):
+        trees = [bookmarks_json() for _ in range(3)]
+        trees[1].children[0].title = "Menu"
+        _url(trees[2]).tags = ["cars", "german"]
+
+        numbers = [history.add(tree) for tree in trees]
+
+        assert numbers == [1, 2, 3]
+        for number, tree in zip(numbers, trees):
+            assert history.materialize(number) == tree
+
+    def test_shared_nodes(self, history):
+        tree = bookmarks_json()
+        size = len(tree_nodes(tree))
+
+        history.add(tree, created=1)
+        history.add(bookmarks_json(), created=2)
+        changed = bookmarks_json()
+        url = _url(changed)
+        url.title = "changed"
+        history.add(changed, created=3)
+
+        snapshots = history.snapshots()
+        assert [(s.id, s.created, s.size) for s in snapshots] == [
+            (1, 1, size),
+            (2, 2, size),
+            (3, 3, size),
+        ]
+        # only the url and the folders above it are added.
+        path = len(_path(changed, url))
+        assert [s.new_nodes for s in snapshots] == [size, 0, path]
+        assert _count(history.filepath, "snapshot_node") == size + path
+        icons = {url.icon for url in tree_urls(tree) if url.icon}
+        assert _count(history.filepath, "icon") == len(icons)
+
+    test_diff_params = (
+        pytest.param("title", CHANGE_MODIFIED, id="modified"),
+        pytest.param("add", CHANGE_ADDED, id="added"),
+        pytest.param("remove", CHANGE_REMOVED, id="removed"),
+        pytest.param("move", CHANGE_MODIFIED, id="moved"),
+    )
+
+    @pytest.mark.parametrize("change, status", test_diff_params)
+    def test_diff(self, history, change, status):
+        old = bookmarks_json()
+        new = bookmarks_json()
+        url = _url(new)
+        folders = [node for node in tree_nodes(new) if isinstance(node, Folder)]
+        parent = next(folder for folder in folders if url in folder.children)
+        if change == "title":
+            url.title = "changed"
+        elif change == "add":
+            url = dataclasses.replace(url, guid="added", index=len(parent.children))
+            parent.children.append(url)
+        elif change == "remove":
+            parent.children.remove(url)
+            for index, child in enumerate(parent.children):
+                child.index = index
+        else:
+            parent.children.remove(url)
+            for index, child in enumerate(parent.children):
+                child.index = index
+            parent = new.children[-1]
+            url.index = len(parent.children)
+            parent.children.append(url)
+        old_number = history.add(old)
+        new_number = history.add(new)
+
+        changes = [c for c in history.diff(old_number, new_number) if c.guid == url.guid]
+        assert [c.status for c in changes] == [status]
+        (result,) = changes
+        if status != CHANGE_REMOVED:
+            assert result.new == url
+            assert result.new_parent == parent.guid
+        if status != CHANGE_ADDED:
+            assert result.old.guid == url.guid
+        # the siblings whose index changed are modified, nothing else is.
+        for other in history.diff(old_number, new_number):
+            if other.guid != url.guid:
+                assert other.status == CHANGE_MODIFIED
+                assert other.old.index != other.new.index
+
+    def test_diff_unchanged(self, history):
+        first = history.add(bookmarks_json())
+        second = history.add(bookmarks_json())
+
+        assert history.diff(first, second) == []
+        assert history.diff(first, first) == []
+
+    def test_missing_snapshot(self, history):
+        history.add(bookmarks_json())
+
+        for function in (history.materialize, lambda number: history.diff(1, number)):
+            with pytest.raises(ValueError) as err_info:
+                function(2)
+            assert err_info.value.args[0] == "The snapshot 2 doesn't exist."
+
+    def test_generated_tree(self, history):
+        tree = generate_tree(GeneratorOptions(size=2000, max_tags=2))
+        history.add(tree)
+        url = _url(tree)
+        url.url = "https://www.example.com/changed"
+        history.add(tree)
+
+        assert history.materialize(2) == tree
+        assert history.snapshots()[1].new_nodes < 10
+        (change,) = history.diff(1, 2)
+        assert (change.status, change.guid, change.new.url) == (
+            CHANGE_MODIFIED,
+            url.guid,
+            "https://www.example.com/changed",
+        )
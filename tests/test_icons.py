@@ -0,0 +1,89 @@
+import base64
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import tree_urls
+from resources.bookmarks_bookmarkie import bookmarks_json
+from sqlalchemy import create_engine, text
+
+from bookmarks_converter import Bookmarkie
+from bookmarks_converter.formats import DBFormat, Format, save_db
+from bookmarks_converter.icons import ICON_KEY_PREFIX, data_uri, split_data_uri
+from bookmarks_converter.models import SpecialFolder
+
+ICON_DATA = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+ICON = f"data:image/png;base64,{base64.b64encode(ICON_DATA).decode('ascii')}"
+
+
+def _query(filepath: Path, query: str) -> list:
+    engine = create_engine(f"sqlite:///{filepath}")
+    with engine.connect() as connection:
+        rows = connection.execute(text(query)).all()
+    engine.dispose()
+    return rows
+
+
+test_split_data_uri_params = (
+    pytest.param(ICON, ("image/png", ICON_DATA), id="base64"),
+    pytest.param("data:image/svg+xml;base64,PHN2Zz4=", ("image/svg+xml", b"<svg>"), id="svg"),
+    pytest.param("", None, id="empty"),
+    pytest.param("https://www.example.com/favicon.ico", None, id="url"),
+    pytest.param("data:image/svg+xml,%3Csvg%3E", None, id="not_base64"),
+    pytest.param("data:image/png;base64,not base64!", None, id="invalid_base64"),
+    pytest.param("data:image/png;base64,PHN2Zz4", None, id="missing_padding"),
+)
+
+
+@pytest.mark.parametrize("icon, expected", test_split_data_uri_params)
+def test_split_data_uri(icon, expected):
+    assert split_data_uri(icon) == expected
+
+
+def test_data_uri():
+    assert data_uri(*split_data_uri(ICON)) == ICON
+
+
+class TestIconTable:
+    bookmarkie = Bookmarkie()
+
+    def test_save_db_icon_table(self):
+        tree = bookmarks_json()
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("bookmarks.db")
+            save_db(self.bookmarkie.as_db(tree), filepath, icon_table=True)
+
+            icons = {url.icon for url in tree_urls(tree) if url.icon}
+            assert len(_query(filepath, "SELECT key FROM icon")) == len(icons)
+            rows = _query(filepath, "SELECT icon FROM bookmark WHERE icon != ''")
+            assert all(icon.startswith(ICON_KEY_PREFIX) for (icon,) in rows)
+
+            assert self.bookmarkie.from_db(filepath) == tree
+            menu = self.bookmarkie.from_db_subtree(filepath, special_folder=SpecialFolder.MENU)
+            assert menu == tree.children[0]
+            lazy = self.bookmarkie.from_db(filepath, lazy=True)
+            assert lazy == tree
+
+    def test_icons_stored_once(self):
+        tree = bookmarks_json()
+        for url in tree_urls(tree):
+            url.icon = ICON
+        with TemporaryDirectory() as tmpdir:
+            inline_path = Path(tmpdir).joinpath("inline.db")
+            table_path = Path(tmpdir).joinpath("table.db")
+            DBFormat(Format.DB).save(self.bookmarkie, tree, inline_path)
+            DBFormat(Format.DB, icon_table=True).save(self.bookmarkie, tree, table_path)
+
+            ((data,),) = _query(table_path, "SELECT data FROM icon")
+            assert data == ICON_DATA
+            assert table_path.stat().st_size < inline_path.stat().st_size
+            assert DBFormat(Format.DB).load(self.bookmarkie, table_path) == tree
+
+    def test_save_db_without_icon_table(self):
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("bookmarks.db")
+            save_db(self.bookmarkie.as_db(bookmarks_json()), filepath)
+
+            tables = _query(filepath, "SELECT name FROM sqlite_master WHERE type = 'table'")
+            assert ("icon",) not in tables
+            assert self.bookmarkie.from_db(filepath) == bookmarks_json()
@@ -0,0 +1,230 @@
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from resources.bookmarks_bookmarkie import bookmarks_json
+
+from bookmarks_converter.converters import CONVERTERS
+from bookmarks_converter.formats import FORMATS, Format
+from bookmarks_converter.generator import GeneratorOptions, generate
+from bookmarks_converter.instrumentation import (
+    COUNTER_BYTES_IN,
+    COUNTER_BYTES_OUT,
+    COUNTER_NODES,
+    STAGE_BUILD,
+    STAGE_FORMAT,
+    STAGE_IMPORT,
+    STAGE_PARSE,
+    STAGE_READ,
+    STAGE_SERIALIZE,
+    STAGE_WRITE,
+    MemoryRecorder,
+    StageObserver,
+    TimingRecorder,
+    observe,
+    stage,
+)
+
+MEMORY_BUDGET_SIZE = 2000
+# highest traced memory allowed for each stage, in bytes per bookmark. The budgets leave some
+# headroom above the measured values, so they only fail on actual regressions.
+MEMORY_BUDGETS = {
+    Format.DB: {STAGE_PARSE: 3500, STAGE_BUILD: 3500, STAGE_SERIALIZE: 3000, STAGE_WRITE: 3700},
+    Format.HTML: {
+        STAGE_READ: 1400,
+        STAGE_FORMAT: 1200,
+        STAGE_PARSE: 1800,
+        STAGE_BUILD: 750,
+        STAGE_SERIALIZE: 2600,
+        STAGE_WRITE: 900,
+    },
+    Format.JSON: {
+        STAGE_READ: 2400,
+        STAGE_PARSE: 1000,
+        STAGE_BUILD: 400,
+        STAGE_SERIALIZE: 750,
+        STAGE_WRITE: 100,
+    },
+    Format.PLACES: {STAGE_PARSE: 900, STAGE_BUILD: 550, STAGE_SERIALIZE: 1500, STAGE_WRITE: 900},
+}
+
+
+class _Recorder(StageObserver):
+    def __init__(self):
+        self.events = []
+
+    def stage_started(self, name: str):
+        self.events.append(("started", name))
+
+    def stage_finished(self, name: str):
+        self.events.append(("finished", name))
+
+
+def test_stage_without_observers():
+    with stage(STAGE_PARSE):
+        result = 1
+    assert result == 1
+
+
+def test_observe():
+    first, second = _Recorder(), _Recorder()
+    with observe(first, second):
+        with stage(STAGE_READ):
+            pass
+        with pytest.raises(ValueError):
+            with stage(STAGE_PARSE):
+                raise ValueError
+    with stage(STAGE_BUILD):
+        pass
+
+    expected = [
+        ("started", STAGE_READ),
+        ("finished", STAGE_READ),
+        ("started", STAGE_PARSE),
+        ("finished", STAGE_PARSE),
+    ]
+    assert first.events == expected
+    assert second.events == expected
+
+
+def test_memory_recorder():
+    size = 10 * 1024 * 1024
+    with MemoryRecorder() as recorder:
+        with stage(STAGE_SERIALIZE):
+            with stage(STAGE_BUILD):
+                data = bytearray(size)
+                del data
+            kept = bytearray(size)
+
+    build, serialize = recorder.stages
+    assert build.stage == STAGE_BUILD
+    assert build.peak >= size
+    assert build.retained < size / 10
+    # the peak of the nested stage is part of the peak of the outer stage.
+    assert serialize.stage == STAGE_SERIALIZE
+    assert serialize.peak >= size
+    assert serialize.retained >= size
+    assert len(kept) == size
+    assert recorder.report().splitlines()[1].startswith(STAGE_BUILD)
+
+
+def test_timing_recorder():
+    converter = CONVERTERS["firefox"]()
+    bookmarks_format = FORMATS[Format.HTML]
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("input.html")
+        output_path = Path(tmpdir).joinpath("output.html")
+        generate(converter, Format.HTML, filepath, GeneratorOptions(size=100, folder_ratio=0))
+        with TimingRecorder(include_import=True) as timings:
+            tree = bookmarks_format.load(converter, filepath)
+            bookmarks_format.save(converter, tree, output_path)
+        # nothing is recorded once the recorder is closed.
+        bookmarks_format.load(converter, filepath)
+
+        assert [stage_timing.stage for stage_timing in timings.stages] == [
+            STAGE_IMPORT,
+            STAGE_READ,
+            STAGE_FORMAT,
+            STAGE_PARSE,
+            STAGE_BUILD,
+            STAGE_SERIALIZE,
+            STAGE_WRITE,
+        ]
+        assert all(stage_timing.wall >= 0 for stage_timing in timings.stages)
+        # root, menu, toolbar and other folders.
+        assert timings.counters == {
+            COUNTER_BYTES_IN: filepath.stat().st_size,
+            COUNTER_NODES: 104,
+            COUNTER_BYTES_OUT: output_path.stat().st_size,
+        }
+    assert timings.as_dict()["counters"][COUNTER_NODES] == 104
+    assert timings.report().splitlines()[-2] == "nodes: 104"
+
+
+def test_timing_recorder_skipped_write():
+    converter = CONVERTERS["chrome"]()
+    bookmarks_format = FORMATS[Format.JSON]
+    tree = bookmarks_json()
+    with TemporaryDirectory() as tmpdir:
+        output_path = Path(tmpdir).joinpath("output.json")
+        bookmarks_format.save(converter, tree, output_path)
+        with TimingRecorder() as timings:
+            written = bookmarks_format.save(converter, tree, output_path, skip_unchanged=True)
+
+    # the file written by a normal save has the content of the skipped one.
+    assert not written
+    assert COUNTER_BYTES_OUT not in timings.counters
+
+
+def test_timing_recorders_threads():
+    # each recorder only records the stages and counters of the conversion of its thread.
+    converter = CONVERTERS["firefox"]()
+    barrier = threading.Barrier(2)
+    recorders = {}
+
+    def _load(format_: Format, filepath: Path):
+        with TimingRecorder() as timings:
+            barrier.wait()
+            FORMATS[format_].load(converter, filepath)
+            barrier.wait()
+        recorders[format_] = timings
+
+    with TemporaryDirectory() as tmpdir:
+        paths = {}
+        for format_, size in ((Format.HTML, 100), (Format.JSON, 200)):
+            paths[format_] = Path(tmpdir).joinpath(f"input.{format_}")
+            generate(
+                converter, format_, paths[format_], GeneratorOptions(size=size, folder_ratio=0)
+            )
+        threads = [threading.Thread(target=_load, args=item) for item in paths.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        html, json_ = recorders[Format.HTML], recorders[Format.JSON]
+        assert [timing.stage for timing in html.stages] == [
+            STAGE_READ,
+            STAGE_FORMAT,
+            STAGE_PARSE,
+            STAGE_BUILD,
+        ]
+        assert [timing.stage for timing in json_.stages] == [STAGE_READ, STAGE_PARSE, STAGE_BUILD]
+        assert html.counters == {
+            COUNTER_BYTES_IN: paths[Format.HTML].stat().st_size,
+            COUNTER_NODES: 104,
+        }
+        # the firefox json files also have the mobile folder.
+        assert json_.counters == {
+            COUNTER_BYTES_IN: paths[Format.JSON].stat().st_size,
+            COUNTER_NODES: 205,
+        }
+
+
+memory_budget_params = [
+    pytest.param(converter, format_, id=f"{name}/{format_}")
+    for name, converter in CONVERTERS.items()
+    for format_ in converter.formats
+]
+
+
+@pytest.mark.parametrize("converter, format_", memory_budget_params)
+def test_memory_budgets(converter, format_: Format):
+    converter = converter()
+    bookmarks_format = FORMATS[format_]
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath(f"input.{format_}")
+        generate(converter, format_, filepath, GeneratorOptions(size=MEMORY_BUDGET_SIZE))
+        with MemoryRecorder() as recorder:
+            tree = bookmarks_format.load(converter, filepath)
+            bookmarks_format.save(converter, tree, Path(tmpdir).joinpath(f"output.{format_}"))
+
+    budgets = MEMORY_BUDGETS[format_]
+    stages = {stage_memory.stage: stage_memory for stage_memory in recorder.stages}
+    assert set(stages) <= set(budgets)
+    for name, stage_memory in stages.items():
+        budget = budgets[name] * MEMORY_BUDGET_SIZE
+        assert (
+            stage_memory.peak <= budget
+        ), f"the {name} stage used {stage_memory.peak} bytes, over its budget of {budget} bytes"
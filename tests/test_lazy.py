@@ -0,0 +1,90 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import TEST_FILE_BOOKMARKIE_DB
+from resources.bookmarks_bookmarkie import bookmarks_json
+
+from bookmarks_converter import Bookmarkie, Chrome
+from bookmarks_converter.formats import FORMATS, Format, save_many
+from bookmarks_converter.lazy import FolderLoader, LazyFolder
+from bookmarks_converter.models import Url
+
+
+class TestLazyFolder:
+    bookmarkie = Bookmarkie()
+
+    def test_from_db_lazy(self):
+        result = self.bookmarkie.from_db(TEST_FILE_BOOKMARKIE_DB, lazy=True)
+        assert isinstance(result, LazyFolder)
+        # nothing but the root is loaded until the children are accessed.
+        assert result.loader.stats.misses == 0
+
+        assert result == bookmarks_json()
+        assert bookmarks_json() == result
+
+    def test_children_loaded_on_access(self):
+        result = self.bookmarkie.from_db(TEST_FILE_BOOKMARKIE_DB, lazy=True)
+        loader = result.loader
+        menu = result.children[0]
+        cars = menu.children[0]
+
+        assert isinstance(cars, LazyFolder)
+        assert [child.title for child in cars.children] == [
+            child.title for child in bookmarks_json().children[0].children[0].children
+        ]
+        assert all(isinstance(child, Url) for child in cars.children)
+        assert loader.stats.misses == 3
+        assert loader.stats.hits == 1
+
+    def test_lru_eviction(self):
+        result = self.bookmarkie.from_db(TEST_FILE_BOOKMARKIE_DB, lazy=True, max_folders=2)
+        loader = result.loader
+        root_children = result.children
+        menu, toolbar, *_ = root_children
+        menu_children = menu.children
+        # evicts the children of the root, the least recently used folder.
+        toolbar.children
+        assert menu.children is menu_children
+        assert loader.stats.evictions == 1
+
+        # the children of the root are loaded again, as new objects.
+        assert result.children is not root_children
+        assert result.children[0] is not menu
+        assert result.children[0].guid == menu.guid
+        assert loader.stats.evictions == 2
+        assert loader.stats.misses == 4
+
+    def test_assigned_children(self):
+        result = self.bookmarkie.from_db(TEST_FILE_BOOKMARKIE_DB, lazy=True, max_folders=1)
+        loader = result.loader
+        result.children = result.children[:1]
+        result.children[0].children
+        assert len(result.children) == 1
+        assert loader.stats.misses == 2
+
+    def test_max_folders_error(self):
+        with pytest.raises(ValueError) as err_info:
+            FolderLoader(TEST_FILE_BOOKMARKIE_DB, lambda row, loader: row, max_folders=0)
+
+        assert str(err_info.value) == "max_folders must be at least 1."
+
+    def test_export(self):
+        result = self.bookmarkie.from_db(TEST_FILE_BOOKMARKIE_DB, lazy=True, max_folders=1)
+        with TemporaryDirectory() as tmpdir:
+            html_path = Path(tmpdir).joinpath("bookmarks.html")
+            json_path = Path(tmpdir).joinpath("bookmarks.json")
+            # the loader is shared by the threads of the concurrent writers.
+            save_many(
+                result,
+                [
+                    (self.bookmarkie, FORMATS[Format.HTML], html_path),
+                    (Chrome(), FORMATS[Format.JSON], json_path),
+                ],
+            )
+
+            with html_path.open("r", encoding="utf-8") as file:
+                assert file.read() == self.bookmarkie.as_html(bookmarks_json())
+            with json_path.open("r", encoding="utf-8") as file:
+                assert json.load(file) == Chrome().as_json(bookmarks_json())
@@ -199,3 +199,15 @@ class TestHTMLBookmark:
         assert folder.type == TYPE_FOLDER
         url = HTMLBookmark(name="a", attrs=url_attrs)
         assert url.type == TYPE_URL
+
+    def test_guid_generated_once(self, url_attrs):
+        url = HTMLBookmark(name="a", attrs=url_attrs)
+        assert "guid" not in url.attrs
+        guid = url.guid
+        assert url.guid == guid
+        assert url.attrs["guid"] == guid
+
+    def test_guid_attribute_replaced(self, url_attrs):
+        url = HTMLBookmark(name="a", attrs={**url_attrs, "guid": "guid-of-another-tool"})
+        assert url.guid != "guid-of-another-tool"
+        assert url.guid == url.attrs["guid"]
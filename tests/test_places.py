@@ -0,0 +1,252 @@
+import dataclasses
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import DATA_DIR, TEST_FILE_FIREFOX_JSON, tree_nodes
+from resources.bookmarks_firefox import bookmarks_json
+from sqlalchemy import create_engine, text
+
+from bookmarks_converter import Chrome, Firefox
+from bookmarks_converter.formats import FORMATS, Format, save_places
+from bookmarks_converter.guid import MOZILLA_GUID_LENGTH, deterministic_guids
+from bookmarks_converter.models import Folder, SpecialFolder, Url
+from bookmarks_converter.places import (
+    PLACES_ROOTS,
+    PLACES_SCHEMA_VERSION,
+    PLACES_TAGS_FOLDER_ID,
+    PLACES_TYPE_BOOKMARK,
+    _hash_string,
+    url_hash,
+)
+
+TAGS = {
+    "https://www.audi.com/en.html": ["cars, german", "audi"],
+    "https://www.bmw.com/en/index.html": ["cars, german"],
+}
+
+
+def _without_ids(tree: Folder) -> list:
+    """The bookmarks of the tree in pre-order, without the ids which places.sqlite renumbers."""
+    return [
+        {key: value for key, value in vars(node).items() if key not in ("id", "children")}
+        for node in tree_nodes(tree)
+    ]
+
+
+def _tagged_tree() -> Folder:
+    tree = bookmarks_json()
+    for node in tree_nodes(tree):
+        if not isinstance(node, Folder):
+            # the icons are stored in favicons.sqlite.
+            node.icon_uri = ""
+            node.tags = list(TAGS.get(node.url, []))
+    return tree
+
+
+def _query(filepath: Path, query: str) -> list:
+    engine = create_engine(f"sqlite:///{filepath}")
+    with engine.connect() as connection:
+        rows = connection.execute(text(query)).all()
+    engine.dispose()
+    return rows
+
+
+def _schema(filepath: Path) -> dict:
+    """The version, and the columns, foreign keys and indexes of the tables of a database."""
+    with closing(sqlite3.connect(filepath)) as connection:
+        schema = {"user_version": connection.execute("PRAGMA user_version").fetchone()[0]}
+        tables = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+        for (table,) in tables.fetchall():
+            # the types are left out, sqlalchemy names them differently with the same affinity,
+            # and declares its primary keys NOT NULL.
+            columns = [
+                (name, notnull or pk, default, pk)
+                for _, name, _, notnull, default, pk in connection.execute(
+                    f"PRAGMA table_info({table})"
+                )
+            ]
+            foreign_keys = {
+                (row[2], row[3], row[4], row[6])
+                for row in connection.execute(f"PRAGMA foreign_key_list({table})")
+            }
+            indexes = {
+                (
+                    name,
+                    unique,
+                    tuple(row[2] for row in connection.execute(f"PRAGMA index_info({name})")),
+                )
+                for _, name, unique, *_ in connection.execute(
+                    f"PRAGMA index_list({table})"
+                ).fetchall()
+            }
+            schema[table] = (columns, foreign_keys, indexes)
+    return schema
+
+
+@pytest.fixture(scope="module")
+def places_db():
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("places.sqlite")
+        save_places(Firefox().as_places(_tagged_tree()), filepath)
+        yield filepath
+
+
+test_url_hash_params = (
+    pytest.param("https://www.mozilla.org/", b"https", id="https"),
+    pytest.param("place:parent=menu________", b"place", id="place"),
+    pytest.param(":no-scheme", b"", id="empty_scheme"),
+)
+
+
+@pytest.mark.parametrize("url, prefix", test_url_hash_params)
+def test_url_hash(url: str, prefix: bytes):
+    result = url_hash(url)
+
+    assert result >> 32 == _hash_string(prefix) & 0xFFFF
+    assert result & 0xFFFFFFFF == _hash_string(url.encode("utf-8"))
+
+
+def test_url_hash_without_scheme():
+    assert url_hash("about_blank") == _hash_string(b"about_blank")
+    assert _hash_string(b"") == 0
+    assert _hash_string(b"a") == (0x9E3779B9 * ord("a")) & 0xFFFFFFFF
+
+
+class TestPlacesWriter:
+    firefox = Firefox()
+
+    def test_schema(self, places_db):
+        # the tables and the version of the schema of a firefox profile.
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("profile.sqlite")
+            with closing(sqlite3.connect(filepath)) as connection:
+                connection.executescript(DATA_DIR.joinpath("places_schema.sql").read_text())
+            expected = _schema(filepath)
+
+        assert expected["user_version"] == PLACES_SCHEMA_VERSION
+        assert _schema(places_db) == expected
+
+    def test_duplicate_guids(self):
+        # the urls (and their tag bookmarks) share a guid.
+        urls = [
+            Url(index + 2, "abcdefghijkl", index, f"url {index}", 0, 0, f"https://{index}.com/")
+            for index in range(2)
+        ]
+        for url in urls:
+            url.tags = ["tag"]
+        folder = Folder(1, "", 0, "folder", 0, 0, children=urls)
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("places.sqlite")
+            save_places(self.firefox.as_places(folder), filepath)
+            rows = _query(filepath, "SELECT title, guid FROM moz_bookmarks WHERE fk IS NOT NULL")
+
+        guids = [row.guid for row in rows]
+        assert len(set(guids)) == len(guids) == 4
+        # the first bookmark keeps its guid.
+        assert ("url 0", "abcdefghijkl") in [tuple(row) for row in rows]
+        assert all(len(guid) == MOZILLA_GUID_LENGTH for guid in guids)
+
+    def test_round_trip(self, places_db):
+        result = self.firefox.from_places(places_db)
+
+        assert _without_ids(result) == _without_ids(_tagged_tree())
+
+    def test_roots(self, places_db):
+        rows = _query(places_db, "SELECT id, guid, title, parent, position FROM moz_bookmarks")
+        rows = {row.id: tuple(row[1:]) for row in rows}
+
+        for id_, guid, title, parent, position in PLACES_ROOTS.values():
+            assert rows[id_] == (guid, title, parent, position)
+
+    def test_positions(self, places_db):
+        rows = _query(
+            places_db,
+            "SELECT parent, count(*), min(position), max(position) FROM moz_bookmarks"
+            " GROUP BY parent",
+        )
+
+        for _, size, first, last in rows:
+            assert (first, last) == (0, size - 1)
+
+    def test_places(self, places_db):
+        places = _query(places_db, "SELECT id, url, guid, url_hash, foreign_count FROM moz_places")
+        bookmarks = _query(places_db, "SELECT fk, guid FROM moz_bookmarks")
+        references = [row.fk for row in bookmarks if row.fk is not None]
+
+        assert len({place.url for place in places}) == len(places)
+        for place in places:
+            assert len(place.guid) == MOZILLA_GUID_LENGTH
+            assert place.url_hash == url_hash(place.url)
+            assert place.foreign_count == references.count(place.id)
+        audi = next(place for place in places if place.url == "https://www.audi.com/en.html")
+        # the bookmark and its two tags.
+        assert audi.foreign_count == 3
+        assert all(len(row.guid) == MOZILLA_GUID_LENGTH for row in bookmarks)
+        assert len({row.guid for row in bookmarks}) == len(bookmarks)
+
+    def test_tags(self, places_db):
+        rows = _query(
+            places_db,
+            "SELECT tag.title, count(*) FROM moz_bookmarks AS tag"
+            " JOIN moz_bookmarks AS item ON item.parent = tag.id"
+            f" WHERE tag.parent = {PLACES_TAGS_FOLDER_ID} AND item.type = {PLACES_TYPE_BOOKMARK}"
+            " GROUP BY tag.id ORDER BY tag.title",
+        )
+
+        assert [tuple(row) for row in rows] == [("audi", 1), ("cars, german", 2)]
+
+    def test_origins(self, places_db):
+        rows = _query(
+            places_db,
+            "SELECT moz_origins.prefix, moz_origins.host, moz_places.rev_host FROM moz_places"
+            " JOIN moz_origins ON moz_origins.id = moz_places.origin_id"
+            " WHERE moz_places.url = 'https://www.audi.com/en.html'",
+        )
+
+        assert [tuple(row) for row in rows] == [("https://", "www.audi.com", "moc.idua.www.")]
+
+    def test_unfiled(self):
+        # the bookmarks outside of the special folders are added to the unfiled folder.
+        folder = bookmarks_json().children[0].children[0]
+        folder = dataclasses.replace(folder, index=0)
+        unfiled_id = PLACES_ROOTS[SpecialFolder.OTHER][0]
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("places.sqlite")
+            save_places(self.firefox.as_places(folder), filepath)
+            tree = self.firefox.from_places(filepath)
+            rows = _query(filepath, f"SELECT guid FROM moz_bookmarks WHERE parent = {unfiled_id}")
+
+        assert [row.guid for row in rows] == [folder.guid]
+        unfiled = next(
+            child for child in tree.children if child.special_folder == SpecialFolder.OTHER
+        )
+        assert _without_ids(unfiled.children[0]) == _without_ids(folder)
+
+    def test_chrome_tree(self):
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("places.sqlite")
+            json_path = Path(tmpdir).joinpath("chrome.json")
+            FORMATS[Format.JSON].save(Chrome(), _tagged_tree(), json_path)
+            tree = Chrome().from_json(json_path)
+
+            save_places(self.firefox.as_places(tree), filepath)
+            result = self.firefox.from_places(filepath)
+
+        urls = [node.url for node in tree_nodes(tree) if not isinstance(node, Folder)]
+        assert [node.url for node in tree_nodes(result) if not isinstance(node, Folder)] == urls
+        # every url has a valid firefox guid, chrome uses uuids.
+        assert all(len(node.guid) == MOZILLA_GUID_LENGTH for node in tree_nodes(result))
+
+    def test_save_places_skip_unchanged(self):
+        with TemporaryDirectory() as tmpdir, deterministic_guids():
+            filepath = Path(tmpdir).joinpath("places.sqlite")
+            places_format = FORMATS[Format.PLACES]
+            tree = self.firefox.from_json(TEST_FILE_FIREFOX_JSON)
+
+            assert places_format.save(self.firefox, tree, filepath, skip_unchanged=True)
+            assert not places_format.save(self.firefox, tree, filepath, skip_unchanged=True)
@@ -0,0 +1,84 @@
+import pstats
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from bookmarks_converter import Firefox
+from bookmarks_converter.formats import FORMATS, Format
+from bookmarks_converter.generator import GeneratorOptions, generate
+from bookmarks_converter.instrumentation import STAGE_PARSE, STAGE_SERIALIZE, stage
+from bookmarks_converter.profiling import StageProfiler, collapsed_stacks
+
+
+def _busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _outer():
+    _busy(0.02)
+    _inner()
+
+
+def _inner():
+    _busy(0.06)
+
+
+def _function_names(stats: pstats.Stats) -> set[str]:
+    return {name for _, _, name in stats.stats}
+
+
+def test_stage_profiler():
+    converter = Firefox()
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.html")
+        generate(converter, Format.HTML, filepath, GeneratorOptions(size=200))
+        with StageProfiler(stages=[STAGE_PARSE]) as profiler:
+            tree = FORMATS[Format.HTML].load(converter, filepath)
+            converter.as_html(tree)
+
+        names = _function_names(profiler.stats())
+        assert "feed" in names
+        assert "_restructure_root" not in names
+        assert "as_html" not in names
+
+        stats_path, collapsed_path = profiler.dump(Path(tmpdir).joinpath("profile.pstats"))
+        assert collapsed_path == Path(tmpdir).joinpath("profile.collapsed")
+        assert "feed" in _function_names(pstats.Stats(str(stats_path)))
+        lines = collapsed_path.read_text(encoding="utf-8").splitlines()
+        assert lines
+        for line in lines:
+            stack, microseconds = line.rsplit(" ", 1)
+            assert stack
+            assert int(microseconds) > 0
+
+
+def test_stage_profiler_without_profiled_stages():
+    with TemporaryDirectory() as tmpdir:
+        with StageProfiler(stages=[STAGE_PARSE]) as profiler:
+            with stage(STAGE_SERIALIZE):
+                _outer()
+
+        assert profiler.stats() is None
+        stats_path, collapsed_path = profiler.dump(Path(tmpdir).joinpath("profile.pstats"))
+        assert stats_path.is_file()
+        assert "_busy" not in collapsed_path.read_text(encoding="utf-8")
+
+
+def test_collapsed_stacks():
+    with StageProfiler() as profiler:
+        with stage(STAGE_SERIALIZE):
+            _outer()
+
+    busy = {}
+    for stack, seconds in collapsed_stacks(profiler.stats()):
+        # the time spent in _busy and in the functions it calls, by caller of _busy.
+        for i, frame in enumerate(stack[1:], 1):
+            if ":_busy:" in frame:
+                caller = stack[i - 1].split(":")[1]
+                busy[caller] = busy.get(caller, 0) + seconds
+    outer_busy, inner_busy = busy["_outer"], busy["_inner"]
+    # the time of _busy is split between its two callers.
+    assert 0.01 < outer_busy < inner_busy
+    assert 0.05 < inner_busy
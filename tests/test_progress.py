@@ -0,0 +1,202 @@
+import io
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from bookmarks_converter import Firefox
+from bookmarks_converter.formats import FORMATS, Format
+from bookmarks_converter.generator import GeneratorOptions, generate
+from bookmarks_converter.instrumentation import (
+    PROGRESS_REPORT_NODES,
+    STAGE_BUILD,
+    STAGE_FORMAT,
+    STAGE_PARSE,
+    STAGE_READ,
+    STAGE_SERIALIZE,
+    StageObserver,
+    TimingRecorder,
+    current_progress,
+    observe,
+    stage,
+)
+from bookmarks_converter.progress import (
+    ConversionCancelled,
+    Deadline,
+    ProgressBar,
+    ProgressEvent,
+    ProgressReporter,
+)
+
+
+def test_progress_without_observers():
+    with stage(STAGE_BUILD):
+        progress = current_progress()
+        progress.advance(PROGRESS_REPORT_NODES)
+    assert not hasattr(progress, "nodes")
+
+
+def test_progress_nested_stages():
+    events = []
+    with ProgressReporter(events.append, interval=0):
+        with stage(STAGE_SERIALIZE):
+            current_progress().advance(2)
+            with stage(STAGE_BUILD):
+                current_progress().advance(PROGRESS_REPORT_NODES)
+            current_progress().advance(3)
+
+    progress = [(event.stage, event.nodes) for event in events]
+    assert progress == [
+        (STAGE_SERIALIZE, 0),
+        (STAGE_BUILD, 0),
+        (STAGE_BUILD, PROGRESS_REPORT_NODES),
+        (STAGE_BUILD, PROGRESS_REPORT_NODES),
+        (STAGE_SERIALIZE, 5),
+    ]
+
+
+@pytest.mark.parametrize(
+    "format_",
+    [pytest.param(Format.HTML, id="html"), pytest.param(Format.JSON, id="json")],
+)
+def test_progress_reporter(format_):
+    converter = Firefox()
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath(f"bookmarks.{format_}")
+        generate(converter, format_, filepath, GeneratorOptions(size=3000))
+        size = filepath.stat().st_size
+        events = []
+        with ProgressReporter(events.append, interval=0):
+            tree = FORMATS[format_].load(converter, filepath)
+            FORMATS[Format.JSON].save(converter, tree, Path(tmpdir).joinpath("output.json"))
+
+    stages = [event.stage for event in events]
+    assert stages[0] == STAGE_READ
+    assert events[0].bytes_read == 0
+    assert events[-1].bytes_read == size
+    if format_ == Format.HTML:
+        # the lines formatted and the bookmarks parsed by BeautifulSoup are counted.
+        for name in (STAGE_FORMAT, STAGE_PARSE):
+            assert max(event.nodes for event in events if event.stage == name) >= 3000
+    build = [event.nodes for event in events if event.stage == STAGE_BUILD]
+    assert build == sorted(build)
+    assert build[-1] >= 3000
+    serialize = [event for event in events if event.stage == STAGE_SERIALIZE]
+    assert serialize[-1].nodes >= 3000
+    assert serialize[-1].total_nodes >= serialize[-1].nodes
+    elapsed = [event.elapsed for event in events]
+    assert elapsed == sorted(elapsed)
+
+
+def test_progress_reporter_interval():
+    events = []
+    with ProgressReporter(events.append, interval=3600):
+        with stage(STAGE_BUILD):
+            current_progress().advance(PROGRESS_REPORT_NODES * 10)
+    # only the start of the stage is reported.
+    assert [(event.stage, event.nodes) for event in events] == [(STAGE_BUILD, 0)]
+
+
+def test_progress_reporter_cancel():
+    def cancel(event: ProgressEvent):
+        if event.nodes:
+            raise ConversionCancelled("cancelled")
+
+    with TimingRecorder() as timings, ProgressReporter(cancel, interval=0):
+        with pytest.raises(ConversionCancelled):
+            with stage(STAGE_BUILD):
+                for _ in range(PROGRESS_REPORT_NODES * 2):
+                    current_progress().advance()
+                pytest.fail("the conversion was not cancelled")
+    assert [timing.stage for timing in timings.stages] == [STAGE_BUILD]
+
+
+def test_deadline():
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.html")
+        generate(Firefox(), Format.HTML, filepath, GeneratorOptions(size=100))
+
+        with Deadline(3600):
+            Firefox().from_html(filepath)
+
+        deadline = Deadline(3600)
+        deadline.expires = 0
+        with TimingRecorder() as timings, deadline:
+            with pytest.raises(ConversionCancelled, match="exceeded its 3600s deadline"):
+                Firefox().from_html(filepath)
+    # the observers notified before the deadline see the cancelled stage finish.
+    assert [timing.stage for timing in timings.stages] == [STAGE_READ]
+
+
+def test_deadline_concurrent_conversions():
+    # the deadline (and the progress reporter) of a conversion don't apply to the other ones.
+    barrier = threading.Barrier(2)
+    errors = []
+    events = []
+
+    def _convert_with_deadline(filepath: Path):
+        deadline = Deadline(3600)
+        deadline.expires = 0
+        with ProgressReporter(events.append, interval=0), deadline:
+            barrier.wait()
+            try:
+                Firefox().from_html(filepath)
+            except ConversionCancelled as error:
+                errors.append(error)
+            barrier.wait()
+
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.html")
+        generate(Firefox(), Format.HTML, filepath, GeneratorOptions(size=100))
+        thread = threading.Thread(target=_convert_with_deadline, args=(filepath,))
+        thread.start()
+        barrier.wait()
+        try:
+            tree = Firefox().from_html(filepath)
+        finally:
+            barrier.wait()
+            thread.join()
+
+    assert tree.children
+    assert len(errors) == 1
+    # only the first stage of the cancelled conversion is reported.
+    assert [event.stage for event in events] == [STAGE_READ]
+
+
+class _ExpireOn(StageObserver):
+    """Expire the deadline when the stage starts, after the deadline checked it."""
+
+    def __init__(self, deadline: Deadline, name: str):
+        self.deadline = deadline
+        self.name = name
+
+    def stage_started(self, name: str):
+        if name == self.name:
+            self.deadline.expires = 0
+
+
+@pytest.mark.parametrize("name", [STAGE_FORMAT, STAGE_PARSE])
+def test_deadline_html_stages(name):
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.html")
+        generate(Firefox(), Format.HTML, filepath, GeneratorOptions(size=3000))
+        deadline = Deadline(3600)
+
+        with TimingRecorder() as timings, deadline, observe(_ExpireOn(deadline, name)):
+            with pytest.raises(ConversionCancelled):
+                Firefox().from_html(filepath)
+    # the conversion is cancelled while the stage runs.
+    assert timings.stages[-1].stage == name
+
+
+def test_progress_bar():
+    stream = io.StringIO()
+    bar = ProgressBar(stream, width=10)
+    bar(ProgressEvent(STAGE_BUILD, 1500, 2048, 1.25))
+    bar(ProgressEvent(STAGE_SERIALIZE, 5, 2048, 1.5, total_nodes=10))
+    bar.finish()
+    assert stream.getvalue() == (
+        f"\r{'build':<10}[          ] 1500 nodes, 2 KiB read, 1.2s"
+        f"\r{'serialize':<10}[#####.....]  50% 5 nodes, 2 KiB read, 1.5s\n"
+    )
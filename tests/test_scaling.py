@@ -0,0 +1,107 @@
+"""Complexity regression tests: the import and export of each converter and format are run on
+geometrically growing generated bookmarks of different shapes, and fail if their runtime grows
+faster than about n log n."""
+
+import itertools
+from dataclasses import replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import MAX_SCALING_EXPONENT
+
+from bookmarks_converter import Bookmarkie, Chrome, Firefox
+from bookmarks_converter.formats import FORMATS, Format
+from bookmarks_converter.generator import GeneratorOptions, generate, generate_tree
+
+# the sizes are chosen per format to keep each test short: the db format loads and saves the
+# bookmarks one row at a time, and the string splicing of the html exports only stood out from
+# the noise with tens of thousands of bookmarks.
+IMPORT_SIZES = {
+    Format.DB: (200, 400, 800, 1600),
+    Format.HTML: (400, 800, 1600, 3200),
+    Format.JSON: (400, 800, 1600, 3200),
+    Format.PLACES: (400, 800, 1600, 3200),
+}
+EXPORT_SIZES = {
+    Format.DB: (200, 400, 800, 1600),
+    Format.HTML: (3200, 6400, 12800, 25600),
+    Format.JSON: (800, 1600, 3200, 6400),
+    Format.PLACES: (800, 1600, 3200, 6400),
+}
+SHAPES = {
+    # all the urls directly in the special folders.
+    "wide": GeneratorOptions(max_depth=0),
+    # folders nested 32 levels deep, most of the bookmarks are at the deepest levels.
+    "deep": GeneratorOptions(max_depth=32, folder_ratio=0.5, folder_size=10000),
+    # every url has a 1KiB icon.
+    "icons": GeneratorOptions(icon_size=1024, icon_ratio=1),
+}
+
+scaling_params = [
+    pytest.param(converter, format_, shape, id=f"{converter.__name__.lower()}-{format_}-{shape}")
+    for converter in (Bookmarkie, Chrome, Firefox)
+    for format_ in converter.formats
+    for shape in SHAPES
+]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Generate (once for the module) the bookmarks file of a converter, format, shape and size."""
+    with TemporaryDirectory() as tmpdir:
+        files = {}
+
+        def _corpus(converter, format_, shape: str, size: int) -> Path:
+            key = (converter, format_, shape, size)
+            if key not in files:
+                filepath = Path(tmpdir).joinpath(
+                    f"{converter.__name__.lower()}_{shape}_{size}.{format_}"
+                )
+                generate(converter(), format_, filepath, replace(SHAPES[shape], size=size))
+                files[key] = filepath
+            return files[key]
+
+        yield _corpus
+
+
+@pytest.fixture(scope="module")
+def trees():
+    """Generate (once for the module) the Bookmark tree of a shape and size, the exports don't
+    modify the tree so it is shared by the converters."""
+    generated = {}
+
+    def _trees(shape: str, size: int):
+        if (shape, size) not in generated:
+            generated[(shape, size)] = generate_tree(replace(SHAPES[shape], size=size))
+        return generated[(shape, size)]
+
+    return _trees
+
+
+@pytest.mark.parametrize("converter, format_, shape", scaling_params)
+def test_import_scaling(converter, format_, shape, corpus, scaling_exponent):
+    def setup(size: int) -> Path:
+        return corpus(converter, format_, shape, size)
+
+    exponent = scaling_exponent(
+        setup, lambda filepath: FORMATS[format_].load(converter(), filepath), IMPORT_SIZES[format_]
+    )
+    assert exponent < MAX_SCALING_EXPONENT
+
+
+@pytest.mark.parametrize("converter, format_, shape", scaling_params)
+def test_export_scaling(converter, format_, shape, trees, scaling_exponent):
+    outputs = itertools.count()
+
+    with TemporaryDirectory() as tmpdir:
+
+        def setup(size: int) -> tuple:
+            # a new output file for each run, the db format doesn't overwrite existing files.
+            output = Path(tmpdir).joinpath(f"output_{next(outputs)}.{format_}")
+            return trees(shape, size), output
+
+        exponent = scaling_exponent(
+            setup, lambda args: FORMATS[format_].save(converter(), *args), EXPORT_SIZES[format_]
+        )
+    assert exponent < MAX_SCALING_EXPONENT
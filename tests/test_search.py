@@ -0,0 +1,88 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import TEST_FILE_BOOKMARKIE_DB
+from resources.bookmarks_bookmarkie import bookmarks_json
+from sqlalchemy import create_engine, text
+
+from bookmarks_converter import Bookmarkie
+from bookmarks_converter.formats import save_db
+from bookmarks_converter.search import search
+
+
+@pytest.fixture(scope="module")
+def search_db():
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.db")
+        save_db(Bookmarkie().as_db(bookmarks_json()), filepath, search_index=True)
+        yield filepath
+
+
+test_search_params = (
+    pytest.param("audi", ["https://www.audi.com/en.html"], id="word"),
+    pytest.param("AUDI", ["https://www.audi.com/en.html"], id="case_insensitive"),
+    pytest.param("bm*", ["https://www.bmw.com/en/index.html"], id="prefix"),
+    pytest.param("url:yahoo", ["https://www.yahoo.com/"], id="column"),
+    pytest.param(
+        "audi OR bmw",
+        ["https://www.audi.com/en.html", "https://www.bmw.com/en/index.html"],
+        id="or",
+    ),
+    pytest.param("audi NOT international", [], id="not"),
+    pytest.param("unknownword", [], id="no_match"),
+)
+
+
+@pytest.mark.parametrize("query, urls", test_search_params)
+def test_search(search_db, query, urls):
+    results = search(search_db, query)
+
+    assert sorted(result.url for result in results) == urls
+
+
+def test_search_rank(search_db):
+    results = search(search_db, "international")
+
+    assert len(results) == 2
+    assert results[0].rank <= results[1].rank
+    assert all(result.rank < 0 for result in results)
+
+
+def test_search_limit(search_db):
+    assert len(search(search_db, "international", limit=1)) == 1
+
+
+def test_search_index_in_sync(search_db):
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.db")
+        filepath.write_bytes(search_db.read_bytes())
+        engine = create_engine(f"sqlite:///{filepath}")
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    "UPDATE bookmark SET title = 'Quattro', tags = 'cars,german' WHERE url = :url"
+                ),
+                {"url": "https://www.audi.com/en.html"},
+            )
+            connection.execute(text("DELETE FROM bookmark WHERE url = 'https://www.yahoo.com/'"))
+        engine.dispose()
+
+        (result,) = search(filepath, "quattro")
+        assert result.tags == ["cars", "german"]
+        assert [result.title for result in search(filepath, "german")] == ["Quattro"]
+        assert search(filepath, "yahoo") == []
+
+
+test_search_error_params = (
+    pytest.param(TEST_FILE_BOOKMARKIE_DB, "audi", "has no search index", id="no_index"),
+    pytest.param(None, '"audi', "Invalid search query: '\"audi'", id="invalid_query"),
+)
+
+
+@pytest.mark.parametrize("filepath, query, message", test_search_error_params)
+def test_search_error(search_db, filepath, query, message):
+    with pytest.raises(ValueError) as err_info:
+        search(filepath or search_db, query)
+
+    assert message in str(err_info.value)
@@ -0,0 +1,16 @@
+"""Startup regression test: the cli must start within the budgets of benchmarks/startup.py,
+which are relative to an interpreter only importing the dependencies of the package."""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.startup import BASELINE, best_time, over_budget, scenarios
+
+
+def test_startup_budgets():
+    with TemporaryDirectory() as tmpdir:
+        commands = scenarios(Path(tmpdir))
+        baseline = best_time(commands.pop(BASELINE))
+        errors = [over_budget(name, best_time(argv) / baseline) for name, argv in commands.items()]
+
+    assert [error for error in errors if error] == []
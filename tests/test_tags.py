@@ -0,0 +1,103 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from conftest import TEST_FILE_BOOKMARKIE_DB, tree_urls
+from resources.bookmarks_bookmarkie import bookmarks_json
+from sqlalchemy import create_engine, text
+
+from bookmarks_converter import Bookmarkie
+from bookmarks_converter.formats import Format, save_db
+from bookmarks_converter.generator import GeneratorOptions, generate
+from bookmarks_converter.models import Folder, SpecialFolder
+from bookmarks_converter.tags import count_tags, find_by_tag
+
+TAGS = (["cars", "german"], ["cars, trucks & suvs", "japanese"], ["news"])
+
+
+def _tagged_tree() -> Folder:
+    tree = bookmarks_json()
+    for url, tags in zip(tree_urls(tree), TAGS):
+        url.tags = list(tags)
+    return tree
+
+
+@pytest.fixture(scope="module")
+def tags_db():
+    with TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir).joinpath("bookmarks.db")
+        save_db(Bookmarkie().as_db(_tagged_tree()), filepath)
+        yield filepath
+
+
+class TestTagTables:
+    bookmarkie = Bookmarkie()
+
+    def test_from_db(self, tags_db):
+        tree = _tagged_tree()
+
+        assert self.bookmarkie.from_db(tags_db) == tree
+        menu = self.bookmarkie.from_db_subtree(tags_db, special_folder=SpecialFolder.MENU)
+        assert menu == tree.children[0]
+        lazy = self.bookmarkie.from_db(tags_db, lazy=True)
+        assert lazy == tree
+
+    def test_tag_rows(self, tags_db):
+        engine = create_engine(f"sqlite:///{tags_db}")
+        with engine.connect() as connection:
+            names = connection.execute(text("SELECT name FROM tag ORDER BY name")).scalars().all()
+            links = connection.execute(text("SELECT count(*) FROM bookmark_tag")).scalar()
+        engine.dispose()
+
+        assert names == ["cars", "cars, trucks & suvs", "german", "japanese", "news"]
+        assert links == sum(len(tags) for tags in TAGS)
+
+    test_find_by_tag_params = (
+        pytest.param("cars", 1, id="tag"),
+        pytest.param("cars, trucks & suvs", 1, id="tag_with_comma"),
+        pytest.param("Cars", 0, id="case_sensitive"),
+        pytest.param("unknown", 0, id="unknown_tag"),
+    )
+
+    @pytest.mark.parametrize("tag, count", test_find_by_tag_params)
+    def test_find_by_tag(self, tags_db, tag, count):
+        urls = {url.id: url for url in tree_urls(_tagged_tree())}
+
+        result = find_by_tag(tags_db, tag)
+
+        assert len(result) == count
+        for url in result:
+            assert tag in url.tags
+            assert url == urls[url.id]
+
+    def test_count_tags(self, tags_db):
+        assert count_tags(tags_db) == {
+            "cars": 1,
+            "cars, trucks & suvs": 1,
+            "german": 1,
+            "japanese": 1,
+            "news": 1,
+        }
+
+    @pytest.mark.parametrize("function", (count_tags, lambda path: find_by_tag(path, "cars")))
+    def test_without_tag_tables(self, function):
+        with pytest.raises(ValueError) as err_info:
+            function(TEST_FILE_BOOKMARKIE_DB)
+
+        assert str(err_info.value) == f"The DB '{TEST_FILE_BOOKMARKIE_DB}' has no tag tables."
+
+    def test_generated_db(self):
+        options = GeneratorOptions(size=200, max_tags=3)
+        with TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir).joinpath("bookmarks.db")
+            generate(self.bookmarkie, Format.DB, filepath, options)
+            tree = self.bookmarkie.from_db(filepath)
+
+            counts = {}
+            for url in tree_urls(tree):
+                for tag in set(url.tags):
+                    counts[tag] = counts.get(tag, 0) + 1
+            assert counts
+            assert count_tags(filepath) == dict(
+                sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+            )
@@ -0,0 +1,93 @@
+import json
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from resources.bookmarks_bookmarkie import bookmarks_json
+
+from bookmarks_converter import Bookmarkie, Chrome, Firefox
+from bookmarks_converter.formats import FORMATS, Format, save_many
+from bookmarks_converter.instrumentation import span, traced
+from bookmarks_converter.tracing import CATEGORY_SPAN, CATEGORY_STAGE, TraceRecorder
+
+
+def test_traced_without_observers():
+    @traced
+    def function(path: Path, value: int) -> int:
+        return value * 2
+
+    assert function(Path("bookmarks.html"), 2) == 4
+    assert function.__name__ == "function"
+
+
+def test_span_metadata():
+    with TraceRecorder() as trace:
+        with span("outer") as metadata:
+            metadata["key"] = "value"
+
+    (event,) = trace.events
+    assert event["name"] == "outer"
+    assert event["cat"] == CATEGORY_SPAN
+    assert event["args"] == {"key": "value"}
+    assert event["pid"] == os.getpid()
+
+
+def test_trace_recorder():
+    with TemporaryDirectory() as tmpdir:
+        input_path = Path(tmpdir).joinpath("input.html")
+        FORMATS[Format.HTML].save(Bookmarkie(), bookmarks_json(), input_path)
+        html_path = Path(tmpdir).joinpath("output.html")
+        json_path = Path(tmpdir).joinpath("output.json")
+
+        with TraceRecorder() as trace:
+            tree = FORMATS[Format.HTML].load(Bookmarkie(), input_path)
+            save_many(
+                tree,
+                [
+                    (Chrome(), FORMATS[Format.HTML], html_path),
+                    (Firefox(), FORMATS[Format.JSON], json_path),
+                ],
+            )
+        trace_path = Path(tmpdir).joinpath("trace.json")
+        trace.dump(trace_path)
+        with trace_path.open("r", encoding="utf-8") as file:
+            events = json.load(file)["traceEvents"]
+
+        spans = {event["name"]: event for event in events if event.get("cat") == CATEGORY_SPAN}
+        assert set(spans) == {
+            "Bookmarkie.from_html",
+            "Chrome.as_html",
+            "Firefox.as_json",
+            "save_html",
+            "save_json",
+        }
+        assert spans["Bookmarkie.from_html"]["args"] == {
+            "file": str(input_path),
+            "bytes": input_path.stat().st_size,
+        }
+        assert spans["save_json"]["args"] == {
+            "file": str(json_path),
+            "bytes": json_path.stat().st_size,
+        }
+        # the outputs are written on the threads of a pool.
+        assert spans["Bookmarkie.from_html"]["tid"] not in (
+            spans["save_html"]["tid"],
+            spans["save_json"]["tid"],
+        )
+
+        # the stages run inside the spans, on the same thread.
+        load = spans["Bookmarkie.from_html"]
+        stages = [
+            event
+            for event in events
+            if event.get("cat") == CATEGORY_STAGE and event["tid"] == load["tid"]
+        ]
+        assert [event["name"] for event in stages] == ["read", "format", "parse", "build"]
+        for event in stages:
+            assert load["ts"] <= event["ts"]
+            assert event["ts"] + event["dur"] <= load["ts"] + load["dur"]
+
+        thread_names = [event for event in events if event["name"] == "thread_name"]
+        assert len(thread_names) >= 2
+        counters = {event["name"] for event in events if event["ph"] == "C"}
+        assert counters == {"bytes_in", "nodes", "bytes_out"}